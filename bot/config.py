@@ -11,6 +11,44 @@ MODEL_BRAND= os.getenv("MODEL_BRAND")
 MAX_TOKENS_BRAND = int(os.getenv("MAX_TOKENS_BRAND", 400))
 TEMPERATURE_BRAND = float(os.getenv("TEMPERATURE_BRAND", "0.7"))
 
+# Маршрутизация LLM: JSON со списком эндпоинтов на задачу (names, stages, profile, random_idea), например
+# {"names": [{"base_url": "https://...", "api_key_env": "API_KEY_2", "model": "..."}]}. Пусто — BASE_URL + MODEL_NAME/MODEL_BRAND
+LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS", "")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # Таймаут одного вызова, после него — следующий эндпоинт
+LLM_MAX_FAILOVERS = int(os.getenv("LLM_MAX_FAILOVERS", 2))
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+ROUTER_ERROR_PENALTY = float(os.getenv("ROUTER_ERROR_PENALTY", "5"))  # Во сколько раз ошибки «удлиняют» задержку
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 3))  # Ошибок подряд до отключения
+CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", "60"))  # На сколько секунд отключать эндпоинт
+
+# Каскад моделей: сначала быстрая дешёвая модель, сильная — только если ответ не прошёл проверку.
+# Работает для задач, у которых задана быстрая ступень (MODEL_*_FAST или "<задача>:fast" в LLM_ENDPOINTS)
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "true").lower() == "true"
+MODEL_NAME_FAST = os.getenv("MODEL_NAME_FAST")
+MODEL_BRAND_FAST = os.getenv("MODEL_BRAND_FAST")
+
+# Хеджирование запросов к LLM: если ответа нет дольше скользящего p90, отправляем дубль
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_FALLBACK_MODEL = os.getenv("HEDGE_FALLBACK_MODEL")  # Модель для дубля, если у задачи один эндпоинт
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "8"))  # Порог, пока мало наблюдений (сек)
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", 200))  # Окно для p90 и доли хеджей
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", "0.1"))  # Не больше 10% вызовов с дублем
+
+# Для каких задач просить у AI ответ в JSON (stages, profile, names) вместо свободного текста.
+# names выключено по умолчанию: JSON расходует больше токенов, а бюджет на username маленький
+STRUCTURED_OUTPUT_TASKS = set(filter(None, os.getenv("STRUCTURED_OUTPUT_TASKS", "stages,profile").split(",")))
+
+# Передавать провайдеру response_format={"type": "json_object"} (не все OpenAI-совместимые API это поддерживают)
+JSON_RESPONSE_FORMAT = os.getenv("JSON_RESPONSE_FORMAT", "false").lower() == "true"
+
+# Этапы проекта и профиль — одним диалогом (история сообщений с общим префиксом) вместо отдельных запросов
+CONVERSATION_MODE = os.getenv("CONVERSATION_MODE", "true").lower() == "true"
+
+# Для каких задач получать ответ потоком (stream) — нужно для замера времени до первого токена (TTFT в логе).
+# Если API не принимает stream_options, поток запрашивается без них (без учёта токенов)
+STREAM_TASKS = set(filter(None, os.getenv("STREAM_TASKS", "stages,profile").split(",")))
+
 # Максимальное количество символов в контексте
 MAX_CONTEXT_LENGTH = 200
 
@@ -20,18 +58,127 @@ AVAILABLE_USERNAME_COUNT = 3
 # Количество username, запрашиваемых у OpenAI за один раз
 GENERATED_USERNAME_COUNT = int(os.getenv("GENERATED_USERNAME_COUNT"))
 
+# Адаптивный размер пакета: n и max_tokens подбираются по статистике свободных имён для категории/стиля
+ADAPTIVE_BATCH = os.getenv("ADAPTIVE_BATCH", "true").lower() == "true"
+GEN_BATCH_MIN = int(os.getenv("GEN_BATCH_MIN", 5))
+GEN_BATCH_MAX = int(os.getenv("GEN_BATCH_MAX", 25))
+GEN_MAX_TOKENS_CAP = int(os.getenv("GEN_MAX_TOKENS_CAP", 200))
+
 # Максимальное количество итераций (попыток) генерации username
 GEN_ATTEMPTS = int(os.getenv("GEN_ATTEMPTS"))
 
+# Сколько попыток генерации username запускать параллельно (1 — последовательно, как раньше)
+GEN_FANOUT = int(os.getenv("GEN_FANOUT", 1))
+
+# Общий лимит одновременных вызовов AI для username на весь бот
+GEN_FANOUT_GLOBAL_LIMIT = int(os.getenv("GEN_FANOUT_GLOBAL_LIMIT", 8))
+
+# Параллельные попытки различаются температурой: +шаг на каждую следующую, но не выше максимума
+FANOUT_TEMPERATURE_STEP = float(os.getenv("FANOUT_TEMPERATURE_STEP", "0.15"))
+FANOUT_MAX_TEMPERATURE = float(os.getenv("FANOUT_MAX_TEMPERATURE", "1.1"))
+
 # Максимальное общее время ожидания генерации (в секундах)
 GEN_TIMEOUT = int(os.getenv("GEN_TIMEOUT"))  # Преобразуем в число
 
+# Сколько локальных кандидатов (без LLM) проверять после каждой попытки, если свободных не хватило. 0 — выключено
+LOCAL_CANDIDATES_PER_ROUND = int(os.getenv("LOCAL_CANDIDATES_PER_ROUND", 10))
+
+# Сколько мутаций занятых имён AI (suffix/множественное число/без гласных) проверять в той же попытке. 0 — выключено
+MUTATIONS_PER_ATTEMPT = int(os.getenv("MUTATIONS_PER_ATTEMPT", 10))
+
+# По сколько кандидатов проверять на Fragment за раз, когда обучена модель доступности
+# (лучшие по модели — первыми, с ранним выходом). 0 — все кандидаты одним пакетом
+CHECK_CHUNK_SIZE = int(os.getenv("CHECK_CHUNK_SIZE", 6))
+
+# Кандидаты на таком расстоянии Левенштейна (после нормализации) считаются дубликатами. 0 — только точная нормализация
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", 1))
+
+# Кеш похожих идей: сколько свободных ранее имён из похожих тем перепроверять до вызова AI. 0 — выключено
+CONTEXT_CACHE_CANDIDATES = int(os.getenv("CONTEXT_CACHE_CANDIDATES", 10))
+
+# Порог сходства тем (Жаккар по символьным 3-граммам нормализованных слов) и глубина истории в днях
+CONTEXT_SIMILARITY = float(os.getenv("CONTEXT_SIMILARITY", "0.6"))
+CONTEXT_CACHE_DAYS = int(os.getenv("CONTEXT_CACHE_DAYS", 30))
+
+# Максимум тем в кеше похожих идей: при переполнении вытесняются темы, давно не получавшие новых имён
+CONTEXT_CACHE_MAX_TOPICS = int(os.getenv("CONTEXT_CACHE_MAX_TOPICS", 5000))
+
+# История свободных имён по категории/стилю: сколько перепроверять до следующего вызова AI (0 — выключено),
+# глубина истории в днях и максимум имён в одной группе
+HISTORY_CANDIDATES = int(os.getenv("HISTORY_CANDIDATES", 10))
+HISTORY_DAYS = int(os.getenv("HISTORY_DAYS", 14))
+HISTORY_POOL_SIZE = int(os.getenv("HISTORY_POOL_SIZE", 200))
+
+# Сколько секунд результат проверки username на Fragment считается свежим (повторно не проверяем)
+AVAILABILITY_CACHE_TTL = int(os.getenv("AVAILABILITY_CACHE_TTL", 600))
+
 # Прерывание после нескольких пустых ответов
 MAX_EMPTY_RESPONSES = 3
 
 # Параметр для интервала между запросами (например, 1 секунда) -- способ избежать flood control exceeded
 REQUEST_INTERVAL = 0.3
 
+# Сколько лишних свободных username держать в буфере сессии для кнопки «Еще 3 варианта»
+USERNAME_BUFFER_SIZE = int(os.getenv("USERNAME_BUFFER_SIZE", 6))
+
+# Сколько вариантов показывать на каждом этапе проекта
+STAGE_OPTIONS_COUNT = 3
+
+# Сколько вариантов этапа запрашивать у AI за один вызов (лишние уходят в буфер сессии)
+STAGE_OPTIONS_OVERGEN = int(os.getenv("STAGE_OPTIONS_OVERGEN", 6))
+
+# Лимит токенов ответа этапа растёт с числом вариантов: столько токенов на вариант (не меньше MAX_TOKENS_BRAND)
+MAX_TOKENS_PER_STAGE_OPTION = int(os.getenv("MAX_TOKENS_PER_STAGE_OPTION", 100))
+
+# Буфер дозаполняется в фоне, когда в нём остаётся меньше этого количества элементов
+BUFFER_REFILL_THRESHOLD = int(os.getenv("BUFFER_REFILL_THRESHOLD", 3))
+
+# Сколько готовых профилей проектов держать в памяти (LRU) для ссылок, пересылки и «Мои проекты»
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 256))
+
+# Сколько последних проектов показывать в «Мои проекты»
+MY_PROJECTS_LIMIT = int(os.getenv("MY_PROJECTS_LIMIT", 10))
+
+# Папка для постоянных данных (в Amvera смонтирована как /data, локально — ./data)
+DATA_DIR = os.getenv("DATA_DIR", "/data" if os.path.isdir("/data") else "data")
+
+# Сколько готовых случайных идей (идея + свободные username) держать в фоне
+IDEA_POOL_SIZE = int(os.getenv("IDEA_POOL_SIZE", 5))
+
+# Пауза перед повторной попыткой, если фоновая генерация идеи не удалась (в секундах)
+IDEA_POOL_RETRY_DELAY = int(os.getenv("IDEA_POOL_RETRY_DELAY", 30))
+
+# Bloom-фильтр заведомо занятых username (чтобы не тратить запросы к Fragment)
+TAKEN_FILTER_CAPACITY = int(os.getenv("TAKEN_FILTER_CAPACITY", 200000))
+TAKEN_FILTER_ERROR_RATE = float(os.getenv("TAKEN_FILTER_ERROR_RATE", "0.01"))
+# Сколько дней фильтр помнит занятые username: имя могли освободить или продать, потом его снова проверяют
+TAKEN_FILTER_DAYS = int(os.getenv("TAKEN_FILTER_DAYS", 14))
+
+# Токен для /metrics (?token=... или заголовок Authorization: Bearer ...). Пусто — метрики открыты
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Трассировка запросов (services/tracing): доля сохраняемых обычных трасс, порог медленной трассы
+# (медленные и с ошибками сохраняются всегда) и лимит спанов в одной трассе
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", 10))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 500))
+
+# Куда выгружать трассы: POST на коллектор (OTLP/JSON, например http://collector:4318/v1/traces)
+# или, если адрес не задан, строками в файл в DATA_DIR (с ротацией по размеру в МБ)
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_FILE_MAX_MB = int(os.getenv("TRACE_FILE_MAX_MB", 50))
+
+# Сколько секунд при остановке ждать завершения начатой работы (обработка обновлений, фоновые задачи)
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", 25))
+
+# Как часто сохранять снимок кешей, пулов и сессий в DATA_DIR (в секундах). 0 — только при остановке
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", 300))
+
+## генерация случайной идеи (3-6 слов)
+RANDOM_IDEA_PROMPT = "Придумай уникальную и креативную идею для проекта. Идея должна состоять из 3-6 слов и быть максимально непохожей на предыдущие идеи. "
+
 
 
 ## генерация username
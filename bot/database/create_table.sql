@@ -8,3 +8,16 @@ CREATE TABLE IF NOT EXISTS generated_usernames (
     llm TEXT NOT NULL, -- используемая LLM
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP -- время генерации.
 );
+
+CREATE TABLE IF NOT EXISTS project_profiles (
+    id VARCHAR(16) PRIMARY KEY, -- короткий ID профиля для ссылок (/start p_<id>)
+    user_id BIGINT NOT NULL, -- автор проекта (Telegram user id)
+    username VARCHAR(32) NOT NULL, -- выбранное имя проекта
+    context TEXT, -- исходная идея пользователя
+    profile_text TEXT NOT NULL, -- готовый HTML-текст профиля
+    profile JSONB NOT NULL, -- составные части: тэглайн, описание, этапы, похожие проекты
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS project_profiles_user_idx ON project_profiles (user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS project_profiles_username_idx ON project_profiles (lower(username));
@@ -1,8 +1,12 @@
+import asyncio
 import asyncpg
+import json
 import os
 import logging
 from dotenv import load_dotenv
 
+from services import metrics, tracing
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -26,10 +30,20 @@ logging.info(f"    PASSWORD = {'✅' if DB_CONFIG['password'] else '❌ НЕ Н
 
 # Глобальный пул соединений
 pool = None
+_pool_lock = asyncio.Lock()
 
 
 async def init_db_pool():
-    """Создаёт пул соединений к БД при запуске приложения."""
+    """Создаёт пул соединений к БД при запуске приложения. Повторный вызов ничего не делает."""
+    global pool
+    if pool is not None:
+        return
+    async with _pool_lock:
+        if pool is None:
+            await _create_pool()
+
+
+async def _create_pool():
     global pool
     try:
         logging.info(f"📡 Подключение к {'локальной' if IS_LOCAL else 'облачной'} БД: {DB_CONFIG['host']}")
@@ -49,6 +63,16 @@ async def init_db_pool():
         pool = None
 
 
+def _collect_metrics():
+    if pool is not None:
+        idle = pool.get_idle_size()
+        yield "db_pool_connections", {"state": "idle"}, idle
+        yield "db_pool_connections", {"state": "busy"}, pool.get_size() - idle
+
+
+metrics.register_collector(_collect_metrics)
+
+
 async def get_connection():
     """Получает соединение из пула. Если пула нет — создаёт."""
     global pool
@@ -68,12 +92,12 @@ async def close_db_pool():
     global pool
     if pool:
         await pool.close()
+        pool = None
         logging.info("✅ Пул соединений закрыт.")
 
 
 async def init_db():
     """Создаёт таблицу, если её нет."""
-    await init_db_pool()  # Гарантируем, что пул создан
     conn = await get_connection()
     if conn is None:
         logging.error("❌ Невозможно выполнить init_db — соединение не получено.")
@@ -87,7 +111,7 @@ async def init_db():
                 create_table = file.read()
 
             await conn.execute(create_table)
-            logging.info("✅ Таблица 'generated_usernames' проверена/создана.")
+            logging.info("✅ Таблицы 'generated_usernames' и 'project_profiles' проверены/созданы.")
         else:
             logging.error(f"❌ Файл {CREATE_TABLE_SQL_PATH} не найден! Таблица не будет создана.")
     except Exception as e:
@@ -96,6 +120,7 @@ async def init_db():
         await pool.release(conn)
 
 
+@tracing.traced("db.save_username", "username", "status")
 async def save_username_to_db(username: str, status: str, context: str, category: str, style: str = "None",
                               llm: str = "None"):
     """Сохраняет username в базу данных."""
@@ -115,9 +140,155 @@ async def save_username_to_db(username: str, status: str, context: str, category
         INSERT_SQL = file.read()
 
     try:
-        await conn.execute(INSERT_SQL, username, status, category, context, style, llm)
+        with metrics.timer("db_write_seconds", operation="save_username"):
+            await conn.execute(INSERT_SQL, username, status, category, context, style, llm)
         logging.info(f"✅ Добавлен в БД: @{username} | {status} | {category} | {context} | {style} | {llm}")
     except Exception as e:
+        metrics.inc("errors_total", component="db")
         logging.error(f"❌ Ошибка при сохранении в БД: {e}")
     finally:
         await pool.release(conn)
+
+
+async def fetch_usernames_by_status(statuses: list[str], days: int | None = None) -> list[str]:
+    """Возвращает username из истории генераций с одним из указанных статусов (за `days` дней, если задано)."""
+    conn = await get_connection()
+    if conn is None:
+        logging.error("❌ Невозможно выполнить fetch_usernames_by_status — соединение не получено.")
+        return []
+
+    try:
+        if days is None:
+            rows = await conn.fetch(
+                "SELECT username FROM generated_usernames WHERE status = ANY($1::text[])",
+                statuses
+            )
+        else:
+            rows = await conn.fetch(
+                "SELECT username FROM generated_usernames "
+                "WHERE status = ANY($1::text[]) AND created_at > NOW() - make_interval(days => $2)",
+                statuses, days
+            )
+        return [row["username"] for row in rows]
+    except Exception as e:
+        logging.error(f"❌ Ошибка при чтении username из БД: {e}")
+        return []
+    finally:
+        await pool.release(conn)
+
+
+async def fetch_username_statuses() -> list[tuple[str, str]]:
+    """Возвращает историю проверок (username, статус) — размеченные данные для модели доступности."""
+    conn = await get_connection()
+    if conn is None:
+        logging.error("❌ Невозможно выполнить fetch_username_statuses — соединение не получено.")
+        return []
+
+    try:
+        rows = await conn.fetch("SELECT username, status FROM generated_usernames")
+        return [(row["username"], row["status"]) for row in rows]
+    except Exception as e:
+        logging.error(f"❌ Ошибка при чтении истории username из БД: {e}")
+        return []
+    finally:
+        await pool.release(conn)
+
+
+async def fetch_free_usernames(days: int) -> list[dict]:
+    """Свободные на момент проверки username за последние `days` дней: username, context, category, style, created_at."""
+    conn = await get_connection()
+    if conn is None:
+        logging.error("❌ Невозможно выполнить fetch_free_usernames — соединение не получено.")
+        return []
+
+    try:
+        rows = await conn.fetch(
+            "SELECT username, context, category, style, created_at FROM generated_usernames "
+            "WHERE status = 'Свободно' AND created_at > NOW() - make_interval(days => $1) "
+            "ORDER BY created_at DESC",
+            days
+        )
+        return [dict(row) for row in rows]
+    except Exception as e:
+        logging.error(f"❌ Ошибка при чтении свободных username из БД: {e}")
+        return []
+    finally:
+        await pool.release(conn)
+
+
+@tracing.traced("db.save_profile", "profile_id")
+async def save_project_profile(profile_id: str, user_id: int, username: str, context: str | None,
+                               profile_text: str, profile: dict) -> bool:
+    """Сохраняет готовый профиль проекта. Возвращает True при успехе."""
+    conn = await get_connection()
+    if conn is None:
+        logging.error("❌ Невозможно выполнить save_project_profile — соединение не получено.")
+        return False
+
+    try:
+        with metrics.timer("db_write_seconds", operation="save_profile"):
+            await conn.execute(
+                """
+                INSERT INTO project_profiles (id, user_id, username, context, profile_text, profile)
+                VALUES ($1, $2, $3, $4, $5, $6::jsonb)
+                ON CONFLICT (id) DO NOTHING
+                """,
+                profile_id, user_id, username, context, profile_text, json.dumps(profile, ensure_ascii=False)
+            )
+        logging.info(f"✅ Профиль проекта сохранён: {profile_id} | @{username} | user {user_id}")
+        return True
+    except Exception as e:
+        metrics.inc("errors_total", component="db")
+        logging.error(f"❌ Ошибка при сохранении профиля проекта: {e}")
+        return False
+    finally:
+        await pool.release(conn)
+
+
+def _profile_from_row(row) -> dict:
+    profile = dict(row)
+    if isinstance(profile.get("profile"), str):
+        profile["profile"] = json.loads(profile["profile"])
+    return profile
+
+
+async def fetch_project_profile(profile_id: str) -> dict | None:
+    """Возвращает профиль проекта по короткому ID или None."""
+    conn = await get_connection()
+    if conn is None:
+        logging.error("❌ Невозможно выполнить fetch_project_profile — соединение не получено.")
+        return None
+
+    try:
+        row = await conn.fetchrow(
+            "SELECT id, user_id, username, context, profile_text, profile, created_at "
+            "FROM project_profiles WHERE id = $1",
+            profile_id
+        )
+        return _profile_from_row(row) if row else None
+    except Exception as e:
+        logging.error(f"❌ Ошибка при чтении профиля проекта: {e}")
+        return None
+    finally:
+        await pool.release(conn)
+
+
+async def fetch_user_profiles(user_id: int, limit: int) -> list[dict]:
+    """Последние проекты пользователя (без текста профиля): id, username, created_at."""
+    conn = await get_connection()
+    if conn is None:
+        logging.error("❌ Невозможно выполнить fetch_user_profiles — соединение не получено.")
+        return []
+
+    try:
+        rows = await conn.fetch(
+            "SELECT id, username, created_at FROM project_profiles "
+            "WHERE user_id = $1 ORDER BY created_at DESC LIMIT $2",
+            user_id, limit
+        )
+        return [dict(row) for row in rows]
+    except Exception as e:
+        logging.error(f"❌ Ошибка при чтении проектов пользователя: {e}")
+        return []
+    finally:
+        await pool.release(conn)
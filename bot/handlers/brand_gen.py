@@ -1,4 +1,8 @@
+import asyncio
+import hashlib
+import json
 import logging
+import time
 
 from aiogram import Router, types
 from aiogram.fsm.context import FSMContext
@@ -6,7 +10,12 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from bot.handlers.states import BrandCreationStates
 from bot.handlers.main_menu import show_main_menu
-from bot.services.brand_ask_ai import get_parsed_response
+from bot.handlers.keyboards.project_profile import project_profile_kb
+from bot.handlers.projects import profile_link
+from services import conversation, metrics, profile_store, prompt_registry, session_buffer, tracing
+from services.conversation import choice_text
+
+import config
 
 brand_router = Router()
 
@@ -116,41 +125,144 @@ async def stage1_problem(event: types.Message | types.CallbackQuery, state: FSMC
     # Отправляем сообщение пользователю перед генерацией
     await send_message("⏳ Переходим к определению проблемного поля проекта..")
 
-    prompt = f"""
-    Исходный контекст: {context}, выбрано название {username}.
-    Проанализируй название и контекст с точки зрения смысловых ассоциаций и потенциального позиционирования.
-    Каким 3 различным вариантам проблемы или потребностей может быть адресован такой проект?
+    parsed_response = await request_stage_options(1, state)
+
+    if not parsed_response["options"]:
+        await send_message("❌ Ошибка при генерации форматов. Попробуйте снова.")
+        return
+
+    await show_stage_options(send_message, state, 1, parsed_response["answer"], parsed_response["options"])
+
+
+def numbered_options(template: str, n: int) -> str:
+    """Строки формата ответа «1. ...», «2. ...» для запроса `n` вариантов."""
+    return "\n".join(f"{i}. {template.format(i=i)}" for i in range(1, n + 1))
+
+
+# Формат одного варианта в ответе AI для каждого этапа (шаблоны промптов — bot/prompts/stage*.txt)
+STAGE_OPTION_FORMATS = {
+    1: "**[эмодзи]** [Проблема/Потребность {i}]: [Описание]",
+    2: "[эмодзи] [Название аудитории {i}]: [Описание, почему именно эта аудитория заинтересована и какие выгоды она получит (1-2 предложения)]",
+    3: "[эмодзи] [Краткое определение]: [1-2 предложения, поясняющие формат]",
+}
+
+
+def stage_prompt(stage: int, data: dict, n: int) -> str:
+    return prompt_registry.render(
+        f"stage{stage}",
+        n=n,
+        context=data.get("context"),
+        username=data.get("username"),
+        stage1_choice=data.get("stage1_choice"),
+        stage2_choice=data.get("stage2_choice"),
+        options=numbered_options(STAGE_OPTION_FORMATS[stage], n),
+    )
+
+
+def stage1_prompt(data: dict, n: int) -> str:
+    return stage_prompt(1, data, n)
 
-    Ответ выведи строго по формату:
-    Комментарий: [краткий комментарий к выбору {username} и подводящий вопрос. 1-2 предложения.]
 
-    1. **[эмодзи]** [Проблема/Потребность 1]: [Описание]
-    2. **[эмодзи]** [Проблема/Потребность 2]: [Описание]
-    3. **[эмодзи]** [Проблема/Потребность 3]: [Описание]
+def stage2_prompt(data: dict, n: int) -> str:
+    return stage_prompt(2, data, n)
+
+
+def stage3_prompt(data: dict, n: int) -> str:
+    return stage_prompt(3, data, n)
+
+
+STAGE_PROMPTS = {1: stage1_prompt, 2: stage2_prompt, 3: stage3_prompt}
+
+
+def stage_request(stage: int, data: dict, n: int) -> tuple[str, list[dict] | None]:
     """
+    Запрос этапа и история диалога. Этап 1 — самостоятельный запрос,
+    этапы 2-3 — краткая история выборов и короткое продолжение диалога, если выборы есть.
+    """
+    history = conversation.history(data, stage) if config.CONVERSATION_MODE and stage > 1 else None
+    if history is None:
+        return STAGE_PROMPTS[stage](data, n), None
 
-    parsed_response = get_parsed_response(prompt)
+    prompt = prompt_registry.render(
+        f"stage{stage}_turn",
+        n=n,
+        stage1_choice=choice_text(data.get("stage1_choice")),
+        stage2_choice=choice_text(data.get("stage2_choice")),
+        options=numbered_options(STAGE_OPTION_FORMATS[stage], n),
+    )
+    return prompt, history
 
-    if not parsed_response["options"]:
-        await send_message("❌ Ошибка при генерации форматов. Попробуйте снова.")
-        return
 
-    await state.update_data(stage1_options=parsed_response["options"])
+@tracing.traced("brand.stage", "stage")
+async def request_stage_options(stage: int, state: FSMContext) -> dict:
+    """Генерация вариантов этапа (продолжением диалога проекта, если он есть)."""
+    from services.brand_ask_ai import get_parsed_response  # Клиент LLM загружается при первой генерации
+
+    data = await state.get_data()
+    prompt, history = stage_request(stage, data, config.STAGE_OPTIONS_OVERGEN)
+    logging.info(f"💬 Этап {stage}: запрос {len(prompt)} символов"
+                 f"{f', продолжение диалога из {len(history)} сообщений' if history else ', самостоятельный'}")
+    with metrics.timer("brand_stage_seconds", stage=stage):
+        return await get_parsed_response(prompt, history=history, options_count=config.STAGE_OPTIONS_OVERGEN)
+
+STAGE_TITLES = {
+    1: "<b>Этап 1: суть.</b>\n",
+    2: "<b>Этап 2: для кого?</b>\n",
+    3: "<b>Этап 3: формат</b>\n",
+}
+
+STAGE_STATES = {
+    1: BrandCreationStates.waiting_for_stage1,
+    2: BrandCreationStates.waiting_for_stage2,
+    3: BrandCreationStates.waiting_for_stage3,
+}
 
-    # После получения parsed_response
-    stage_text = "<b>Этап 1: суть.</b>\n"
-    final_answer = stage_text + parsed_response["answer"]
+
+def stage_scope(stage: int, data: dict) -> str:
+    """Ключ буфера вариантов этапа: зависит от контекста, имени и выборов на предыдущих этапах."""
+    inputs = [stage, data.get("context"), data.get("username")]
+    inputs += [data.get(f"stage{i}_choice") for i in range(1, stage)]
+    digest = hashlib.md5(json.dumps(inputs, ensure_ascii=False, default=str).encode()).hexdigest()[:12]
+    return f"stage{stage}:{digest}"
+
+
+async def show_stage_options(send_message, state: FSMContext, stage: int, answer: str, options: list[dict]):
+    """
+    Показывает первые варианты этапа, а лишние (запрошенные в том же вызове AI) кладёт в буфер сессии.
+    """
+    shown = options[:config.STAGE_OPTIONS_COUNT]
+    await render_stage(send_message, state, stage, answer, shown)
+
+    data = await state.get_data()
+    await session_buffer.set_buffer(state, f"stage{stage}_buffer", options[config.STAGE_OPTIONS_COUNT:],
+                                    stage_scope(stage, data))
+
+
+async def render_stage(send_message, state: FSMContext, stage: int, answer: str, options: list[dict]):
+    """Отправляет сообщение этапа с вариантами и переводит FSM в ожидание выбора."""
+    await state.update_data({f"stage{stage}_options": options, f"stage{stage}_answer": answer})
 
     msg_text, kb = await generate_message_and_keyboard(
-        answer=final_answer,
-        options=parsed_response["options"],
-        prefix="choose_stage1"
+        answer=STAGE_TITLES[stage] + answer,
+        options=options,
+        prefix=f"choose_stage{stage}"
     )
 
     kb.inline_keyboard.append([InlineKeyboardButton(text="🏠 В меню", callback_data="start")])
 
     await send_message(msg_text, reply_markup=kb, parse_mode="HTML")
-    await state.set_state(BrandCreationStates.waiting_for_stage1)
+    await state.set_state(STAGE_STATES[stage])
+
+
+@tracing.traced("brand.stage_buffer", "stage")
+async def produce_stage_options(stage: int, data: dict) -> list[dict]:
+    """Фоновая генерация дополнительных вариантов этапа для буфера сессии."""
+    from services.brand_ask_ai import get_parsed_response
+    prompt, history = stage_request(stage, data, config.STAGE_OPTIONS_OVERGEN)
+    with metrics.timer("brand_stage_seconds", stage=f"{stage}_buffer"):
+        parsed_response = await get_parsed_response(prompt, history=history, options_count=config.STAGE_OPTIONS_OVERGEN)
+    # Заглушку парсера «Ошибка» в буфер не кладём
+    return [opt for opt in parsed_response["options"] if opt["short"] != "Ошибка"]
 
 
 @brand_router.callback_query(lambda c: c.data.startswith("choose_stage1:"))
@@ -201,39 +313,13 @@ async def stage2_audience(event: types.Message | types.CallbackQuery, state: FSM
     await send_message("⏳ Переходим к определению целевой аудитории ...")
 
     # Формируем промпт с учётом введённого пользователем текста
-    prompt = f"""
-    Пользователь изначально указал: {context}.
-    Пользователь выбрал название {username} и указал на проблему/потребность {stage1_choice}.
-    Исходя из выявленной проблемы, с учетом контекста и выбранного названия предложи 3 варианта целевой аудитории, которая получит наибольшую выгоду от решения.
-
-    Ответ выведи строго по формату:
-    Комментарий: [краткий комментарий к выбору {stage1_choice} (отметь выбор в тексте) и краткий вопрос-подводка к вариантам. 1-2 предложения]
-1. [эмодзи] [Название аудитории 1]: [Описание, почему именно эта аудитория заинтересована и какие выгоды она получит (1-2 предложения)]
-2. [эмодзи] [Название аудитории 2]: [Описание, почему именно эта аудитория заинтересована и какие выгоды она получит (1-2 предложения)]
-3. [эмодзи] [Название аудитории 3]: [Описание, почему именно эта аудитория заинтересована и какие выгоды она получит (1-2 предложения)]
-    """
-
-    parsed_response = get_parsed_response(prompt)
+    parsed_response = await request_stage_options(2, state)
 
     if not parsed_response["options"]:
         await send_message("❌ Ошибка при генерации аудитории. Попробуйте снова.")
         return
 
-    await state.update_data(stage2_options=parsed_response["options"])
-
-    stage_text = "<b>Этап 2: для кого?</b>\n"
-    final_answer = stage_text + parsed_response["answer"]
-
-    msg_text, kb = await generate_message_and_keyboard(
-        answer=final_answer,
-        options=parsed_response["options"],
-        prefix="choose_stage2"
-    )
-
-    kb.inline_keyboard.append([InlineKeyboardButton(text="🏠 В меню", callback_data="start")])
-
-    await send_message(msg_text, reply_markup=kb, parse_mode="HTML")
-    await state.set_state(BrandCreationStates.waiting_for_stage2)
+    await show_stage_options(send_message, state, 2, parsed_response["answer"], parsed_response["options"])
 
 # 📍 Обработка выбора аудитории
 @brand_router.callback_query(lambda c: c.data.startswith("choose_stage2:"))
@@ -291,39 +377,13 @@ async def stage3_shape(event: types.Message | types.CallbackQuery, state: FSMCon
     # Отправляем сообщение пользователю перед генерацией
     await send_message("⏳ Переходим к самому интересному - в каком формате это будет...")
 
-    prompt = f"""
-    Исходный контекст: {context}, выбрано имя "{username}".
-    Проблема/потребность "{stage1_choice}" и целевая аудитория "{stage2_choice}" (результаты предыдущих этапов).
-    С учетом всего этого, какой конкретно можно реализовать проект, чтобы эффективно решать указанную проблему и приносить качественную ценность для аудитории?
-
-    Ответ выведи строго по формату:
-    Комментарий: [краткий комментарий к выбору {stage2_choice} (отметь выбор в тексте) и краткий вопрос-подводка к вариантам. 1-2 предложения]
-    1. [эмодзи] [Краткое определение]: [1-2 предложения, поясняющие формат]
-    2. [эмодзи] [Краткое определение]: [1-2 предложения, поясняющие формат]
-    3. [эмодзи] [Краткое определение]: [1-2 предложения, поясняющие формат]
-    """
-
-    parsed_response = get_parsed_response(prompt)
+    parsed_response = await request_stage_options(3, state)
 
     if not parsed_response["options"]:
         await send_message("❌ Ошибка при генерации сути проекта. Попробуйте снова.")
         return
 
-    await state.update_data(stage3_options=parsed_response["options"])
-
-    # После получения parsed_response
-    stage_text = "<b>Этап 3: формат</b>\n"
-    final_answer = stage_text + parsed_response["answer"]
-
-    msg_text, kb = await generate_message_and_keyboard(
-        answer=final_answer,
-        options=parsed_response["options"],
-        prefix="choose_stage3"
-    )
-
-    kb.inline_keyboard.append([InlineKeyboardButton(text="🏠 В меню", callback_data="start")])
-    await send_message(msg_text, reply_markup=kb, parse_mode="HTML")
-    await state.set_state(BrandCreationStates.waiting_for_stage3)
+    await show_stage_options(send_message, state, 3, parsed_response["answer"], parsed_response["options"])
 # 📍 Обработка выбора Этапа 3
 @brand_router.callback_query(lambda c: c.data.startswith("choose_stage3:"))
 async def process_stage3_choice(query: types.CallbackQuery, state: FSMContext):
@@ -380,6 +440,58 @@ async def show_final_profile(event: types.Message | types.CallbackQuery, state:
     await send_message(msg_text, reply_markup=keyboard, parse_mode="HTML")
     await state.set_state(BrandCreationStates.project_ready)
 
+# Части профиля, генерируемые параллельно (шаблоны bot/prompts/<часть>.txt и <часть>_turn.txt)
+PROFILE_PARTS = ("profile_summary", "profile_references")
+
+
+def profile_part_result(task: asyncio.Task) -> dict | None:
+    """Результат части профиля; None — если запрос упал."""
+    if task.exception():
+        logging.error(f"❌ Ошибка генерации части профиля: {task.exception()}")
+        return None
+    return task.result()
+
+
+def render_profile(concept: dict, parts: dict) -> str:
+    """Текст профиля. Части, которых ещё нет в `parts`, показываются как «⏳ ...»."""
+    if "profile_summary" in parts:
+        summary = parts["profile_summary"] or {}
+        tagline = summary.get("answer") or "Не удалось сгенерировать тэглайн"
+        description = summary.get("description") or "Не удалось сгенерировать описание"
+    else:
+        tagline, description = "⏳ ...", "⏳ Формулирую описание..."
+
+    profile_text = f"""
+📝 <b>Профиль проекта</b>
+
+<b>{concept['username']}</b>  
+<strong>{tagline}</strong>
+
+<b>Описание проекта:</b>
+{description}
+
+<b>Концепция проекта:</b>
+🔹 <b>Проблема:</b> {concept['stage1_choice']}  
+🔹 <b>Аудитория:</b> {concept['stage2_choice']}  
+🔹 <b>Формат:</b> {concept['stage3_choice']}  
+
+<b>Похожие проекты:</b>
+"""
+
+    if "profile_references" not in parts:
+        profile_text += "⏳ Ищу похожие проекты...\n"
+    else:
+        references = [ref for ref in (parts["profile_references"] or {}).get("options", []) if ref["short"] != "Ошибка"]
+        if references:
+            for ref in references:
+                profile_text += f"🔹 {ref['full']}\n"
+        else:
+            profile_text += "❌ Нет найденных похожих проектов.\n"
+
+    profile_text += f"\n<i>{concept['context']}</i>"
+    return profile_text
+
+
 @brand_router.callback_query(lambda c: c.data == "get_project")
 async def send_project_profile(event: types.Message | types.CallbackQuery, state: FSMContext):
     """
@@ -413,69 +525,58 @@ async def send_project_profile(event: types.Message | types.CallbackQuery, state
     await send_message("⏳ Собираю всё вместе...")
 
 
-    # Генерируем тэглайн и примеры существующих проектов
-    prompt = f"""
-    Пользователь создал концепцию проекта:
-    - Мысль: {context}
-    - Название: {username}
-    - Проблема: {stage1_choice}
-    - Аудитория: {stage2_choice}
-    - Формат: {stage3_choice}
-
-    Сформулируй:
-    2. **Краткое описание проекта** – 2-3 предложения, объясняющие суть проекта.
-    3. **3 реально существующих проекта** в этой сфере, с кратким описанием каждого.
-
-    Учитывай изначальную мысль пользователя.
-    Сформулируй и выведи в формате:
-    Тэглайн: [короткое, яркое описание сути проекта одно предложение]
-    Описание: [краткое, чёткое описание проекта, в 1-2 предложения] 
-    Примеры похожих проектов:
-    1. **[Название проекта]** – [1 предложение о сути и цели проекта]
-    2. **[Название проекта]** – [1 предложение о сути и цели проекта]
-    3. **[Название проекта]** – [1 предложение о сути и цели проекта]
-    """
-
-    parsed_response = get_parsed_response(prompt)
-    tagline = parsed_response.get("answer", "Не удалось сгенерировать тэглайн")
-    description = parsed_response.get("description", "Не удалось сгенерировать описание")
-    references = parsed_response.get("options", [])
-
-    # Формируем текст сообщения
-    profile_text = f"""
-📝 <b>Профиль проекта</b>
-
-<b>{username}</b>  
-<strong>{tagline}</strong>
-
-<b>Описание проекта:</b>
-{description}
-
-<b>Концепция проекта:</b>
-🔹 <b>Проблема:</b> {stage1_choice}  
-🔹 <b>Аудитория:</b> {stage2_choice}  
-🔹 <b>Формат:</b> {stage3_choice}  
-
-<b>Похожие проекты:</b>
-"""
-
-    if references:
-        for ref in references:
-            profile_text += f"🔹 {ref['full']}\n"
-    else:
-        profile_text += "❌ Нет найденных похожих проектов.\n"
-
-    profile_text += f"\n<i>{context}</i>"
-
-    # **Создаём инлайн-клавиатуру**
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔄 Вернуться в меню", callback_data="start")],
-        [InlineKeyboardButton(text="📢 Поделиться проектом", callback_data="forward_project")],
-        [InlineKeyboardButton(text="⭐ Оставить отзыв", callback_data="leave_feedback")]
-    ])
+    from services.brand_ask_ai import get_parsed_response
+
+    # Тэглайн с описанием и похожие проекты — два независимых запроса, идут одновременно
+    # (продолжением диалога этапов, если он есть)
+    profile_started = time.perf_counter()
+    history = conversation.history(data, conversation.PROFILE_TURN) if config.CONVERSATION_MODE else None
+    requests = {}
+    for part in PROFILE_PARTS:
+        if history is not None:
+            prompt = prompt_registry.render(f"{part}_turn", stage3_choice=choice_text(data.get("stage3_choice")))
+        else:
+            prompt = prompt_registry.render(
+                part,
+                context=context,
+                username=username,
+                stage1_choice=stage1_choice,
+                stage2_choice=stage2_choice,
+                stage3_choice=stage3_choice,
+            )
+        requests[part] = asyncio.create_task(get_parsed_response(prompt, task="profile", history=history, schema=part))
+
+    concept = {"username": username, "context": context,
+               "stage1_choice": stage1_choice, "stage2_choice": stage2_choice, "stage3_choice": stage3_choice}
+
+    # Как только готова одна часть — показываем профиль с заглушкой, затем дописываем его
+    done, pending = await asyncio.wait(requests.values(), return_when=asyncio.FIRST_COMPLETED)
+    partial_message = None
+    if pending:
+        partial = {part: profile_part_result(task) for part, task in requests.items() if task in done}
+        partial_message = await send_message(render_profile(concept, partial), parse_mode="HTML")
+        await asyncio.wait(pending)
+
+    parts = {part: profile_part_result(task) for part, task in requests.items()}
+    metrics.observe("brand_stage_seconds", time.perf_counter() - profile_started, stage="profile")
+    profile_text = render_profile(concept, parts)
+
+    # Сохраняем готовый профиль: ссылки, пересылка и «Мои проекты» больше не требуют генерации
+    profile_id = await profile_store.save_profile(
+        event.from_user.id, username, context, profile_text,
+        {**concept, **{part: result for part, result in parts.items() if result is not None}},
+    )
+    keyboard = project_profile_kb(profile_id, await profile_link(event.bot, profile_id))
 
     # Отправляем итоговый профиль
-    await send_message(profile_text, parse_mode="HTML", reply_markup=keyboard)
+    if partial_message:
+        try:
+            await partial_message.edit_text(profile_text, parse_mode="HTML", reply_markup=keyboard)
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось дописать профиль в том же сообщении: {e}")
+            await send_message(profile_text, parse_mode="HTML", reply_markup=keyboard)
+    else:
+        await send_message(profile_text, parse_mode="HTML", reply_markup=keyboard)
 
     # Очищаем состояние FSM
     await state.clear()
@@ -488,18 +589,36 @@ async def repeat_generation(query: types.CallbackQuery, state: FSMContext):
 
     current_state = await state.get_state()
 
-    if current_state == BrandCreationStates.waiting_for_stage1:
+    stage = next((num for num, stage_state in STAGE_STATES.items() if current_state == stage_state), None)
+    if stage is None:
+        await query.message.answer("❌ Неизвестное состояние. Попробуйте снова или начните с начала.")
+        return
+
+    # ⚡ Сначала пробуем отдать варианты из буфера сессии — без нового вызова AI
+    data = await state.get_data()
+    scope = stage_scope(stage, data)
+    buffer_key = f"stage{stage}_buffer"
+    options = await session_buffer.take_from_buffer(state, buffer_key, config.STAGE_OPTIONS_COUNT, scope)
+
+    if options:
+        await render_stage(query.message.answer, state, stage, data.get(f"stage{stage}_answer", ""), options)
+        await session_buffer.refill_if_low(
+            state, buffer_key, scope,
+            producer=lambda d: produce_stage_options(stage, d),
+            threshold=config.BUFFER_REFILL_THRESHOLD,
+            dedup_key=lambda opt: opt["short"]
+        )
+        return
+
+    if stage == 1:
         await stage1_problem(query, state)
 
-    elif current_state == BrandCreationStates.waiting_for_stage2:
+    elif stage == 2:
         await stage2_audience(query, state)
 
-    elif current_state == BrandCreationStates.waiting_for_stage3:
+    elif stage == 3:
         await stage3_shape(query, state)
 
-    else:
-        await query.message.answer("❌ Неизвестное состояние. Попробуйте снова или начните с начала.")
-
 
 @brand_router.callback_query(lambda c: c.data == "repeat_brand")
 async def cmd_start_from_callback(query: types.CallbackQuery, state: FSMContext):
@@ -667,17 +786,33 @@ async def show_main_menu(message: types.Message):
 GROUP_ID = -1002250762604  # ID твоей группы
 THREAD_ID = 162  # Предполагаемый ID темы
 
-@brand_router.callback_query(lambda c: c.data == "forward_project")
+@brand_router.callback_query(lambda c: c.data == "forward_project" or c.data.startswith("forward_project:"))
 async def forward_project(query: types.CallbackQuery):
     """
-    Пересылает последнее сообщение бота (профиль проекта) в указанную группу.
+    Публикует профиль проекта в указанную группу: сохранённый профиль (forward_project:<id>)
+    отправляется из хранилища, для старых кнопок пересылается само сообщение.
     """
 
     logging.info("🔄 Получен callback на пересылку проекта!")  # Логируем получение запроса
 
     try:
-        # Пересылаем последнее сообщение от бота в группу
-        forwarded_message = await query.message.forward(GROUP_ID, message_thread_id=THREAD_ID)
+        profile_id = query.data.split(":", 1)[1] if ":" in query.data else None
+        profile = await profile_store.get_profile(profile_id) if profile_id else None
+
+        if profile:
+            link = await profile_link(query.bot, profile_id)
+            await query.bot.send_message(
+                GROUP_ID,
+                profile["profile_text"],
+                message_thread_id=THREAD_ID,
+                parse_mode="HTML",
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                    [InlineKeyboardButton(text="🔗 Открыть проект в боте", url=link)]
+                ]) if link else None
+            )
+        else:
+            # Пересылаем последнее сообщение от бота в группу
+            await query.message.forward(GROUP_ID, message_thread_id=THREAD_ID)
 
         # Отправляем пользователю уведомление
         await query.message.answer(
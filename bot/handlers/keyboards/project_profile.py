@@ -0,0 +1,28 @@
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+
+def project_profile_kb(profile_id: str | None = None, link: str | None = None) -> InlineKeyboardMarkup:
+    """
+    Клавиатура под профилем проекта. С `profile_id` пересылка и ссылка берут
+    сохранённый профиль (без повторной генерации).
+    """
+    buttons = [
+        [InlineKeyboardButton(text="🔄 Вернуться в меню", callback_data="start")],
+        [InlineKeyboardButton(text="📢 Поделиться проектом",
+                              callback_data=f"forward_project:{profile_id}" if profile_id else "forward_project")],
+    ]
+    if link:
+        buttons.append([InlineKeyboardButton(text="🔗 Ссылка на проект", url=link)])
+    buttons.append([InlineKeyboardButton(text="⭐ Оставить отзыв", callback_data="leave_feedback")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def my_projects_kb(profiles: list[dict]) -> InlineKeyboardMarkup:
+    """Список проектов пользователя: по кнопке на проект."""
+    buttons = [
+        [InlineKeyboardButton(text=f"📝 {p['username']} · {p['created_at']:%d.%m.%Y}",
+                              callback_data=f"open_project:{p['id']}")]
+        for p in profiles
+    ]
+    buttons.append([InlineKeyboardButton(text="🏠 В меню", callback_data="start")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -9,9 +9,10 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command  # Новый импорт
 
 from bot.handlers.states import BrandCreationStates
-from bot.services.brand_ask_ai import ask_ai
-from bot.services.name_gen import gen_process_and_check
 from bot.handlers.keyboards.name_generate import generate_username_kb
+from services import idea_pool, session_buffer
+
+import config
 
 
 import logging
@@ -35,6 +36,7 @@ async def show_main_menu(message: types.Message):
     """
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🆕 Начать процесс", callback_data="create_brand")],
+        [InlineKeyboardButton(text="📂 Мои проекты", callback_data="my_projects")],
         [InlineKeyboardButton(text="🎲 Что это и зачем", callback_data="help")],
         [InlineKeyboardButton(text="🐾 Мастерская Бот и Кот", url="https://t.me/bot_and_kot")]
     ])
@@ -65,6 +67,8 @@ async def cmd_start_from_callback(query: types.CallbackQuery, state: FSMContext)
 import urllib.parse
 
 from bot.handlers.brand_gen import stage1_problem  # Убедись, что импорт есть
+from bot.handlers.projects import send_stored_profile
+from services.profile_store import parse_deep_link
 
 @main_menu_router.message(Command(commands=["start"]))
 async def cmd_start(message: types.Message, state: FSMContext):
@@ -75,6 +79,13 @@ async def cmd_start(message: types.Message, state: FSMContext):
         args = parts[1].strip()
         # Декодируем URL-энкодинг, если он есть
         args = urllib.parse.unquote(args)
+
+        # Ссылка на готовый проект (/start p_<id>) — отдаём сохранённый профиль
+        profile_id = parse_deep_link(args)
+        if profile_id:
+            await send_stored_profile(message, profile_id)
+            return
+
         try:
             print(f"ARGS: {args}")
             # Декодируем Base64 и затем JSON
@@ -134,12 +145,30 @@ async def handle_abstract2real_command(message: types.Message, state: FSMContext
 # Генерация случайной идеи (обработчик)
 @main_menu_router.callback_query(lambda c: c.data == "get_random_idea")
 async def generate_random_idea(query: types.CallbackQuery, state: FSMContext):
-    await query.message.answer("⏳ Придумываю и выбираю свободные username...")
     await query.answer()
 
+    # ⚡ Сначала пробуем взять готовую идею из фонового пула
+    bundle = await idea_pool.take_bundle()
+    if bundle:
+        from bot.handlers.name_gen import handle_generation_result, username_scope
+
+        start_time = datetime.now().isoformat()
+        usernames = bundle["usernames"][:config.AVAILABLE_USERNAME_COUNT]
+        await state.update_data(context=bundle["idea"], is_random=True, start_time=start_time,
+                                usernames=usernames, style=None, shown_usernames=usernames)
+        await session_buffer.set_buffer(state, "username_buffer", bundle["usernames"][config.AVAILABLE_USERNAME_COUNT:],
+                                        username_scope(bundle["idea"], None))
+
+        await handle_generation_result(query, usernames, bundle["idea"], None, start_time)
+        await state.set_state(BrandCreationStates.waiting_for_username_choice)
+        return
+
+    await query.message.answer("⏳ Придумываю и выбираю свободные username...")
+
+    from services.brand_ask_ai import ask_ai  # Клиент LLM загружается при первой генерации
+
     # Генерация случайной идеи (3-6 слов)
-    prompt = "Придумай уникальную и креативную идею для проекта. Идея должна состоять из 3-6 слов и быть максимально непохожей на предыдущие идеи. "
-    random_idea = ask_ai(prompt).strip()
+    random_idea = (await ask_ai(config.RANDOM_IDEA_PROMPT, task="random_idea")).strip()
 
     if not random_idea:
         await query.message.answer("❌ Не удалось сгенерировать идею. Попробуйте ещё раз.")
@@ -8,7 +8,7 @@ from aiogram import Bot, Router, types, F
 from aiogram.fsm.context import FSMContext
 
 
-from services.name_gen import gen_process_and_check
+from services import session_buffer
 from bot.handlers.keyboards.name_generate import generate_username_kb, initial_styles_kb, styles_kb
 from bot.handlers.main_menu import back_to_menu_kb
 from .states import BrandCreationStates
@@ -121,15 +121,21 @@ async def perform_username_generation(query: CallbackQuery, state: FSMContext, b
         await state.clear()
         return
 
+    from services.name_gen import gen_process_and_check  # Генерация и проверка загружаются при первом запросе
+
     logging.info(f"🚀 Генерация username: контекст='{context_text}', стиль='{style}'")
 
+    # Не показываем повторно имена, которые пользователь уже видел по этой теме
+    shown_usernames = data.get("shown_usernames", []) if data.get("username_buffer_scope") == username_scope(context_text, style) else []
 
     try:
         raw_usernames = await asyncio.wait_for(
-            gen_process_and_check(bot, context_text, style, config.AVAILABLE_USERNAME_COUNT),
+            gen_process_and_check(bot, context_text, style, config.AVAILABLE_USERNAME_COUNT,
+                                  surplus=config.USERNAME_BUFFER_SIZE, exclude=set(shown_usernames)),
             timeout=config.GEN_TIMEOUT
         )
-        usernames = [u.strip() for u in raw_usernames if u.strip()]
+        found_usernames = [u.strip() for u in raw_usernames if u.strip()]
+        usernames = found_usernames[:config.AVAILABLE_USERNAME_COUNT]
 
         if not usernames:
             logging.warning(f"❌ AI отказался генерировать username по этическим соображениям (контекст: '{context_text}', стиль: '{style}').")
@@ -140,8 +146,10 @@ async def perform_username_generation(query: CallbackQuery, state: FSMContext, b
             await state.clear()
             return
 
-        # Сохраняем сгенерированные usernames в FSM
-        await state.update_data(usernames=usernames)
+        # Сохраняем сгенерированные usernames в FSM, излишки — в буфер для «Еще 3 варианта»
+        await state.update_data(usernames=usernames, style=style, shown_usernames=shown_usernames + usernames)
+        await session_buffer.set_buffer(state, "username_buffer", found_usernames[config.AVAILABLE_USERNAME_COUNT:],
+                                        username_scope(context_text, style))
         await handle_generation_result(query, usernames, context_text, style, start_time)
         await state.set_state(BrandCreationStates.waiting_for_username_choice)
 
@@ -215,7 +223,41 @@ async def repeat_username_generation(query: CallbackQuery, state: FSMContext, bo
         return
 
     # Обновляем время начала генерации, чтобы duration было актуальным
-    await state.update_data(start_time=datetime.now().isoformat())
+    start_time = datetime.now().isoformat()
+    await state.update_data(start_time=start_time)
+
+    # ⚡ Сначала пробуем отдать имена из буфера сессии — без нового раунда LLM
+    scope = username_scope(context_text, style)
+    usernames = await session_buffer.take_from_buffer(state, "username_buffer", config.AVAILABLE_USERNAME_COUNT, scope)
+
+    if usernames:
+        data = await state.get_data()
+        await state.update_data(usernames=usernames, shown_usernames=data.get("shown_usernames", []) + usernames)
+        await handle_generation_result(query, usernames, context_text, style, start_time)
+        await state.set_state(BrandCreationStates.waiting_for_username_choice)
+
+        await session_buffer.refill_if_low(
+            state, "username_buffer", scope,
+            producer=lambda d: produce_buffer_usernames(bot, context_text, style, d),
+            threshold=config.BUFFER_REFILL_THRESHOLD,
+            timeout=config.GEN_TIMEOUT
+        )
+        return
 
     # Запускаем генерацию username с ранее сохранёнными параметрами
     await perform_username_generation(query, state, bot, style)
+
+
+def username_scope(context: str, style: str | None) -> str:
+    """Ключ, для которого собран буфер username: тема + стиль."""
+    return f"{context}|{style or ''}"
+
+
+async def produce_buffer_usernames(bot: Bot, context: str, style: str | None, data: dict) -> list[str]:
+    """Фоновая генерация свободных username для дозаполнения буфера сессии."""
+    from services.name_gen import gen_process_and_check
+
+    exclude = set(data.get("shown_usernames", [])) | set(data.get("username_buffer", []))
+    return await gen_process_and_check(bot, context, style, config.AVAILABLE_USERNAME_COUNT,
+                                       surplus=config.USERNAME_BUFFER_SIZE - config.AVAILABLE_USERNAME_COUNT,
+                                       exclude=exclude)
@@ -0,0 +1,60 @@
+import logging
+
+from aiogram import Bot, Router, types
+from aiogram.filters import Command
+
+from bot.handlers.keyboards.project_profile import my_projects_kb, project_profile_kb
+from services import profile_store
+
+projects_router = Router()
+
+
+async def profile_link(bot: Bot, profile_id: str) -> str | None:
+    """Ссылка t.me/<бот>?start=p_<id> на сохранённый профиль."""
+    try:
+        me = await bot.me()
+        return profile_store.deep_link(me.username, profile_id)
+    except Exception as e:
+        logging.warning(f"⚠️ Не удалось получить имя бота для ссылки на проект: {e}")
+        return None
+
+
+async def send_stored_profile(message: types.Message, profile_id: str):
+    """Отправляет сохранённый профиль проекта (из кеша или БД), без обращения к AI."""
+    profile = await profile_store.get_profile(profile_id)
+    if profile is None:
+        await message.answer("❌ Проект не найден. Возможно, ссылка устарела.")
+        return
+
+    logging.info(f"📦 Профиль {profile_id} (@{profile['username']}) выдан из хранилища")
+    await message.answer(
+        profile["profile_text"],
+        parse_mode="HTML",
+        reply_markup=project_profile_kb(profile_id, await profile_link(message.bot, profile_id))
+    )
+
+
+async def show_my_projects(message: types.Message, user_id: int):
+    profiles = await profile_store.list_user_profiles(user_id)
+    if not profiles:
+        await message.answer("📂 У вас пока нет сохранённых проектов.", reply_markup=my_projects_kb([]))
+        return
+    await message.answer("📂 <b>Мои проекты</b>\nВыберите проект, чтобы открыть профиль:",
+                         parse_mode="HTML", reply_markup=my_projects_kb(profiles))
+
+
+@projects_router.callback_query(lambda c: c.data == "my_projects")
+async def my_projects_button(query: types.CallbackQuery):
+    await query.answer()
+    await show_my_projects(query.message, query.from_user.id)
+
+
+@projects_router.message(Command("projects"))
+async def my_projects_command(message: types.Message):
+    await show_my_projects(message, message.from_user.id)
+
+
+@projects_router.callback_query(lambda c: c.data.startswith("open_project:"))
+async def open_project(query: types.CallbackQuery):
+    await query.answer()
+    await send_stored_profile(query.message, query.data.split(":", 1)[1])
@@ -2,12 +2,13 @@ import logging
 import asyncio
 import os
 import json
+import signal
 import sys
 import time
 
 from aiohttp import web
 from dotenv import load_dotenv
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import Update
 
@@ -15,10 +16,10 @@ sys.path.append("/app")
 sys.path.append("/app/bot")
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # Добавляем текущую папку
 
-from bot.handlers.name_gen import username_router
-from bot.handlers.brand_gen import brand_router
-from bot.handlers.main_menu import main_menu_router, command_router
-from database.database import init_db, init_db_pool
+from database.database import close_db_pool, init_db, init_db_pool
+from services import http_client, lifecycle, metrics, snapshots, tracing
+
+import config
 
 from logger import setup_logging
 
@@ -28,24 +29,9 @@ load_dotenv()
 # 📌 Устанавливаем корректный путь (для Amvera)
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
-
-print(f"🔍 sys.path: {sys.path}")  # Выведет все пути, где Python ищет модули
-print(f"🔍 Текущая директория: {os.getcwd()}")  # Где реально запускается скрипт
-print(f"📂 Файлы в /app: {os.listdir('/app')}" if os.path.exists('/app') else "❌ Папка /app не найдена")
-print(f"📂 Файлы в /app/bot: {os.listdir('/app/bot')}" if os.path.exists('/app/bot') else "❌ Папка /app/bot не найдена")
-
 # === 🔍 Определяем режим работы ===
 IS_LOCAL = os.getenv("LOCAL_RUN", "false").lower() == "true"
 
-if not IS_LOCAL:
-    try:
-        print(f"📂 Файлы в /app: {os.listdir('/app')}")
-    except FileNotFoundError:
-        print("❌ Папка /app не найдена. Запуск локально?")
-else:
-    print(f"📂 Файлы в текущей директории: {os.listdir(os.getcwd())}")
-
-
 
 # === 🌍 Настройки Webhook ===
 WEBHOOK_HOST = os.getenv("WEBHOOK_URL", "https://prozektor-panarini.amvera.io").strip()
@@ -65,67 +51,173 @@ bot = Bot(token=BOT_TOKEN)
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 dp.bot = bot  # Привязываем бота к диспетчеру вручную
+snapshots.register_fsm(storage)  # 💾 FSM-сессии переживают перезапуск
 
-# Подключаем роутеры
-dp.include_router(main_menu_router)
-dp.include_router(command_router)
-dp.include_router(username_router)
-dp.include_router(brand_router)
+# ⏱️ Длительность фаз запуска (для отчёта в лог)
+startup_timings: dict[str, float] = {}
 
 
+async def timed(phase: str, coro):
+    """Выполняет фазу запуска и запоминает её длительность."""
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        startup_timings[phase] = time.perf_counter() - start
 
-async def on_startup():
-    """Запуск бота и подключение к БД"""
-    await init_db_pool()  # 📌 Добавить вызов, если его нет
+
+def include_routers():
+    """Импортирует и подключает роутеры. Сервисы генерации (LLM, Fragment) загружаются при первом обращении."""
+    from bot.handlers.main_menu import main_menu_router, command_router
+    from bot.handlers.name_gen import username_router
+    from bot.handlers.brand_gen import brand_router
+    from bot.handlers.projects import projects_router
+
+    dp.include_router(main_menu_router)
+    dp.include_router(command_router)
+    dp.include_router(username_router)
+    dp.include_router(brand_router)
+    dp.include_router(projects_router)
+
+
+async def init_database():
+    await init_db_pool()
     await init_db()  # ✅ Проверка таблиц
 
 
+async def register_webhook():
     if IS_LOCAL:
         logging.info("🛑 Локальный запуск. Webhook НЕ будет установлен.")
         await bot.delete_webhook(drop_pending_updates=True)
-    else:
-        logging.info(f"🔗 Устанавливаем вебхук: {WEBHOOK_URL}")
-        try:
-            await bot.delete_webhook(drop_pending_updates=True)
-            await bot.set_webhook(WEBHOOK_URL)
-            logging.info(f"✅ Webhook установлен: {WEBHOOK_URL}")
-        except Exception as e:
-            logging.error(f"❌ Ошибка при установке Webhook: {e}")
-            sys.exit(1)
+        return
+
+    logging.info(f"🔗 Устанавливаем вебхук: {WEBHOOK_URL}")
+    try:
+        # Очередь не сбрасываем: в ней обновления, на которые старый экземпляр при остановке ответил 503
+        await bot.set_webhook(WEBHOOK_URL)
+        logging.info(f"✅ Webhook установлен: {WEBHOOK_URL}")
+    except Exception as e:
+        logging.error(f"❌ Ошибка при установке Webhook: {e}")
+        sys.exit(1)
+
+
+async def load_caches():
+    """Кеши, которым нужна БД и снимок состояния."""
+    from services import context_cache, history_pool, taken_filter
+
+    await asyncio.gather(
+        taken_filter.init_taken_filter(),  # 🧮 Фильтр заведомо занятых username
+        context_cache.load(),  # ♻️ Свободные имена похожих идей из истории
+        history_pool.load(),  # 🗂️ Свободные имена по категориям и стилям
+    )
+
+
+async def on_startup():
+    """Запуск бота: независимые шаги идут параллельно, в конце — отчёт о длительности фаз"""
+    start = time.perf_counter()
+
+    include_routers()
+    startup_timings["импорт"] = time.perf_counter() - start
+
+    # 📡 БД, HTTP-сессия, вебхук и снимок состояния друг от друга не зависят
+    await asyncio.gather(
+        timed("БД", init_database()),
+        timed("HTTP", http_client.get_session()),
+        timed("вебхук", register_webhook()),
+        timed("снимок", snapshots.load()),  # 💾 Кеши, пулы и сессии из снимка в DATA_DIR
+    )
+
+    await timed("кеши", load_caches())
+
+    from services import idea_pool, prompt_registry
+    prompt_registry.load_templates()  # 📚 Шаблоны промптов из bot/prompts
+    idea_pool.start_producer()  # 🎲 Фоновое пополнение пула случайных идей
+    snapshots.start()  # 💾 Периодическое сохранение снимка
+
+    phases = ", ".join(f"{phase} {duration:.2f}" for phase, duration in startup_timings.items())
+    logging.info(f"⏱️ Запуск занял {time.perf_counter() - start:.2f} сек. ({phases})")
 
 
-async def on_shutdown(_):
-    """Закрытие сессии перед остановкой"""
-    logging.info("🚨 Бот остановлен! Закрываю сессию...")
+async def on_shutdown():
+    """
+    Остановка по шагам: перестаём принимать обновления и дожидаемся начатой работы,
+    останавливаем фоновые задачи, пишем финальный снимок и закрываем клиенты и пул БД.
+    """
+    from services import idea_pool, llm_client
+
+    logging.info("🚨 Бот останавливается: новые обновления не принимаем, дорабатываем текущие...")
+    await lifecycle.drain(config.SHUTDOWN_TIMEOUT)
+
+    await idea_pool.stop_producer()
+    await snapshots.stop()  # 💾 Финальный снимок (в том числе FSM-сессии после доработки)
+
+    await http_client.close()
     try:
         await bot.session.close()
     except Exception as e:
         logging.error(f"❌ Ошибка при закрытии сессии: {e}")
-    logging.info("✅ Сессия закрыта.")
+    await llm_client.close()
+    await close_db_pool()  # Последним: доработавшие задачи могли писать в БД
+    logging.info("✅ Бот остановлен, все соединения закрыты.")
+
+
+def update_attributes(update: Update) -> dict:
+    """Атрибуты трассы: тип обновления, пользователь и кнопка/команда — чтобы найти трассу по жалобе."""
+    attributes = {"update_id": update.update_id}
+    try:
+        event = update.event
+        attributes["event"] = update.event_type
+    except Exception:
+        return attributes
+    if getattr(event, "from_user", None):
+        attributes["user_id"] = event.from_user.id
+    if getattr(event, "data", None):
+        attributes["callback_data"] = event.data
+    elif getattr(event, "text", None) and event.text.startswith("/"):
+        attributes["command"] = event.text.split()[0]
+    return attributes
 
 
 async def handle_update(request):
     """Обработчик Webhook (принимает входящие запросы от Telegram)"""
+    if not lifecycle.is_accepting():
+        metrics.inc("bot_updates_total", result="rejected")
+        return web.Response(status=503)  # Telegram повторит доставку позже
+
+    lifecycle.track(asyncio.current_task())
     time_start = time.time()
     raw_text = await request.text()
 
     try:
         update_data = json.loads(raw_text)
         update = Update(**update_data)
-        await dp.feed_update(bot=bot, update=update)
+        with metrics.timer("bot_update_seconds"), tracing.trace("telegram.update", **update_attributes(update)):
+            await dp.feed_update(bot=bot, update=update)
 
         time_end = time.time()
         logging.info(f"⏳ Обработка запроса заняла {time_end - time_start:.4f} секунд")
+        metrics.inc("bot_updates_total", result="ok")
         return web.Response()
 
     except json.JSONDecodeError:
+        metrics.inc("bot_updates_total", result="bad_json")
         logging.error(f"❌ Ошибка парсинга JSON: {raw_text}")
 
     except Exception as e:
+        metrics.inc("bot_updates_total", result="error")
         logging.error(f"❌ Ошибка обработки Webhook: {e}", exc_info=True)
         return web.Response(status=500)
 
 
+async def handle_metrics(request):
+    """Метрики в формате Prometheus. Если задан METRICS_TOKEN — только с ?token=... или Bearer-токеном"""
+    if config.METRICS_TOKEN:
+        token = request.query.get("token") or request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if token != config.METRICS_TOKEN:
+            return web.Response(status=403)
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+
 async def handle_root(request):
     """Обработчик корневого запроса (проверка работы)"""
     logging.info("✅ Обработан GET-запрос на /")
@@ -136,41 +228,54 @@ async def main():
     """Главная функция запуска"""
     await on_startup()
 
-    if IS_LOCAL:
-        logging.info("🚀 Запускаем бота в режиме Polling...")
-        await dp.start_polling(bot)
-        sys.exit(0)
-
     logging.info("⚡ БОТ ПЕРЕЗАПУЩЕН (контейнер стартовал заново)")
     app = web.Application()
     app.add_routes([
         web.get("/", handle_root),
+        web.get("/metrics", handle_metrics),
         web.post("/webhook", handle_update)
     ])
-    app.on_shutdown.append(on_shutdown)
     return app
 
 
+def stop_signal() -> asyncio.Event:
+    """Событие, которое выставляется по SIGTERM/SIGINT (остановка контейнера при деплое)."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    return stop
+
+
 async def start_server():
     """Запуск сервера или Polling"""
+    started = time.perf_counter()
     try:
         app = await main()
 
         if IS_LOCAL:
             logging.info("🚀 Запускаем бота в режиме Polling...")
-            await dp.start_polling(bot)
-            sys.exit(0)
+            await dp.start_polling(bot)  # Сам обрабатывает SIGINT/SIGTERM
+            await on_shutdown()
+            return
 
         # 🌍 Webhook Mode
         logging.info("✅ Запускаем бота в режиме Webhook...")
         runner = web.AppRunner(app)
         await runner.setup()
-        site = web.TCPSite(runner, "0.0.0.0", WEBAPP_PORT)
+        site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
         await site.start()
 
-        logging.info(f"✅ Webhook сервер запущен на порту {WEBAPP_PORT}")
+        logging.info(f"✅ Webhook сервер запущен на порту {WEBAPP_PORT} "
+                     f"(⏱️ {time.perf_counter() - started:.2f} сек. от старта цикла событий)")
 
-        await asyncio.Event().wait()
+        await stop_signal().wait()
+        logging.info("🛑 Получен сигнал остановки.")
+        await on_shutdown()  # Сервер ещё работает: отвечает 503 и дожидается текущих ответов
+        await runner.cleanup()
 
     except Exception as e:
         logging.error(f"❌ Ошибка запуска: {e}")
@@ -179,13 +284,6 @@ async def start_server():
 
 logging.getLogger("asyncio").setLevel(logging.WARNING)
 
-import traceback
-
-try:
-    asyncio.run(start_server())
-except Exception as e:
-    print("🔥 Критическая ошибка:", e)
-    traceback.print_exc()
 
 if __name__ == "__main__":
     try:
@@ -193,7 +291,4 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logging.info("🛑 Бот остановлен пользователем.")
     except Exception as e:
-        logging.error(f"❌ Критическая ошибка: {e}")
-
-    while True:
-        time.sleep(3600)  # Держим процесс живым
+        logging.error(f"❌ Критическая ошибка: {e}", exc_info=True)
@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import logging
+import math
+import random
+import re
+import time
+import zlib
+
+from services.data_dir import load_json, save_json
+
+import config
+
+
+# Маленькая логистическая регрессия, которая по виду username предсказывает вероятность,
+# что он свободен. Обучается офлайн на истории generated_usernames:
+#   python -m services.availability_model train      (из папки bot/)
+#   python -m services.availability_model evaluate
+# Во время генерации кандидаты проверяются на Fragment в порядке убывания этой вероятности.
+
+MODEL_FILE = "availability_model.json"
+REPORT_FILE = "availability_model_report.json"
+
+FREE_STATUS = "Свободно"
+UNKNOWN_STATUS = "Невозможно определить"
+
+NGRAM_BUCKETS = 2 ** 16
+
+# Частые английские слова: короткие словарные имена почти всегда заняты
+COMMON_WORDS = {
+    "app", "art", "bot", "best", "blog", "book", "brand", "bright", "build", "business", "buy", "care", "cat",
+    "chat", "city", "club", "code", "coffee", "cool", "craft", "daily", "data", "design", "dev", "dream",
+    "easy", "eco", "fit", "flow", "food", "free", "fresh", "fun", "game", "go", "good", "green", "group",
+    "happy", "health", "help", "hub", "idea", "info", "joy", "kids", "lab", "life", "light", "live", "love",
+    "magic", "market", "media", "mind", "money", "music", "my", "net", "news", "next", "online", "pay",
+    "people", "photo", "play", "plus", "power", "pro", "real", "say", "shop", "smart", "social", "soft",
+    "space", "sport", "star", "start", "store", "study", "style", "sun", "team", "tech", "the", "time",
+    "top", "travel", "true", "world", "web", "wise", "work", "you", "zen",
+}
+
+_model: dict | None = None
+_loaded = False
+
+
+def features(username: str) -> dict[str, float]:
+    """Разреженный вектор признаков username."""
+    name = username.lower()
+    length = len(name)
+    letters = re.sub(r"[^a-z]", "", name)
+
+    feats = {
+        f"len:{min(length, 16)}": 1.0,
+        "digits": float(sum(ch.isdigit() for ch in name)),
+        "has_digit": float(any(ch.isdigit() for ch in name)),
+        "underscores": float(name.count("_")),
+        "ends_bot": float(name.endswith("bot")),
+        "is_word": float(letters in COMMON_WORDS),
+        "word_hits": float(sum(word in letters for word in COMMON_WORDS if len(word) >= 3)),
+        "vowel_ratio": sum(ch in "aeiouy" for ch in letters) / max(len(letters), 1),
+    }
+
+    padded = f"^{name}$"
+    for size in (2, 3):
+        for i in range(len(padded) - size + 1):
+            bucket = zlib.crc32(padded[i:i + size].encode()) % NGRAM_BUCKETS
+            key = f"g{size}:{bucket}"
+            feats[key] = feats.get(key, 0.0) + 1.0
+
+    return feats
+
+
+def _sigmoid(x: float) -> float:
+    if x < -30:
+        return 0.0
+    if x > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+def predict(model: dict, username: str) -> float:
+    weights = model["weights"]
+    z = model["bias"] + sum(weights.get(key, 0.0) * value for key, value in features(username).items())
+    return _sigmoid(z)
+
+
+def train(samples: list[tuple[str, int]], epochs: int = 8, lr: float = 0.1, l2: float = 1e-4) -> dict:
+    """Обучает логистическую регрессию стохастическим градиентным спуском."""
+    weights: dict[str, float] = {}
+    positives = sum(label for _, label in samples)
+    base_rate = min(max(positives / max(len(samples), 1), 1e-3), 1 - 1e-3)
+    bias = math.log(base_rate / (1 - base_rate))
+
+    data = [(features(username), label) for username, label in samples]
+    rng = random.Random(42)
+    for epoch in range(epochs):
+        rng.shuffle(data)
+        step = lr / (1 + epoch)
+        for feats, label in data:
+            z = bias + sum(weights.get(key, 0.0) * value for key, value in feats.items())
+            error = _sigmoid(z) - label
+            bias -= step * error
+            for key, value in feats.items():
+                w = weights.get(key, 0.0)
+                weights[key] = w - step * (error * value + l2 * w)
+
+    weights = {key: round(w, 5) for key, w in weights.items() if abs(w) > 1e-4}
+    return {"bias": bias, "weights": weights, "trained_at": time.time(), "samples": len(samples)}
+
+
+def evaluate(model: dict, samples: list[tuple[str, int]]) -> dict:
+    """Метрики модели на размеченной выборке."""
+    if not samples:
+        return {"samples": 0}
+
+    scored = sorted(((predict(model, username), label) for username, label in samples), reverse=True)
+    positives = sum(label for _, label in scored)
+    negatives = len(scored) - positives
+
+    eps = 1e-9
+    log_loss = -sum(label * math.log(p + eps) + (1 - label) * math.log(1 - p + eps) for p, label in scored) / len(scored)
+    accuracy = sum((p >= 0.5) == bool(label) for p, label in scored) / len(scored)
+
+    # ROC AUC через ранги (доля правильно упорядоченных пар свободное/занятое)
+    auc = None
+    if positives and negatives:
+        rank_sum = sum(rank for rank, (_, label) in enumerate(reversed(scored), start=1) if label)
+        auc = (rank_sum - positives * (positives + 1) / 2) / (positives * negatives)
+
+    top = scored[:max(1, len(scored) // 5)]
+    report = {
+        "samples": len(scored),
+        "free_rate": positives / len(scored),
+        "accuracy": accuracy,
+        "log_loss": log_loss,
+        "roc_auc": auc,
+        "precision_top20": sum(label for _, label in top) / len(top),
+        "recall_top20": sum(label for _, label in top) / positives if positives else None,
+    }
+
+    # Сколько проверок нужно, чтобы найти AVAILABLE_USERNAME_COUNT свободных: по модели и в среднем вслепую
+    k = config.AVAILABLE_USERNAME_COUNT
+    if positives >= k:
+        found = 0
+        for checks, (_, label) in enumerate(scored, start=1):
+            found += label
+            if found >= k:
+                break
+        report["checks_for_k_model"] = checks
+        report["checks_for_k_random"] = k * (len(scored) + 1) / (positives + 1)
+
+    return report
+
+
+def _label(status: str) -> int | None:
+    if status == UNKNOWN_STATUS:
+        return None
+    return int(status == FREE_STATUS)
+
+
+def _is_holdout(username: str, share: float) -> bool:
+    # Детерминированное разбиение: одно и то же имя всегда в одной части
+    return zlib.crc32(username.lower().encode()) % 1000 < share * 1000
+
+
+def load_model() -> dict | None:
+    """Лениво загружает обученную модель из папки постоянных данных."""
+    global _model, _loaded
+    if not _loaded:
+        _loaded = True
+        _model = load_json(MODEL_FILE)
+        if _model:
+            logging.info(f"🤖 Модель доступности username загружена ({_model.get('samples')} примеров)")
+    return _model
+
+
+def is_loaded() -> bool:
+    return load_model() is not None
+
+
+def score(username: str) -> float | None:
+    """Вероятность, что username свободен. None — если модель ещё не обучена."""
+    model = load_model()
+    return predict(model, username) if model else None
+
+
+def rank(usernames: list[str]) -> list[str]:
+    """Сортирует кандидатов по убыванию вероятности быть свободными (без модели — порядок не меняется)."""
+    model = load_model()
+    if not model:
+        return list(usernames)
+    return sorted(usernames, key=lambda u: predict(model, u), reverse=True)
+
+
+async def _load_samples() -> list[tuple[str, int]]:
+    from database.database import fetch_username_statuses, init_db_pool, close_db_pool
+
+    await init_db_pool()
+    try:
+        rows = await fetch_username_statuses()
+    finally:
+        await close_db_pool()
+
+    samples = []
+    for username, status in rows:
+        label = _label(status)
+        if label is not None:
+            samples.append((username, label))
+    return samples
+
+
+def _print_report(title: str, report: dict):
+    print(f"📊 {title}")
+    for key, value in report.items():
+        print(f"    {key}: {value:.4f}" if isinstance(value, float) else f"    {key}: {value}")
+
+
+async def _cli(args):
+    samples = await _load_samples()
+    if not samples:
+        print("❌ В истории нет размеченных username.")
+        return
+
+    if args.command == "train":
+        train_set = [s for s in samples if not _is_holdout(s[0], args.holdout)]
+        test_set = [s for s in samples if _is_holdout(s[0], args.holdout)]
+
+        model = train(train_set, epochs=args.epochs)
+        report = {"train": evaluate(model, train_set), "holdout": evaluate(model, test_set)}
+
+        # Итоговая модель обучается на всех данных
+        model = train(samples, epochs=args.epochs)
+        model["report"] = report
+        save_json(MODEL_FILE, model)
+        save_json(REPORT_FILE, report)
+
+        _print_report("Обучающая выборка", report["train"])
+        _print_report("Отложенная выборка", report["holdout"])
+        print(f"✅ Модель сохранена: {len(model['weights'])} весов, {len(samples)} примеров")
+
+    elif args.command == "evaluate":
+        model = load_model()
+        if not model:
+            print("❌ Модель ещё не обучена.")
+            return
+        report = evaluate(model, samples)
+        save_json(REPORT_FILE, {"all": report})
+        _print_report("Вся история", report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Модель доступности username")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--holdout", type=float, default=0.2, help="доля отложенной выборки для отчёта")
+    parser.add_argument("--epochs", type=int, default=8)
+    asyncio.run(_cli(parser.parse_args()))
@@ -1,41 +1,193 @@
-import os
 import logging
-from dotenv import load_dotenv
-from openai import OpenAI
-from bot import config
+from typing import Callable
+import config
+from services import llm_client, metrics, prompt_registry, structured_output, tracing
 import re
 
-# Загрузка переменных окружения
-load_dotenv()
 
-# Получение ключей API из окружения
-API_KEY = os.getenv("API_KEY")
-BASE_URL = os.getenv("BASE_URL")
+def _response_text(response) -> str:
+    return (response.choices[0].message.content or "") if response.choices else ""
 
-# Создание клиента OpenAI
-client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+
+def stage_max_tokens(options_count: int) -> int:
+    """Лимит токенов ответа с `options_count` вариантами."""
+    return max(config.MAX_TOKENS_BRAND, (options_count + 1) * config.MAX_TOKENS_PER_STAGE_OPTION)
 
 
 # Функция для отправки запроса к AI
-def ask_ai(prompt: str) -> str:
+async def ask_ai(prompt: str, task: str = "stages", validate: Callable[[str], bool] | None = None,
+                 response_format: dict | None = None, history: list[dict] | None = None,
+                 max_tokens: int | None = None) -> str:
+    """
+    `validate` включает каскад моделей: ответ быстрой модели, не прошедший проверку,
+    перезапрашивается у сильной.
+    `history` — предыдущие сообщения диалога (между системным сообщением и новым запросом).
+    """
+    text, _ = await request_ai(prompt, task, validate, response_format, history, max_tokens)
+    return text
+
+
+@tracing.traced("llm.ask_ai", "task")
+async def request_ai(prompt: str, task: str = "stages", validate: Callable[[str], bool] | None = None,
+                     response_format: dict | None = None, history: list[dict] | None = None,
+                     max_tokens: int | None = None) -> tuple[str, bool]:
+    """Как ask_ai, но возвращает ещё и признак того, что ответ обрезан по лимиту токенов."""
+    max_tokens = max_tokens or config.MAX_TOKENS_BRAND
+    messages = [
+        {"role": "system", "content": prompt_registry.system_prompt()},
+        *(history or []),
+        {"role": "user", "content": prompt}
+    ]
     try:
-        response = client.chat.completions.create(
-            model=config.MODEL_BRAND,
-            messages=[
-                {"role": "system", "content": "Ты - талантливый и конструктивный разработчик проектов. "},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=config.MAX_TOKENS_BRAND,
-            temperature=config.TEMPERATURE_BRAND,
-        )
-        return response.choices[0].message.content
+        if validate:
+            response = await llm_client.cascade(
+                task, messages, max_tokens, config.TEMPERATURE_BRAND,
+                validate=lambda r: validate(_response_text(r)), response_format=response_format,
+            )
+        else:
+            response = await llm_client.complete(
+                task=task,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=config.TEMPERATURE_BRAND,
+                response_format=response_format,
+            )
     except Exception as e:
         logging.error(f"Ошибка при обращении к AI: {e}")
-        return ""
+        return "", False
+
+    truncated = bool(response.choices) and response.choices[0].finish_reason == "length"
+    if truncated:
+        logging.warning(f"✂️ Ответ AI ({task}) обрезан по лимиту {max_tokens} токенов")
+        metrics.inc("errors_total", component="llm_truncated")
+    return _response_text(response), truncated
+
+
+# Предкомпилированные шаблоны парсера ответа
+_FORMATTING_CHARS = str.maketrans("", "", "*_~`")  # **, __ и одиночные символы форматирования
+_MARKDOWN_LINK = re.compile(r'\[([^\]]+)\]\((https?://[^\)]+)\)')
+_LIST_MARKER = re.compile(r'^(?:\d+\.|•)\s*')
+_PROBLEM_PREFIX = re.compile(r'^Проблема\s*\d+:\s*')
+_SEPARATOR = re.compile(r'\s*[:\-—–|/\\>]\s+')
+_SEPARATOR_OLD = re.compile(r'\s*[:\-—–|/\\>]\s+(?!\S*[-:]\S*)')
+_BOLD_OPTION = re.compile(r'^(.*?)\s*\*\*(.*?)\*\*\s*:\s*(.*)$')
+
+
+def clean_text(text: str) -> str:
+    """Удаляет лишние символы форматирования, но сохраняет ссылки и HTML."""
+    return " ".join(text.translate(_FORMATTING_CHARS).split())  # Убираем жирный/курсив и сжимаем пробелы
+
+
+def convert_markdown_links(text: str) -> str:
+    """Конвертирует Markdown-ссылки [текст](URL) в HTML <a href="URL">текст</a>"""
+    return _MARKDOWN_LINK.sub(r'<a href="\2">\1</a>', text) if "](" in text else text
+
+
+def _option_new_format(line: str) -> dict:
+    """Пункт списка в формате «Тэглайн/Описание» (профиль проекта)."""
+    line = _PROBLEM_PREFIX.sub('', _LIST_MARKER.sub('', line, 1), 1)
+    parts = _SEPARATOR.split(line, 1)
+    if len(parts) == 2:
+        name = convert_markdown_links(parts[0].strip())
+        return {"short": name, "full": f"<b>{name}</b>: {convert_markdown_links(parts[1].strip())}"}
+    line = convert_markdown_links(line.strip())
+    return {"short": line, "full": line}
+
+
+def _option_old_format(line: str) -> dict:
+    """Пункт списка в формате «Комментарий + варианты» (этапы)."""
+    body = line[1:].strip() if line[0] == "•" else line.split('.', 1)[1].strip()
+    body = _PROBLEM_PREFIX.sub('', body, 1)
+
+    separator_match = _SEPARATOR_OLD.search(body)
+    if separator_match:
+        left_part, details = body.split(separator_match.group(), 1)
+        left_part = left_part.strip()
+        details = convert_markdown_links(details.strip())
+    elif match := _BOLD_OPTION.match(body):
+        emoji, short_text, details = match.groups()
+        left_part = f"{emoji} {short_text}".strip()
+        details = convert_markdown_links(details.strip())
+    else:
+        parts = body.split()
+        left_part = parts[0] if parts else body
+        details = convert_markdown_links(" ".join(parts[1:]) if len(parts) > 1 else "Нет описания.")
+    return {"short": left_part, "full": f"<b>{left_part}</b>: {details}"}
 
 
 # Парсер ответа от AI
 def parse_ai_response(response: str) -> dict:
+    """
+    Однопроходный разбор ответа AI в двух форматах:
+      • новый (профиль): «Тэглайн: ...», «Описание: ...», нумерованные примеры;
+      • старый (этапы): первая строка/«Комментарий: ...», затем варианты «1. ...» или «• ...».
+    Каждая строка очищается один раз; формат выбирается после прохода, варианты разбираются
+    только для выбранного формата. Результат совпадает с parse_ai_response_legacy.
+    """
+    parsed_data = {
+        "answer": "",  # Сюда будет попадать тэглайн или старый комментарий
+        "description": "",  # Новое поле для описания проекта
+        "options": []  # Примеры проектов или варианты
+    }
+
+    if not response or not response.strip():
+        logging.error("❌ Пустой ответ от AI передан в парсер!")
+        return parsed_data
+
+    lines = response.strip().split('\n')
+
+    tagline = None
+    description = None
+    new_items = []    # Пункты списка для нового формата
+    old_items = []    # Пункты списка для старого формата (после комментария)
+    old_answer = ""
+
+    for line in lines:
+        cleaned = clean_text(line)
+        if not cleaned:
+            continue
+
+        if cleaned.startswith("Тэглайн:"):
+            tagline = convert_markdown_links(cleaned.split("Тэглайн:", 1)[1].strip())
+        elif cleaned.startswith("Описание:"):
+            description = convert_markdown_links(cleaned.split("Описание:", 1)[1].strip())
+        elif _LIST_MARKER.match(cleaned):
+            new_items.append(cleaned)
+
+        # Старый формат: первая непустая строка — комментарий, остальные — кандидаты в варианты
+        if not old_answer:
+            if "Комментарий:" in cleaned:
+                old_answer = convert_markdown_links(cleaned.split("Комментарий:", 1)[1].strip())
+            else:
+                old_answer = convert_markdown_links(cleaned)
+        elif (len(cleaned) > 2 and cleaned[0].isdigit() and cleaned[1] == '.') or cleaned[0] == "•":
+            old_items.append(cleaned)
+
+    if tagline or description:
+        parsed_data["answer"] = tagline or ""
+        parsed_data["description"] = description or ""
+        parsed_data["options"] = [_option_new_format(line) for line in new_items]
+    else:
+        parsed_data["answer"] = old_answer
+        parsed_data["options"] = [_option_old_format(line) for line in old_items]
+
+    # Если комментарий не найден, берём первую строку
+    if not parsed_data["answer"]:
+        parsed_data["answer"] = convert_markdown_links(clean_text(lines[0]))
+
+    if not parsed_data["options"]:
+        logging.error("❌ Парсер не нашел 'options' в ответе AI!")
+        parsed_data["options"] = [{
+            "short": "Ошибка",
+            "full": "Ошибка в генерации вариантов. Попробуйте снова."
+        }]
+
+    return parsed_data
+
+
+# Прежний парсер (две ветки форматов, регулярки компилируются на каждом вызове).
+# Оставлен как эталон: новый parse_ai_response сверяется с ним на корпусе (services.parser_bench)
+def parse_ai_response_legacy(response: str) -> dict:
     parsed_data = {
         "answer": "",  # Сюда будет попадать тэглайн или старый комментарий
         "description": "",  # Новое поле для описания проекта
@@ -168,15 +320,86 @@ def parse_ai_response(response: str) -> dict:
 
     return parsed_data
 
+
+def parsed_from_json(data: dict, schema: str) -> dict:
+    """Приводит JSON-ответ (stages, profile_summary, profile_references) к формату parse_ai_response."""
+    options = []
+    for item in data.get("references") or data.get("options") or []:
+        title = convert_markdown_links(clean_text(item["title"]))
+        description = convert_markdown_links(clean_text(item["description"]))
+        options.append({"short": title, "full": f"<b>{title}</b>: {description}" if description else title})
+    return {
+        "answer": convert_markdown_links(clean_text(data.get("tagline") or data.get("comment") or "")),
+        "description": convert_markdown_links(clean_text(data.get("description", ""))) if schema == "profile_summary" else "",
+        "options": options,
+    }
+
+
 # Обертка для вызова AI и парсинга ответа
-def get_parsed_response(prompt: str) -> dict:
+async def get_parsed_response(prompt: str, task: str = "stages", history: list[dict] | None = None,
+                              schema: str = "stages", options_count: int | None = None) -> dict:
     """
     Отправляет запрос к AI, логирует сырой ответ, парсит и возвращает результат.
+    В режиме JSON (STRUCTURED_OUTPUT_TASKS): ответ проверяется по схеме, при ошибке —
+    один повторный запрос на исправление, и только потом — старый текстовый парсер.
+    `schema` — что ожидается в ответе: stages, profile_summary (тэглайн + описание)
+    или profile_references (похожие проекты).
+    `options_count` — сколько вариантов запрошено: по нему считается лимит токенов ответа.
+    Если ответ обрезан по лимиту, последний (оборванный) вариант отбрасывается, когда остальных хватает для показа.
     """
-    response = ask_ai(prompt)
+    structured = structured_output.is_enabled(schema)
+    if structured:
+        prompt = structured_output.with_instructions(prompt, schema)
+
+    parsed_by_text: dict[str, tuple[dict | None, list[str]]] = {}
+
+    def parse(text: str) -> tuple[dict | None, list[str]]:
+        if text not in parsed_by_text:
+            if structured:
+                data, errors = structured_output.parse(text, schema)
+                parsed_by_text[text] = (parsed_from_json(data, schema) if data else None, errors)
+            else:
+                parsed_by_text[text] = (parse_ai_response(text), [])
+        return parsed_by_text[text]
+
+    def validate(text: str) -> bool:
+        parsed, _ = parse(text)
+        return parsed is not None and is_complete_response(parsed, schema)
+
+    response_format = structured_output.response_format() if structured else None
+    max_tokens = stage_max_tokens(options_count) if options_count else None
+    response, truncated = await request_ai(prompt, task, validate, response_format, history, max_tokens)
     logging.info(f"Сырой ответ от AI: {response}")
 
-    parsed = parse_ai_response(response)
+    parsed, errors = parse(response)
+    if structured:
+        if parsed is not None:
+            structured_output.record(schema, "ok")
+        elif response:
+            logging.warning(f"⚠️ Ответ AI не прошёл проверку схемы: {errors}")
+            repaired = await ask_ai(structured_output.repair_prompt(response, schema, errors), task=task,
+                                    response_format=response_format, max_tokens=max_tokens)
+            parsed, errors = parse(repaired)
+            if parsed is not None:
+                structured_output.record(schema, "repaired")
+
+        if parsed is None:
+            parsed = parse_ai_response(response)
+            structured_output.record(schema, "fallback" if is_complete_response(parsed, schema) else "failed")
+
+    if truncated and len(parsed["options"]) > config.STAGE_OPTIONS_COUNT:
+        parsed = {**parsed, "options": parsed["options"][:-1]}
+
     logging.info(f"Парсированный ответ: {parsed}")
 
-    return parsed
\ No newline at end of file
+    return parsed
+
+
+def is_complete_response(parsed: dict, schema: str = "stages") -> bool:
+    """Ответ годится для показа: есть нужное число вариантов (для профиля — тэглайн с описанием или примеры)."""
+    options = [o for o in parsed["options"] if o["short"] != "Ошибка"]
+    if schema == "profile_summary":
+        return bool(parsed["answer"] and parsed["description"])
+    if schema == "profile_references":
+        return bool(options)
+    return len(options) >= config.STAGE_OPTIONS_COUNT
@@ -0,0 +1,215 @@
+import hashlib
+import logging
+import random
+import re
+import time
+from collections import Counter, defaultdict
+
+from database.database import fetch_free_usernames
+from services import snapshots
+from services.name_combinator import STOP_WORDS
+
+import config
+
+
+# Кеш похожих идей: «кофейня», «Кофейня у дома», «кофейня!» — одна и та же тема.
+# Тема нормализуется (регистр, пунктуация, наивная лемматизация), похожие темы ищутся
+# через MinHash + LSH по символьным 3-граммам слов и проверяются точным коэффициентом Жаккара.
+# Для найденных тем отдаются имена, которые при прошлых генерациях были свободны
+# (перед показом они всё равно перепроверяются на Fragment).
+# Имена старше CONTEXT_CACHE_DAYS забываются, число тем ограничено CONTEXT_CACHE_MAX_TOPICS.
+
+NUM_PERM = 32
+BANDS = 8  # 8 полос по 4 значения подписи: кандидаты — темы, совпавшие хотя бы в одной полосе
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20250301)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+# Окончания, которые отрезаются при «лемматизации» (длинные — первыми)
+RU_ENDINGS = sorted([
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ая", "яя", "ое", "ее", "ые", "ие",
+    "ой", "ей", "ий", "ый", "ом", "ем", "ах", "ях", "ов", "ев", "ам", "ям", "ую", "юю", "ия", "ья", "ье",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+], key=len, reverse=True)
+MIN_STEM = 3
+
+_WORD = re.compile(r"[a-zа-я0-9]+")
+
+# нормализованная тема -> {"shingles": set, "names": {username: [style, когда было свободно]}, "categories": Counter}
+_clusters: dict[str, dict] = {}
+_buckets: dict[tuple[int, tuple], set[str]] = defaultdict(set)
+
+
+def lemmatize(word: str) -> str:
+    """Наивная лемматизация: отрезает типичное окончание, оставляя основу не короче MIN_STEM."""
+    if word.isascii():
+        return word[:-1] if len(word) > MIN_STEM + 1 and word.endswith("s") else word
+    for ending in RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def normalize(context: str) -> str:
+    """Ключ темы: леммы значимых слов без учёта порядка, регистра и пунктуации."""
+    words = _WORD.findall((context or "").lower().replace("ё", "е"))
+    lemmas = {lemmatize(w) for w in words if len(w) > 1 and w not in STOP_WORDS}
+    return " ".join(sorted(lemmas))
+
+
+def shingles(key: str) -> set[str]:
+    """Символьные 3-граммы каждого слова (с границами слова)."""
+    grams = set()
+    for word in key.split():
+        padded = f"#{word}#"
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def signature(grams: set[str]) -> tuple[int, ...]:
+    hashes = [int.from_bytes(hashlib.blake2b(g.encode(), digest_size=8).digest(), "big") for g in grams]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def _cluster(key: str) -> dict:
+    cluster = _clusters.get(key)
+    if cluster is None:
+        grams = shingles(key)
+        cluster = _clusters[key] = {"shingles": grams, "names": {}, "categories": Counter()}
+        if grams:
+            sig = signature(grams)
+            for band in range(BANDS):
+                _buckets[(band, sig[band * ROWS:(band + 1) * ROWS])].add(key)
+    return cluster
+
+
+def _drop(key: str):
+    cluster = _clusters.pop(key)
+    if cluster["shingles"]:
+        sig = signature(cluster["shingles"])
+        for band in range(BANDS):
+            bucket = (band, sig[band * ROWS:(band + 1) * ROWS])
+            _buckets[bucket].discard(key)
+            if not _buckets[bucket]:
+                del _buckets[bucket]
+
+
+def _cutoff() -> float:
+    return time.time() - config.CONTEXT_CACHE_DAYS * 86400
+
+
+def prune():
+    """Забывает имена старше CONTEXT_CACHE_DAYS и пустые темы; при переполнении — самые давние темы."""
+    cutoff = _cutoff()
+    for key, cluster in list(_clusters.items()):
+        names = cluster["names"]
+        for username in [u for u, (_, seen) in names.items() if seen < cutoff]:
+            del names[username]
+        if not names:
+            _drop(key)
+
+    excess = len(_clusters) - config.CONTEXT_CACHE_MAX_TOPICS
+    if excess > 0:
+        newest = {key: max(seen for _, seen in c["names"].values()) for key, c in _clusters.items()}
+        for key in sorted(newest, key=newest.get)[:excess]:
+            _drop(key)
+
+
+def _add(context: str, style: str | None, category: str | None, usernames: list[str], seen: float) -> bool:
+    key = normalize(context)
+    if not key or not usernames:
+        return False
+    cluster = _cluster(key)
+    for username in usernames:
+        cluster["names"][username] = [style or "", seen]
+    if category and category != "Неизвестно":
+        cluster["categories"][category] += len(usernames)
+    return True
+
+
+def remember(context: str, style: str | None, category: str | None, usernames: list[str]):
+    """Запоминает свободные имена темы."""
+    if _add(context, style, category, usernames, time.time()):
+        prune()
+
+
+def forget(usernames: list[str]):
+    """Убирает имена, которые при перепроверке оказались заняты."""
+    gone = {u.lower() for u in usernames}
+    if not gone:
+        return
+    for cluster in _clusters.values():
+        for username in [u for u in cluster["names"] if u.lower() in gone]:
+            del cluster["names"][username]
+
+
+def similar(context: str) -> list[tuple[float, str]]:
+    """Похожие темы (сходство, ключ) от самой похожей."""
+    key = normalize(context)
+    grams = shingles(key)
+    if not grams:
+        return []
+    sig = signature(grams)
+    keys = set()
+    for band in range(BANDS):
+        keys |= _buckets.get((band, sig[band * ROWS:(band + 1) * ROWS]), set())
+    scored = [(jaccard(grams, _clusters[k]["shingles"]), k) for k in keys]
+    return sorted((item for item in scored if item[0] >= config.CONTEXT_SIMILARITY), reverse=True)
+
+
+def candidates(context: str, style: str | None, limit: int, skip: set[str] | None = None) -> tuple[list[str], str | None]:
+    """
+    Свободные ранее имена из похожих тем (того же стиля) и самая частая категория этих тем.
+    """
+    skip = {u.lower() for u in (skip or ())}
+    cutoff = _cutoff()
+    names: list[str] = []
+    categories = Counter()
+    for score, key in similar(context):
+        cluster = _clusters[key]
+        categories.update(cluster["categories"])
+        for username, (name_style, seen) in cluster["names"].items():
+            if (name_style == (style or "") and seen >= cutoff
+                    and username.lower() not in skip and username not in names):
+                names.append(username)
+        if len(names) >= limit:
+            break
+
+    category = categories.most_common(1)[0][0] if categories else None
+    return names[:limit], category
+
+
+def _dump() -> dict:
+    return {key: {"names": c["names"], "categories": c["categories"]} for key, c in _clusters.items() if c["names"]}
+
+
+def _restore(clusters: dict):
+    now = time.time()
+    for key, saved in clusters.items():
+        cluster = _cluster(key)
+        for username, value in saved["names"].items():
+            # В снимках старого формата вместо [стиль, время] только стиль — считаем имя свежим
+            cluster["names"][username] = value if isinstance(value, list) else [value, now]
+        cluster["categories"].update(saved["categories"])
+    prune()
+
+
+snapshots.register("context_cache", _dump, _restore)
+
+
+async def load():
+    """Строит кеш по истории свободных имён из БД (за CONTEXT_CACHE_DAYS дней), если его нет в снимке."""
+    if snapshots.is_restored("context_cache"):
+        logging.info(f"♻️ Кеш похожих идей восстановлен из снимка: {len(_clusters)} тем")
+        return
+    rows = await fetch_free_usernames(config.CONTEXT_CACHE_DAYS)
+    for row in reversed(rows):  # Старые первыми: свежие имена окажутся в конце и перезапишут стиль
+        _add(row["context"], row["style"] if row["style"] not in (None, "None") else "", row["category"],
+             [row["username"]], row["created_at"].timestamp())
+    prune()
+    logging.info(f"♻️ Кеш похожих идей: {len(_clusters)} тем, {len(rows)} свободных имён из истории")
@@ -0,0 +1,45 @@
+import re
+
+from services import prompt_registry
+
+
+# Этапы проекта и профиль — одним диалогом с AI:
+# запрос этапа N = системное сообщение + краткая история этапов 1..N-1 + запрос этапа N.
+# В истории только суть: короткий вопрос этапа (bot/prompts/stage*_recap.txt) и выбор пользователя
+# (краткая формулировка варианта или свой ввод), без полного ответа AI со всеми вариантами —
+# иначе каждый следующий запрос пересылал бы всё, что было раньше, и входных токенов становилось больше.
+
+# Номер хода для финального профиля (после трёх этапов)
+PROFILE_TURN = 4
+
+
+def choice_text(choice) -> str:
+    """Текст выбора пользователя для запроса: вариант AI (словарь) или свой ввод."""
+    if isinstance(choice, dict):
+        return re.sub(r"<[^>]+>", "", choice.get("full") or choice.get("short", ""))
+    return str(choice or "")
+
+
+def choice_summary(choice) -> str:
+    """Краткий выбор для истории: заголовок варианта AI или свой ввод."""
+    if isinstance(choice, dict):
+        return re.sub(r"<[^>]+>", "", choice.get("short") or choice.get("full", ""))
+    return str(choice or "")
+
+
+def history(data: dict, stage: int) -> list[dict] | None:
+    """
+    Сообщения этапов 1..stage-1 для запроса этапа `stage`.
+    None — если на каком-то этапе нет выбора: тогда этап собирается полным самостоятельным запросом.
+    """
+    choices = [choice_summary(data.get(f"stage{previous}_choice")) for previous in range(1, stage)]
+    if not all(choices):
+        return None
+
+    messages = []
+    for previous, choice in enumerate(choices, start=1):
+        question = prompt_registry.render(f"stage{previous}_recap", context=data.get("context"),
+                                          username=data.get("username"))
+        messages.append({"role": "user", "content": question})
+        messages.append({"role": "assistant", "content": choice})
+    return messages
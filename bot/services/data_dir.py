@@ -0,0 +1,36 @@
+import json
+import logging
+import os
+
+import config
+
+
+def data_path(filename: str) -> str:
+    """Путь к файлу в папке постоянных данных (/data в Amvera)."""
+    os.makedirs(config.DATA_DIR, exist_ok=True)
+    return os.path.join(config.DATA_DIR, filename)
+
+
+def load_json(filename: str, default=None):
+    """Читает JSON из папки постоянных данных. Если файла нет или он повреждён — возвращает default."""
+    path = data_path(filename)
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except Exception as e:
+        logging.error(f"❌ Не удалось прочитать {path}: {e}")
+        return default
+
+
+def save_json(filename: str, data) -> None:
+    """Атомарно записывает компактный JSON в папку постоянных данных (через временный файл)."""
+    path = data_path(filename)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.error(f"❌ Не удалось записать {path}: {e}")
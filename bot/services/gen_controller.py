@@ -0,0 +1,112 @@
+import logging
+import math
+
+from services import snapshots
+
+import config
+
+
+# Адаптивный размер пакета генерации username.
+# Для каждой пары (категория, стиль) отслеживаем (EWMA):
+#   free_rate       — доля свободных среди проверенных имён от AI
+#   valid_rate      — доля валидных username среди запрошенных n
+#   tokens_per_name — сколько токенов ответа уходит на одно имя
+# и подбираем n и max_tokens так, чтобы одной попыткой набрать нужное число свободных имён.
+
+ALPHA = 0.3                 # Вес нового наблюдения в EWMA
+MIN_OBSERVATIONS = 3        # Сколько наблюдений метрики нужно, чтобы доверять ей на этом уровне
+CATEGORY_TOKENS = 10        # Токены на строку категории в ответе
+TOKEN_HEADROOM = 1.25       # Запас токенов, чтобы список не обрезался
+
+DEFAULTS = {"free_rate": 0.3, "valid_rate": 0.8, "tokens_per_name": 4.0}
+
+# (категория, стиль) -> {"free_rate": ..., "valid_rate": ..., "tokens_per_name": ...,
+#                       "observations": {метрика: число попыток, в которых она наблюдалась}}
+_stats: dict[tuple[str, str], dict] = {}
+
+
+def _restore(rows: list):
+    for category, style, stats in rows:
+        if not isinstance(stats.get("observations"), dict):
+            # Старый снимок: общий счётчик обновлений завышен — метрики накапливаются заново
+            stats["observations"] = {}
+        _stats[(category, style)] = stats
+
+
+snapshots.register("gen_controller", lambda: [[*key, stats] for key, stats in _stats.items()], _restore)
+
+
+def _levels(category: str | None, style: str | None) -> list[tuple[str, str]]:
+    """Ключи статистики от самого точного к самому общему."""
+    style = style or "-"
+    levels = [("*", style), ("*", "*")]
+    if category:
+        levels.insert(0, (category.lower(), style))
+    return levels
+
+
+def _update(key: tuple[str, str], metric: str, value: float):
+    """Одно наблюдение метрики (одна попытка) на уровне `key`."""
+    stats = _stats.setdefault(key, {**DEFAULTS, "observations": {}})
+    stats[metric] = (1 - ALPHA) * stats[metric] + ALPHA * value
+    stats["observations"][metric] = stats["observations"].get(metric, 0) + 1
+
+
+def _estimate(category: str | None, style: str | None) -> tuple[dict, set[str]]:
+    """
+    Оценка каждой метрики с самого точного уровня, где она наблюдалась не меньше MIN_OBSERVATIONS раз,
+    и множество метрик, которым можно доверять (остальные — DEFAULTS).
+    """
+    estimate, trusted = dict(DEFAULTS), set()
+    for metric in DEFAULTS:
+        for key in _levels(category, style):
+            stats = _stats.get(key)
+            if stats and stats["observations"].get(metric, 0) >= MIN_OBSERVATIONS:
+                estimate[metric] = stats[metric]
+                trusted.add(metric)
+                break
+    return estimate, trusted
+
+
+def plan(category: str | None, style: str | None, needed: int) -> tuple[int, int]:
+    """
+    Возвращает (n, max_tokens) для следующей попытки, чтобы в среднем получить `needed` свободных имён.
+    """
+    if not config.ADAPTIVE_BATCH:
+        return config.GENERATED_USERNAME_COUNT, config.MAX_TOKENS
+
+    stats, trusted = _estimate(category, style)
+    if not {"free_rate", "valid_rate"} <= trusted:
+        # Доли свободных/валидных ещё не набраны — размер пакета как раньше, но с достаточным запасом токенов
+        n = config.GENERATED_USERNAME_COUNT
+    else:
+        expected_free_per_name = max(stats["free_rate"] * stats["valid_rate"], 0.02)
+        n = math.ceil(max(needed, 1) / expected_free_per_name)
+        n = min(max(n, config.GEN_BATCH_MIN), config.GEN_BATCH_MAX)
+
+    max_tokens = math.ceil((CATEGORY_TOKENS + n * stats["tokens_per_name"]) * TOKEN_HEADROOM)
+    max_tokens = min(max(max_tokens, config.MAX_TOKENS), config.GEN_MAX_TOKENS_CAP)
+
+    logging.info(
+        f"🎛️ План попытки: n={n}, max_tokens={max_tokens} "
+        f"(free_rate={stats['free_rate']:.2f}, valid_rate={stats['valid_rate']:.2f}, "
+        f"tokens/имя={stats['tokens_per_name']:.1f})"
+    )
+    return n, max_tokens
+
+
+def record_generation(category: str | None, style: str | None, requested: int, valid: int,
+                      completion_tokens: int | None, returned: int):
+    """Запоминает, сколько валидных имён и токенов дал вызов AI."""
+    for key in _levels(category, style):
+        _update(key, "valid_rate", min(valid / max(requested, 1), 1.0))
+        if completion_tokens and returned:
+            _update(key, "tokens_per_name", completion_tokens / returned)
+
+
+def record_checks(category: str | None, style: str | None, checked: int, free: int):
+    """Запоминает, какая доля имён от AI оказалась свободной."""
+    if not checked:
+        return
+    for key in _levels(category, style):
+        _update(key, "free_rate", free / checked)
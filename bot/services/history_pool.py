@@ -0,0 +1,74 @@
+import logging
+from collections import deque
+
+from database.database import fetch_free_usernames
+from services import snapshots
+
+import config
+
+
+# Свободные ранее имена из истории генераций, сгруппированные по категории AI и стилю:
+# (категория, стиль) -> очередь username, самые свежие справа.
+# Выданные имена переносятся в начало очереди, чтобы разные пользователи получали разные имена.
+
+_index: dict[tuple[str, str], deque[str]] = {}
+
+
+def _key(category: str | None, style: str | None) -> tuple[str, str]:
+    return (category or "").strip().lower(), style if style not in (None, "None") else ""
+
+
+def is_known_category(category: str | None) -> bool:
+    return bool(category) and category not in ("Неизвестно", "Этический отказ")
+
+
+def add(category: str | None, style: str | None, usernames: list[str]):
+    """Добавляет свободные имена в группу категории и стиля (как самые свежие)."""
+    if not is_known_category(category) or not usernames:
+        return
+    queue = _index.setdefault(_key(category, style), deque(maxlen=config.HISTORY_POOL_SIZE))
+    for username in usernames:
+        if username in queue:
+            queue.remove(username)
+        queue.append(username)
+
+
+def candidates(category: str | None, style: str | None, limit: int, skip: set[str] | None = None) -> list[str]:
+    """Самые свежие свободные имена категории и стиля, кроме `skip`. Выданные уходят в конец очереди."""
+    queue = _index.get(_key(category, style))
+    if not queue or not is_known_category(category):
+        return []
+    skip = {u.lower() for u in (skip or ())}
+    names = [u for u in reversed(queue) if u.lower() not in skip][:limit]
+    for username in names:
+        queue.remove(username)
+        queue.appendleft(username)
+    return names
+
+
+def forget(usernames: list[str]):
+    """Убирает имена, которые при перепроверке оказались заняты."""
+    gone = {u.lower() for u in usernames}
+    if not gone:
+        return
+    for key, queue in _index.items():
+        _index[key] = deque((u for u in queue if u.lower() not in gone), maxlen=queue.maxlen)
+
+
+def _restore(groups: list):
+    for category, style, usernames in groups:
+        _index[(category, style)] = deque(usernames, maxlen=config.HISTORY_POOL_SIZE)
+
+
+snapshots.register("history_pool", lambda: [[*key, list(queue)] for key, queue in _index.items() if queue], _restore)
+
+
+async def load():
+    """Заполняет индекс свободными именами из БД за HISTORY_DAYS дней, если его нет в снимке."""
+    if snapshots.is_restored("history_pool"):
+        logging.info(f"🗂️ История свободных имён восстановлена из снимка: {len(_index)} групп категория/стиль")
+        return
+    rows = await fetch_free_usernames(config.HISTORY_DAYS)
+    for row in reversed(rows):  # Старые первыми — свежие окажутся справа
+        add(row["category"], row["style"], [row["username"]])
+    logging.info(f"🗂️ История свободных имён: {len(rows)} username в {len(_index)} группах категория/стиль")
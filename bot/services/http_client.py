@@ -0,0 +1,31 @@
+import asyncio
+import logging
+
+import aiohttp
+
+
+# Общая HTTP-сессия (пул keep-alive соединений) для внешних запросов, например к Fragment.
+# Раньше на каждую пачку проверок открывалась новая сессия с новыми TCP/TLS-рукопожатиями.
+
+_session: aiohttp.ClientSession | None = None
+_lock = asyncio.Lock()
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Возвращает общую сессию, создавая её при первом обращении."""
+    global _session
+    if _session is None or _session.closed:
+        async with _lock:
+            if _session is None or _session.closed:
+                _session = aiohttp.ClientSession()
+                logging.info("🌐 Общая HTTP-сессия создана.")
+    return _session
+
+
+async def close():
+    """Закрывает общую сессию (при остановке бота)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logging.info("✅ Общая HTTP-сессия закрыта.")
+    _session = None
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from services import metrics, snapshots, tracing
+
+import config
+
+
+# Пул готовых случайных идей. Каждый элемент:
+#   {"idea": str, "category": str, "usernames": [str, ...], "created_at": float}
+# Идея случайна и не зависит от пользователя, поэтому её (вместе с проверенными username)
+# можно подготовить заранее, а по кнопке «🎲 Получить случайную идею» только перепроверить имена.
+# Пул переживает перезапуск через общий снимок состояния (services/snapshots).
+
+_pool: deque[dict] = deque()
+_pool_low = asyncio.Event()
+_producer_task: asyncio.Task | None = None
+
+
+def _restore(bundles: list[dict]):
+    _pool.clear()
+    _pool.extend(bundles[:config.IDEA_POOL_SIZE])
+    logging.info(f"🎲 Пул случайных идей загружен: {len(_pool)}/{config.IDEA_POOL_SIZE}")
+
+
+snapshots.register("idea_pool", lambda: list(_pool), _restore, legacy_file="idea_pool.json")
+metrics.register_collector(lambda: [("idea_pool_size", {}, len(_pool))])
+
+
+async def produce_bundle() -> dict | None:
+    """Генерирует одну случайную идею и находит для неё свободные username."""
+    with tracing.trace("idea_pool.produce"):
+        return await _produce_bundle()
+
+
+async def _produce_bundle() -> dict | None:
+    # Генерация загружается в фоне при первой идее, а не при импорте роутеров
+    from services.brand_ask_ai import ask_ai
+    from services.name_gen import find_available_usernames
+
+    random_idea = (await ask_ai(config.RANDOM_IDEA_PROMPT, task="random_idea")).strip()
+    if not random_idea:
+        return None
+
+    usernames, category = await asyncio.wait_for(
+        find_available_usernames(random_idea, None, config.AVAILABLE_USERNAME_COUNT,
+                                 surplus=config.USERNAME_BUFFER_SIZE),
+        timeout=config.GEN_TIMEOUT
+    )
+    if len(usernames) < config.AVAILABLE_USERNAME_COUNT:
+        logging.warning(f"⚠️ Для идеи '{random_idea}' не нашлось {config.AVAILABLE_USERNAME_COUNT} свободных username.")
+        return None
+
+    return {"idea": random_idea, "category": category, "usernames": usernames, "created_at": time.time()}
+
+
+async def _producer_loop():
+    while True:
+        if len(_pool) >= config.IDEA_POOL_SIZE:
+            _pool_low.clear()
+            await _pool_low.wait()
+            continue
+
+        try:
+            bundle = await produce_bundle()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"❌ Ошибка фоновой генерации случайной идеи: {e}")
+            bundle = None
+
+        if bundle:
+            _pool.append(bundle)
+            logging.info(f"🎲 В пул добавлена идея '{bundle['idea']}' ({len(_pool)}/{config.IDEA_POOL_SIZE})")
+        else:
+            await asyncio.sleep(config.IDEA_POOL_RETRY_DELAY)
+
+
+def start_producer():
+    """Запускает фоновое пополнение пула (вызывается при старте бота)."""
+    global _producer_task
+    if _producer_task and not _producer_task.done():
+        return
+    _producer_task = asyncio.create_task(_producer_loop())
+
+
+async def stop_producer():
+    """Останавливает фоновое пополнение (пул сохранится в финальном снимке)."""
+    global _producer_task
+    if _producer_task:
+        _producer_task.cancel()
+        try:
+            await _producer_task
+        except asyncio.CancelledError:
+            pass
+        _producer_task = None
+
+
+async def take_bundle() -> dict | None:
+    """
+    Достаёт готовую идею из пула, предварительно перепроверив свободность её username.
+    Возвращает None, если в пуле нет идеи, у которой остались свободные имена,
+    или если перепроверка не удалась (идея остаётся в пуле, пользователь идёт обычным путём).
+    """
+    from services.name_check import check_multiple_usernames
+
+    while _pool:
+        bundle = _pool.popleft()
+        _pool_low.set()
+
+        try:
+            statuses = await check_multiple_usernames(bundle["usernames"], fresh=True)
+        except Exception as e:
+            logging.error(f"❌ Ошибка перепроверки username из пула: {e}")
+            _pool.appendleft(bundle)  # Идея не устарела — Fragment недоступен, вернём её позже
+            return None
+
+        free = [u for u in bundle["usernames"] if statuses.get(u) == "Свободно"]
+        if len(free) >= config.AVAILABLE_USERNAME_COUNT:
+            bundle["usernames"] = free
+            metrics.inc("cache_hits_total", cache="idea_pool")
+            logging.info(f"⚡ Случайная идея выдана из пула: '{bundle['idea']}' (осталось {len(_pool)})")
+            return bundle
+
+        logging.info(f"⚠️ Идея '{bundle['idea']}' из пула устарела: свободно {len(free)} username, пропускаем.")
+
+    return None
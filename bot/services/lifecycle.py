@@ -0,0 +1,54 @@
+import asyncio
+import logging
+import time
+
+from services import metrics
+
+
+# Координация остановки: после сигнала новые обновления не принимаются (вебхук отвечает 503,
+# Telegram повторит доставку уже новому экземпляру), а начатая работа — обработка обновлений
+# и фоновые задачи — дорабатывает до дедлайна. Что не успело — отменяется.
+
+_accepting = True
+_tasks: set[asyncio.Task] = set()
+
+metrics.register_collector(lambda: [("inflight_tasks", {}, sum(not task.done() for task in _tasks))])
+
+
+def is_accepting() -> bool:
+    return _accepting
+
+
+def track(task: asyncio.Task) -> asyncio.Task:
+    """Учитывает задачу как незавершённую работу, которую нужно дождаться при остановке."""
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def drain(timeout: float):
+    """Перестаёт принимать новую работу и ждёт текущую не дольше `timeout` секунд."""
+    global _accepting
+    _accepting = False
+
+    deadline = time.monotonic() + timeout
+    current = asyncio.current_task()
+    finished = 0
+
+    # Пока ждём, задачи могут порождать новые (например, фоновое дозаполнение буфера)
+    while True:
+        pending = {task for task in _tasks if task is not current and not task.done()}
+        remaining = deadline - time.monotonic()
+        if not pending or remaining <= 0:
+            break
+        logging.info(f"⏳ Дожидаемся завершения {len(pending)} задач (осталось {remaining:.1f} сек.)...")
+        done, _ = await asyncio.wait(pending, timeout=remaining)
+        finished += len(done)
+
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+        logging.warning(f"⚠️ Не успели к дедлайну, отменено задач: {len(pending)}")
+
+    logging.info(f"✅ Текущая работа завершена: {finished} задач, отменено {len(pending)}")
@@ -0,0 +1,470 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+
+from services import metrics, tracing
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+import config
+
+
+# Общий асинхронный клиент LLM.
+#
+# Маршрутизация: для каждой задачи (names, stages, profile, random_idea) задаётся список
+# эндпоинтов (провайдер + модель). Эндпоинты ранжируются по EWMA задержки и доли ошибок,
+# при ошибке или таймауте запрос уходит на следующий, а эндпоинт с серией ошибок
+# выключается «автоматом» (circuit breaker) на время CIRCUIT_COOLDOWN.
+#
+# Хеджирование: если ответ не пришёл за скользящий p90 задержек, отправляем дубликат
+# запроса на следующий по рейтингу эндпоинт и берём тот ответ, что придёт первым.
+
+load_dotenv()
+
+API_KEY = os.getenv("API_KEY")
+BASE_URL = os.getenv("BASE_URL")
+
+TASKS = ("names", "stages", "profile", "random_idea")
+TIERS = ("fast", "strong")  # Ступени каскада: дешёвая быстрая модель и сильная
+
+
+class CircuitOpenError(Exception):
+    """Эндпоинт (или все эндпоинты задачи) выключен circuit breaker'ом — вызов не отправлялся."""
+
+
+class Endpoint:
+    """Провайдер + модель со своей статистикой здоровья."""
+
+    def __init__(self, base_url: str | None, api_key: str | None, model: str):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.name = f"{model}@{urlparse(base_url).netloc if base_url else 'default'}"
+
+        self.latency_ewma: float | None = None
+        self.error_ewma = 0.0
+        self.consecutive_failures = 0
+        self.open_until = 0.0  # Пока time.monotonic() меньше — circuit breaker открыт
+        self.probing = False   # После паузы уже идёт пробный запрос (half-open)
+
+        self._client: "AsyncOpenAI | None" = None
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        if self._client is None:
+            from openai import AsyncOpenAI  # Тяжёлый импорт (~0.3 сек) — только при первом запросе к LLM
+            self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    def is_available(self, now: float) -> bool:
+        """Автомат закрыт, или пауза прошла и пробный запрос ещё никто не отправил."""
+        return now >= self.open_until and not self.probing
+
+    def acquire(self, now: float) -> bool:
+        """
+        Разрешение на вызов. После паузы пропускает ровно один пробный запрос:
+        до его результата остальные вызовы эндпоинт не получают.
+        Возвращает True, если этот вызов — пробный.
+        """
+        if not self.is_available(now):
+            raise CircuitOpenError(f"эндпоинт {self.name} выключен")
+        if self.open_until:
+            self.probing = True
+        return self.probing
+
+    def score(self) -> float:
+        """Чем меньше, тем лучше: ожидаемая задержка со штрафом за ошибки."""
+        latency = self.latency_ewma if self.latency_ewma is not None else config.HEDGE_DEFAULT_DELAY
+        return latency * (1 + config.ROUTER_ERROR_PENALTY * self.error_ewma)
+
+    def record_success(self, latency: float):
+        alpha = config.ROUTER_EWMA_ALPHA
+        self.latency_ewma = latency if self.latency_ewma is None else (1 - alpha) * self.latency_ewma + alpha * latency
+        self.error_ewma *= 1 - alpha
+        if self.open_until:
+            logging.info(f"🟢 Эндпоинт {self.name} снова работает")
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def record_failure(self):
+        alpha = config.ROUTER_EWMA_ALPHA
+        self.error_ewma = (1 - alpha) * self.error_ewma + alpha
+        self.consecutive_failures += 1
+        self.probing = False
+        if self.consecutive_failures >= config.CIRCUIT_FAILURE_THRESHOLD:
+            # После паузы эндпоинт получит один пробный запрос (half-open): успех закроет автомат,
+            # ошибка — выключит ещё на CIRCUIT_COOLDOWN
+            self.open_until = time.monotonic() + config.CIRCUIT_COOLDOWN
+            logging.warning(f"🔴 Эндпоинт {self.name} отключён на {config.CIRCUIT_COOLDOWN} сек "
+                            f"после {self.consecutive_failures} ошибок подряд")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+_endpoints: dict[str, Endpoint] = {}                    # Общие для всех задач: здоровье провайдера одно
+_routes: dict[tuple[str, str], list[Endpoint]] = {}     # (задача, ступень) -> эндпоинты
+
+# (задача, эндпоинт) -> последние задержки успешных вызовов, сек
+_latencies: dict[tuple[str, str], deque] = defaultdict(lambda: deque(maxlen=config.HEDGE_WINDOW))
+
+# задача -> последние вызовы: True, если по нему отправлялся дубль (для ограничения доли хеджей)
+_hedge_history: dict[str, deque] = defaultdict(lambda: deque(maxlen=config.HEDGE_WINDOW))
+
+# задача -> счётчики хеджирования: calls, hedged, hedge_won, hedge_lost
+hedge_stats: dict[str, dict[str, int]] = defaultdict(lambda: {"calls": 0, "hedged": 0, "hedge_won": 0, "hedge_lost": 0})
+
+# задача -> учёт токенов: calls, prompt_tokens, completion_tokens, cached_tokens (по response.usage)
+usage_stats: dict[str, dict[str, int]] = defaultdict(
+    lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+)
+
+# задача -> последние значения времени до первого токена (для потоковых вызовов), сек
+_ttft: dict[str, deque] = defaultdict(lambda: deque(maxlen=config.HEDGE_WINDOW))
+
+# (задача, ступень) -> счётчики каскада: calls (вызовы), accepted (ответ прошёл проверку), failed (ошибка вызова)
+cascade_stats: dict[tuple[str, str], dict[str, int]] = defaultdict(lambda: {"calls": 0, "accepted": 0, "failed": 0})
+
+# (задача, ступень) -> последние задержки ступени каскада, сек
+_tier_latencies: dict[tuple[str, str], deque] = defaultdict(lambda: deque(maxlen=config.HEDGE_WINDOW))
+
+
+def _endpoint(base_url: str | None, api_key: str | None, model: str) -> Endpoint:
+    endpoint = Endpoint(base_url, api_key, model)
+    return _endpoints.setdefault(f"{endpoint.name}|{api_key}", endpoint)
+
+
+def _default_model(task: str, tier: str = "strong") -> str | None:
+    if tier == "fast":
+        return config.MODEL_NAME_FAST if task == "names" else config.MODEL_BRAND_FAST
+    return config.MODEL_NAME if task == "names" else config.MODEL_BRAND
+
+
+def _load_routes():
+    """
+    Читает LLM_ENDPOINTS (JSON) вида
+        {"names": [{"base_url": "...", "api_key_env": "API_KEY_2", "model": "..."}], "stages:fast": [...], ...}
+    Ключ "<задача>:fast" — дешёвая быстрая ступень каскада.
+    Для задач без настройки — один эндпоинт из BASE_URL/API_KEY и MODEL_NAME/MODEL_BRAND
+    (для быстрой ступени — MODEL_NAME_FAST/MODEL_BRAND_FAST, если заданы).
+    """
+    configured = {}
+    if config.LLM_ENDPOINTS:
+        try:
+            configured = json.loads(config.LLM_ENDPOINTS)
+        except json.JSONDecodeError as e:
+            logging.error(f"❌ LLM_ENDPOINTS не является корректным JSON: {e}")
+
+    for task in TASKS:
+        for tier in TIERS:
+            key = task if tier == "strong" else f"{task}:{tier}"
+            default_model = _default_model(task, tier)
+            endpoints = [
+                _endpoint(
+                    item.get("base_url", BASE_URL),
+                    os.getenv(item["api_key_env"]) if item.get("api_key_env") else API_KEY,
+                    item.get("model") or default_model,
+                )
+                for item in configured.get(key, [])
+            ]
+            if not endpoints and (tier == "strong" or default_model):
+                endpoints = [_endpoint(BASE_URL, API_KEY, default_model)]
+            if endpoints:
+                _routes[(task, tier)] = endpoints
+                logging.info(f"🧭 LLM [{key}]: {', '.join(e.name for e in endpoints)}")
+
+
+def has_tier(task: str, tier: str) -> bool:
+    if not _routes:
+        _load_routes()
+    return (task, tier) in _routes
+
+
+def route(task: str, tier: str = "strong") -> list[Endpoint]:
+    """Доступные эндпоинты задачи от лучшего к худшему. Выключенные circuit breaker'ом не попадают."""
+    if not _routes:
+        _load_routes()
+    now = time.monotonic()
+    endpoints = _routes.get((task, tier)) or _routes[("stages", "strong")]
+    return sorted((e for e in endpoints if e.is_available(now)), key=Endpoint.score)
+
+
+def hedge_delay(task: str, endpoint: Endpoint) -> float:
+    """Скользящий p90 задержек (или значение по умолчанию, пока мало наблюдений)."""
+    samples = _latencies[(task, endpoint.name)]
+    if len(samples) < config.HEDGE_MIN_SAMPLES:
+        return config.HEDGE_DEFAULT_DELAY
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * 0.9), len(ordered) - 1)]
+
+
+def _hedge_allowed(task: str) -> bool:
+    history = _hedge_history[task]
+    return not history or sum(history) / len(history) < config.HEDGE_MAX_RATE
+
+
+def _hedge_target(endpoint: Endpoint, candidates: list[Endpoint]) -> Endpoint:
+    """Куда отправлять дубль: следующий по рейтингу эндпоинт, иначе запасная модель или тот же."""
+    if candidates:
+        return candidates[0]
+    if config.HEDGE_FALLBACK_MODEL:
+        return _endpoint(endpoint.base_url, endpoint.api_key, config.HEDGE_FALLBACK_MODEL)
+    return endpoint
+
+
+# Эндпоинты, отклонившие stream_options: для них поток запрашивается без учёта токенов
+_no_stream_usage: set[str] = set()
+
+
+async def _streamed_call(endpoint: Endpoint, started: float, **kwargs):
+    """
+    Потоковый вызов: собирает ответ в объект того же вида, что и обычный (choices/usage),
+    и замеряет время до первого токена (TTFT).
+    """
+    from openai import BadRequestError
+
+    create = endpoint.client.chat.completions.create
+    if endpoint.name in _no_stream_usage:
+        stream = await create(model=endpoint.model, stream=True, **kwargs)
+    else:
+        try:
+            stream = await create(model=endpoint.model, stream=True, stream_options={"include_usage": True}, **kwargs)
+        except BadRequestError as e:
+            logging.warning(f"⚠️ {endpoint.name} отклонил stream_options ({e}) — поток без учёта токенов")
+            _no_stream_usage.add(endpoint.name)
+            stream = await create(model=endpoint.model, stream=True, **kwargs)
+    parts, finish_reason, usage, ttft = [], None, None, None
+    async for chunk in stream:
+        if chunk.usage:
+            usage = chunk.usage
+        for choice in chunk.choices:
+            if choice.delta and choice.delta.content:
+                if ttft is None:
+                    ttft = time.monotonic() - started
+                parts.append(choice.delta.content)
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+
+    message = SimpleNamespace(content="".join(parts))
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)],
+                           usage=usage, ttft=ttft)
+
+
+async def _timed_call(task: str, endpoint: Endpoint, **kwargs):
+    started = time.monotonic()
+    probe = endpoint.acquire(started)
+    if task in config.STREAM_TASKS:
+        call = _streamed_call(endpoint, started, **kwargs)
+    else:
+        call = endpoint.client.chat.completions.create(model=endpoint.model, **kwargs)
+    try:
+        with tracing.span("llm.call", task=task, endpoint=endpoint.name):
+            response = await asyncio.wait_for(call, timeout=config.LLM_TIMEOUT)
+    except asyncio.CancelledError:
+        if probe:
+            endpoint.probing = False  # Пробный запрос отменён без результата — следующий вызов проверит снова
+        raise  # Проигравший в хедже — не ошибка эндпоинта
+    except Exception:
+        endpoint.record_failure()
+        metrics.inc("llm_errors_total", task=task, endpoint=endpoint.name)
+        raise
+
+    latency = time.monotonic() - started
+    metrics.observe("llm_call_seconds", latency, task=task, endpoint=endpoint.name)
+    endpoint.record_success(latency)
+    _latencies[(task, endpoint.name)].append(latency)
+    _record_usage(task, endpoint, response, latency)
+    response.endpoint = endpoint.name  # Кто на самом деле ответил (после переключений и каскада) — для истории
+    return response
+
+
+def _record_usage(task: str, endpoint: Endpoint, response, latency: float):
+    ttft = getattr(response, "ttft", None)
+    if ttft is not None:
+        _ttft[task].append(ttft)
+
+    usage = getattr(response, "usage", None)
+    if not usage:
+        if ttft is not None:
+            logging.info(f"🔢 [{task}] {endpoint.name}: первый токен через {ttft:.2f} сек, всего {latency:.1f} сек")
+        return
+    stats = usage_stats[task]
+    stats["calls"] += 1
+    stats["prompt_tokens"] += usage.prompt_tokens or 0
+    stats["completion_tokens"] += usage.completion_tokens or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    stats["cached_tokens"] += cached
+
+    timing = f"первый токен через {ttft:.2f} сек, всего {latency:.1f} сек" if ttft is not None else f"за {latency:.1f} сек"
+    logging.info(f"🔢 [{task}] {endpoint.name}: prompt {usage.prompt_tokens} (из кеша {cached}), "
+                 f"ответ {usage.completion_tokens} токенов, {timing} "
+                 f"(в среднем по задаче: prompt {stats['prompt_tokens'] // stats['calls']}, "
+                 f"ответ {stats['completion_tokens'] // stats['calls']})")
+
+
+async def _hedged_call(task: str, endpoint: Endpoint, backup: Endpoint, kwargs: dict):
+    stats = hedge_stats[task]
+
+    if not config.HEDGE_ENABLED:
+        _hedge_history[task].append(False)
+        return await _timed_call(task, endpoint, **kwargs)
+
+    delay = hedge_delay(task, endpoint)
+    primary = asyncio.create_task(_timed_call(task, endpoint, **kwargs))
+    hedge = None
+    # Отмена вызывающего (проигравшая попытка волны, таймаут, остановка бота) должна остановить
+    # и сами запросы к LLM — в том числе пока ждём задержку перед дублем
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+
+        if done or not _hedge_allowed(task) or not backup.is_available(time.monotonic()):
+            _hedge_history[task].append(False)
+            return await primary
+
+        logging.info(f"🪃 [{task}] {endpoint.name} не ответил за {delay:.1f} сек — дублируем запрос в {backup.name}")
+        _hedge_history[task].append(True)
+        stats["hedged"] += 1
+        hedge = asyncio.create_task(_timed_call(task, backup, **kwargs))
+
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Успешные ответы — первыми, на случай если оба пришли одновременно
+            for finished in sorted(done, key=lambda t: t.exception() is not None):
+                if finished.exception() is not None and pending:
+                    continue  # Упал один из двух — ждём второй
+                won = finished is hedge
+                stats["hedge_won" if won else "hedge_lost"] += 1
+                logging.info(f"🪃 [{task}] первым ответил {'дубль' if won else 'основной запрос'}")
+                return finished.result()
+    finally:
+        for unfinished in (primary, hedge):
+            if unfinished is not None and not unfinished.done():
+                unfinished.cancel()
+
+
+async def complete(task: str, messages: list[dict], max_tokens: int, temperature: float, tier: str = "strong",
+                   response_format: dict | None = None):
+    """
+    Вызов chat.completions для задачи `task` (names, stages, profile, random_idea):
+    лучший по рейтингу эндпоинт, хеджирование медленных ответов и переключение
+    на следующий эндпоинт при ошибке/таймауте (до LLM_MAX_FAILOVERS раз).
+    """
+    kwargs = {"messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+    if response_format:
+        kwargs["response_format"] = response_format
+    hedge_stats[task]["calls"] += 1
+
+    endpoints = route(task, tier)[:config.LLM_MAX_FAILOVERS + 1]
+    if not endpoints:
+        # Все эндпоинты выключены — отказываем сразу, не дожидаясь таймаута
+        raise CircuitOpenError(f"[{task}] все эндпоинты выключены circuit breaker'ом")
+    last_error = None
+    for i, endpoint in enumerate(endpoints):
+        backup = _hedge_target(endpoint, endpoints[i + 1:])
+        try:
+            return await _hedged_call(task, endpoint, backup, kwargs)
+        except Exception as e:
+            last_error = e
+            if i + 1 < len(endpoints):
+                logging.warning(f"⚠️ [{task}] {endpoint.name}: {e!r} — переключаемся на {endpoints[i + 1].name}")
+
+    raise last_error
+
+
+async def cascade(task: str, messages: list[dict], max_tokens: int, temperature: float,
+                  validate: Callable[[Any], bool], response_format: dict | None = None):
+    """
+    Каскад моделей: сначала быстрая дешёвая ступень, и только если её ответ не прошёл
+    `validate` (или вызов упал) — сильная модель. Без быстрой ступени — обычный complete.
+    """
+    if not (config.CASCADE_ENABLED and has_tier(task, "fast")):
+        return await complete(task, messages, max_tokens, temperature, response_format=response_format)
+
+    for tier in TIERS:
+        stats = cascade_stats[(task, tier)]
+        stats["calls"] += 1
+        started = time.monotonic()
+        try:
+            response = await complete(task, messages, max_tokens, temperature, tier=tier,
+                                      response_format=response_format)
+        except Exception as e:
+            stats["failed"] += 1
+            if tier == "strong":
+                raise
+            logging.warning(f"🪜 [{task}] быстрая модель недоступна ({e!r}) — переходим к сильной")
+            continue
+
+        _tier_latencies[(task, tier)].append(time.monotonic() - started)
+        if tier == "strong" or validate(response):
+            stats["accepted"] += 1
+            logging.info(f"🪜 [{task}] ответ принят на ступени {tier} ({_cascade_summary(task)})")
+            return response
+
+        logging.info(f"🪜 [{task}] ответ быстрой модели не прошёл проверку — эскалация")
+
+
+def _cascade_summary(task: str) -> str:
+    parts = []
+    for tier in TIERS:
+        stats = cascade_stats[(task, tier)]
+        samples = sorted(_tier_latencies[(task, tier)])
+        if not stats["calls"]:
+            continue
+        median = f"{samples[len(samples) // 2]:.1f}с" if samples else "—"
+        parts.append(f"{tier}: принято {stats['accepted']}/{stats['calls']}, p50 {median}")
+    return "; ".join(parts)
+
+
+def router_stats() -> list[dict]:
+    """Состояние эндпоинтов для логов и метрик."""
+    now = time.monotonic()
+    return [
+        {
+            "endpoint": e.name,
+            "latency_ewma": e.latency_ewma,
+            "error_ewma": e.error_ewma,
+            "circuit_open": now < e.open_until,
+        }
+        for e in _endpoints.values()
+    ]
+
+
+def _collect_metrics():
+    for task, stats in usage_stats.items():
+        for kind in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            yield "llm_tokens_total", {"task": task, "kind": kind}, stats[kind]
+    for task, stats in hedge_stats.items():
+        for outcome, value in stats.items():
+            yield "llm_hedges_total", {"task": task, "outcome": outcome}, value
+    for (task, tier), stats in cascade_stats.items():
+        for outcome, value in stats.items():
+            yield "llm_cascade_total", {"task": task, "tier": tier, "outcome": outcome}, value
+    for endpoint in router_stats():
+        labels = {"endpoint": endpoint["endpoint"]}
+        if endpoint["latency_ewma"] is not None:
+            yield "llm_endpoint_latency_ewma_seconds", labels, endpoint["latency_ewma"]
+        yield "llm_endpoint_error_ewma", labels, endpoint["error_ewma"]
+        yield "llm_endpoint_circuit_open", labels, int(endpoint["circuit_open"])
+
+
+metrics.register_collector(_collect_metrics)
+
+
+async def close():
+    """Закрывает HTTP-соединения всех клиентов (при остановке бота)."""
+    for endpoint in _endpoints.values():
+        await endpoint.close()
@@ -0,0 +1,151 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+
+# Метрики в текстовом формате Prometheus (отдаются на /metrics).
+# Гистограммы и счётчики накапливаются в памяти процесса; мгновенные значения (размеры очередей,
+# занятость пулов) и уже существующая статистика сервисов собираются коллекторами в момент запроса.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Каталог метрик: имя -> (тип, описание). Порядок = порядок вывода
+METRICS = {
+    # ⏱️ Задержки
+    "bot_update_seconds": ("histogram", "Обработка одного обновления Telegram"),
+    "llm_call_seconds": ("histogram", "Вызов LLM по задаче и эндпоинту (модель@хост)"),
+    "fragment_check_seconds": ("histogram", "Проверка одного username на Fragment"),
+    "db_write_seconds": ("histogram", "Запись в БД по операции"),
+    "brand_stage_seconds": ("histogram", "Получение вариантов этапа бренда и профиля проекта"),
+    "generation_seconds": ("histogram", "Поиск свободных username целиком"),
+    # 🔢 Счётчики
+    "bot_updates_total": ("counter", "Обновления Telegram по результату обработки"),
+    "generation_attempts_total": ("counter", "Попытки генерации username через LLM"),
+    "usernames_generated_total": ("counter", "Username, предложенные LLM"),
+    "usernames_free_total": ("counter", "Найденные свободные username"),
+    "usernames_saved_total": ("counter", "Результаты проверок, записанные в БД"),
+    "fragment_checks_total": ("counter", "Проверки на Fragment по статусу"),
+    "cache_hits_total": ("counter", "Попадания в кеши (без обращения к LLM/Fragment/БД)"),
+    "errors_total": ("counter", "Ошибки по компонентам"),
+    "llm_errors_total": ("counter", "Ошибки и таймауты вызовов LLM по задаче и эндпоинту"),
+    "llm_tokens_total": ("counter", "Токены LLM по задаче и виду"),
+    "llm_hedges_total": ("counter", "Вызовы LLM и дубли (хеджирование) по задаче"),
+    "llm_cascade_total": ("counter", "Вызовы ступеней каскада моделей по результату"),
+    "structured_parse_total": ("counter", "Разбор структурированных ответов по схеме и результату"),
+    "traces_exported_total": ("counter", "Сохранённые трассы по причине (медленная, ошибка, выборка)"),
+    # 📏 Мгновенные значения
+    "inflight_tasks": ("gauge", "Незавершённая работа: обработка обновлений и фоновые задачи"),
+    "generations_in_progress": ("gauge", "Идущие попытки генерации username"),
+    "buffer_refills_running": ("gauge", "Фоновые дозаполнения буферов сессий"),
+    "idea_pool_size": ("gauge", "Готовые случайные идеи в пуле"),
+    "availability_cache_size": ("gauge", "Записи в кеше проверок Fragment"),
+    "db_pool_connections": ("gauge", "Соединения пула БД по состоянию"),
+    "llm_endpoint_latency_ewma_seconds": ("gauge", "Сглаженная задержка эндпоинта LLM"),
+    "llm_endpoint_error_ewma": ("gauge", "Сглаженная доля ошибок эндпоинта LLM"),
+    "llm_endpoint_circuit_open": ("gauge", "1, если эндпоинт LLM временно выключен"),
+}
+
+_counters: dict[tuple[str, tuple], float] = {}
+_gauges: dict[tuple[str, tuple], float] = {}
+_histograms: dict[tuple[str, tuple], list] = {}  # -> [счётчики по корзинам, сумма, количество]
+
+# Коллекторы возвращают (имя, метки, значение) на момент запроса
+_collectors: list[Callable[[], Iterable[tuple[str, dict, float]]]] = []
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Увеличивает счётчик."""
+    key = (name, _labels(labels))
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def add_gauge(name: str, delta: float, **labels):
+    """Изменяет мгновенное значение на `delta` (например, +1 при входе, -1 при выходе)."""
+    key = (name, _labels(labels))
+    _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def observe(name: str, value: float, **labels):
+    """Добавляет наблюдение в гистограмму."""
+    key = (name, _labels(labels))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+    index = bisect.bisect_left(BUCKETS, value)
+    if index < len(BUCKETS):
+        histogram[0][index] += 1
+    histogram[1] += value
+    histogram[2] += 1
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Замеряет длительность блока (в том числе завершившегося ошибкой) в гистограмму `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def register_collector(collect: Callable[[], Iterable[tuple[str, dict, float]]]):
+    """Регистрирует функцию, которая при запросе /metrics отдаёт текущие значения."""
+    _collectors.append(collect)
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (
+        f'{key}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    collected: dict[str, list[tuple[tuple, float]]] = {}
+    for collect in _collectors:
+        try:
+            for name, labels, value in collect():
+                collected.setdefault(name, []).append((_labels(labels), value))
+        except Exception as e:
+            logging.error(f"❌ Ошибка сбора метрик: {e}")
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+
+        if kind == "histogram":
+            for (metric, labels), (buckets, total, count) in sorted(_histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, buckets):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels, (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            continue
+
+        stored = _counters if kind == "counter" else _gauges
+        samples = [(labels, value) for (metric, labels), value in stored.items() if metric == name]
+        samples += collected.get(name, [])
+        for labels, value in sorted(samples):
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
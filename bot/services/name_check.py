@@ -1,22 +1,91 @@
 import asyncio
 import logging
 import re
-import aiohttp
+import time
 import ssl
-from bs4 import BeautifulSoup
 from database.database import save_username_to_db  # Импорт здесь, чтобы избежать циклических импортов
+from services import http_client, metrics, snapshots, taken_filter, tracing
 
+import config
 
-async def check_multiple_usernames(usernames: list[str], save_to_db: bool = False) -> dict:
+# Кеш результатов проверки: username (в нижнем регистре) -> (статус, time.time() проверки)
+availability_cache: dict[str, tuple[str, float]] = {}
+
+# Статусы, которые можно переиспользовать (ошибку проверки — нельзя)
+CACHEABLE_STATUSES = ("Свободно", "Занято", "Продано", "Доступно для покупки")
+
+# При превышении размера из кеша вычищаются устаревшие записи
+AVAILABILITY_CACHE_MAX = 50000
+
+
+def _dump_availability() -> dict:
+    deadline = time.time() - config.AVAILABILITY_CACHE_TTL
+    return {u: [status, at] for u, (status, at) in availability_cache.items() if at >= deadline}
+
+
+def _restore_availability(entries: dict):
+    deadline = time.time() - config.AVAILABILITY_CACHE_TTL
+    availability_cache.update({u: (status, at) for u, (status, at) in entries.items() if at >= deadline})
+
+
+snapshots.register("availability_cache", _dump_availability, _restore_availability)
+metrics.register_collector(lambda: [("availability_cache_size", {}, len(availability_cache))])
+
+
+def cached_status(username: str) -> str | None:
+    """Статус из кеша, если проверка была не раньше AVAILABILITY_CACHE_TTL секунд назад."""
+    entry = availability_cache.get(username.lower())
+    if entry is None:
+        return None
+    status, checked_at = entry
+    if time.time() - checked_at > config.AVAILABILITY_CACHE_TTL:
+        del availability_cache[username.lower()]
+        return None
+    return status
+
+
+def prune_availability_cache():
+    """Удаляет устаревшие записи кеша проверок."""
+    deadline = time.time() - config.AVAILABILITY_CACHE_TTL
+    for key in [key for key, (_, checked_at) in availability_cache.items() if checked_at < deadline]:
+        del availability_cache[key]
+
+
+async def check_multiple_usernames(usernames: list[str], save_to_db: bool = False, fresh: bool = False) -> dict:
     """
     Проверяет список username параллельно.
+    Свежие результаты (не старше AVAILABILITY_CACHE_TTL) берутся из кеша без запроса к Fragment.
+    fresh=True — перепроверка перед показом (пул идей, похожие темы, история): кеш не читается, только обновляется.
     Возвращает словарь {username: статус}.
     """
-    async with aiohttp.ClientSession() as session:
-        tasks = [check_username_via_fragment(session, username) for username in usernames]
+    availability = {}
+    to_check = []
+    for username in usernames:
+        status = None if fresh else cached_status(username)
+        if status is None:
+            to_check.append(username)
+        else:
+            availability[username] = status
+    if availability:
+        logging.info(f"🗃️ Статус из кеша проверок: {len(availability)} username")
+        metrics.inc("cache_hits_total", len(availability), cache="availability")
+
+    if to_check:
+        session = await http_client.get_session()
+        tasks = [check_username_via_fragment(session, username) for username in to_check]
         results = await asyncio.gather(*tasks)
 
-    availability = dict(zip(usernames, results))
+        now = time.time()
+        for username, status in zip(to_check, results):
+            availability[username] = status
+            metrics.inc("fragment_checks_total", status=status)
+            if status in CACHEABLE_STATUSES:
+                availability_cache[username.lower()] = (status, now)
+        if len(availability_cache) > AVAILABILITY_CACHE_MAX:
+            prune_availability_cache()
+
+    availability = {username: availability[username] for username in usernames}  # Исходный порядок
+    taken_filter.add_check_results(availability)  # 🧮 Запоминаем занятые имена
 
     if save_to_db: # если запущена не генерация, а отдельная проверка
         tasks = [
@@ -28,37 +97,48 @@ async def check_multiple_usernames(usernames: list[str], save_to_db: bool = Fals
 
     return availability
 
-async def check_username_via_fragment(session, username: str) -> str:
-    """Проверка статуса через Fragment. Анализирует редирект и 'Unavailable'."""
+_fragment_ssl: ssl.SSLContext | None = None
+
+
+def _ssl_context() -> ssl.SSLContext:
+    """SSL-контекст без проверки сертификата — создаётся один раз, а не на каждый запрос."""
+    global _fragment_ssl
+    if _fragment_ssl is None:
+        _fragment_ssl = ssl.create_default_context()
+        _fragment_ssl.check_hostname = False
+        _fragment_ssl.verify_mode = ssl.CERT_NONE
+    return _fragment_ssl
 
-    # 🔥 Добавляем инициализацию SSL-контекста прямо в функцию
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
 
+@tracing.traced("fragment.check", "username", result_attribute="status")
+async def check_username_via_fragment(session, username: str) -> str:
+    """Проверка статуса через Fragment. Анализирует редирект и 'Unavailable'."""
     url_username = f"https://fragment.com/username/{username}"
     url_query = f"https://fragment.com/?query={username}"
 
     logging.info(f"[CHECK] 🔎 Проверяем final=query. if true > свободно @{username}")
 
     try:
-        async with session.get(url_username, ssl=ssl_context, allow_redirects=True) as response:
-            final_url = str(response.url)
+        with metrics.timer("fragment_check_seconds"):
+            async with session.get(url_username, ssl=_ssl_context(), allow_redirects=True) as response:
+                final_url = str(response.url)
 
-            if final_url == url_query:
-                logging.info(f"[RESULT]🔹 @{username} свободно.")
-                return "Свободно"
+                if final_url == url_query:
+                    logging.info(f"[RESULT]🔹 @{username} свободно.")
+                    return "Свободно"
 
-            html = await response.text()
-            return await analyze_username_page(html, username)
+                html = await response.text()
+                return await analyze_username_page(html, username)
 
     except Exception as e:
+        metrics.inc("errors_total", component="fragment")
         print(f"[ERROR] ❗ Ошибка запроса @{username}: {e}")
         return "Невозможно определить"
 
 
 async def analyze_username_page(html: str, username: str) -> str:
     """Анализирует страницу конкретного username на Fragment."""
+    from bs4 import BeautifulSoup  # Ленивый импорт: нужен только для занятых имён
     soup = BeautifulSoup(html, 'html.parser')
 
     status_element = soup.find("span", class_="tm-section-header-status")
@@ -0,0 +1,110 @@
+import re
+from itertools import islice
+from typing import Iterable, Iterator
+
+from services.name_check import is_valid_username
+
+
+# Локальный генератор кандидатов: без LLM собирает username из морфем,
+# извлечённых из категории, темы и первых предложений AI.
+
+TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh", "з": "z",
+    "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+}
+
+PREFIXES = ["my", "the", "go", "get", "try", "hey", "pro", "neo"]
+SUFFIXES = ["hub", "lab", "ly", "ify", "io", "hq", "club", "space", "way", "zone", "nest", "craft"]
+
+# Служебные слова темы, из которых не получаются осмысленные имена
+STOP_WORDS = {
+    "для", "про", "как", "что", "это", "или", "все", "где", "под", "над", "без", "при",
+    "the", "and", "for", "with", "bot",
+}
+
+MIN_MORPHEME_LENGTH = 3
+MAX_MORPHEME_LENGTH = 12
+
+
+def transliterate(text: str) -> str:
+    """Переводит кириллицу в латиницу (упрощённая транслитерация)."""
+    return "".join(TRANSLIT.get(ch, ch) for ch in text.lower())
+
+
+def split_morphemes(username: str) -> list[str]:
+    """Разбивает username на части по подчёркиваниям, цифрам и CamelCase."""
+    parts = re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])", username)
+    return [p.lower() for p in parts]
+
+
+def extract_morphemes(context: str, category: str, suggestions: Iterable[str]) -> list[str]:
+    """
+    Собирает морфемы: сначала из предложений AI (они уже «звучат»),
+    затем транслитерированные слова категории и темы. Порядок = приоритет.
+    """
+    morphemes: list[str] = []
+
+    def add(word: str):
+        word = word.lower()
+        if MIN_MORPHEME_LENGTH <= len(word) <= MAX_MORPHEME_LENGTH and word not in STOP_WORDS and word not in morphemes:
+            morphemes.append(word)
+
+    for username in suggestions:
+        for part in split_morphemes(username):
+            add(part)
+
+    for text in (category, context):
+        for word in re.findall(r"[a-zA-Zа-яА-ЯёЁ]+", text or ""):
+            if word.lower() in STOP_WORDS:
+                continue
+            add(re.sub(r"[^a-z]", "", transliterate(word)))
+
+    return morphemes
+
+
+def round_robin(*streams: Iterable[str]) -> Iterator[str]:
+    """Поочерёдно берёт по одному элементу из каждого потока, чтобы кандидаты были разнообразнее."""
+    iterators = [iter(stream) for stream in streams]
+    while iterators:
+        for it in list(iterators):
+            try:
+                yield next(it)
+            except StopIteration:
+                iterators.remove(it)
+
+
+def generate_candidates(morphemes: list[str]) -> Iterator[str]:
+    """
+    Дешёвый поток кандидатов: сочетания двух морфем, морфема + суффикс, префикс + морфема.
+    Правила чередуются, внутри правила морфемы идут по приоритету.
+    Все кандидаты проходят is_valid_username, дубликаты отброшены.
+    """
+    seen: set[str] = set()
+
+    # Пары с меньшей суммой индексов (более приоритетные морфемы) идут первыми
+    pairs = sorted(
+        ((i, j) for i in range(len(morphemes)) for j in range(len(morphemes)) if i != j),
+        key=lambda pair: (pair[0] + pair[1], pair[0])
+    )
+    compounds = (f"{morphemes[i]}{morphemes[j]}" for i, j in pairs)
+    separated = (f"{morphemes[i]}_{morphemes[j]}" for i, j in pairs)
+    suffixed = (f"{morph}{suffix}" for suffix in SUFFIXES for morph in morphemes)
+    prefixed = (f"{prefix}{morph}" for prefix in PREFIXES for morph in morphemes)
+
+    for candidate in round_robin(compounds, suffixed, prefixed, separated, iter(morphemes)):
+        key = candidate.lower()
+        if key in seen or not is_valid_username(candidate):
+            continue
+        seen.add(key)
+        yield candidate
+
+
+def local_candidates(context: str, category: str, suggestions: Iterable[str], limit: int,
+                     skip: set[str] | None = None) -> list[str]:
+    """Возвращает до `limit` локальных кандидатов, пропуская уже проверенные (`skip`)."""
+    skip = {u.lower() for u in (skip or ())}
+    morphemes = extract_morphemes(context, category, suggestions)
+    stream = (c for c in generate_candidates(morphemes) if c.lower() not in skip)
+    return list(islice(stream, limit))
@@ -0,0 +1,88 @@
+from collections import Counter, defaultdict
+
+import config
+
+
+# Схлопывание почти одинаковых кандидатов до проверки на Fragment.
+# AI часто выдаёт brightmind / bright_mind / BrightMind / brightmindbot — на каждый
+# уходил бы отдельный запрос, хотя для пользователя это одно и то же имя.
+
+MIN_SIMILARITY_LENGTH = 6  # Короткие имена сравниваем только по канонической форме
+
+
+def canonical(username: str) -> str:
+    """Каноническая форма: без регистра, подчёркиваний и суффикса bot."""
+    key = username.lower().replace("_", "")
+    if key.endswith("bot") and len(key) - 3 >= 5:
+        key = key[:-3]
+    return key
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"^{text}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Левенштейна с отсечкой: всё, что больше `limit`, возвращается как limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ch_a in enumerate(a, start=1):
+        current = [i]
+        for j, ch_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ch_a != ch_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+class CandidateIndex:
+    """
+    Индекс уже проверенных/отобранных кандидатов: каноническая форма + триграммы
+    для быстрого поиска соседей по расстоянию Левенштейна.
+    """
+
+    def __init__(self, max_distance: int = config.NEAR_DUPLICATE_DISTANCE):
+        self.max_distance = max_distance
+        self._keys: Counter[str] = Counter()  # Каноническая форма -> сколько добавленных имён её дали
+        self._by_gram: dict[str, set[str]] = defaultdict(set)
+
+    def find_duplicate(self, username: str) -> str | None:
+        """Возвращает каноническую форму уже известного «почти такого же» имени или None."""
+        key = canonical(username)
+        if key in self._keys:
+            return key
+        if self.max_distance <= 0 or len(key) < MIN_SIMILARITY_LENGTH:
+            return None
+
+        neighbours = set()
+        for gram in _trigrams(key):
+            neighbours |= self._by_gram.get(gram, set())
+        for other in neighbours:
+            if len(other) >= MIN_SIMILARITY_LENGTH and edit_distance(key, other, self.max_distance) <= self.max_distance:
+                return other
+        return None
+
+    def add(self, username: str, force: bool = False) -> bool:
+        """
+        Запоминает имя. Возвращает False, если это дубликат уже известного (и force=False).
+        """
+        if not force and self.find_duplicate(username) is not None:
+            return False
+        key = canonical(username)
+        self._keys[key] += 1
+        for gram in _trigrams(key):
+            self._by_gram[gram].add(key)
+        return True
+
+    def discard(self, username: str):
+        """Забывает имя, добавленное через add() (например, кандидата, которого так и не проверили)."""
+        key = canonical(username)
+        if self._keys[key] > 1:
+            self._keys[key] -= 1
+            return
+        self._keys.pop(key, None)
+        for gram in _trigrams(key):
+            self._by_gram[gram].discard(key)
@@ -1,7 +1,4 @@
 from aiogram import Bot
-from openai import OpenAI
-from dotenv import load_dotenv
-import os
 import logging
 import asyncio
 from typing import List
@@ -10,22 +7,31 @@ from datetime import datetime
 
 from database.database import save_username_to_db
 from services.name_check import check_multiple_usernames, is_valid_username  # Проверка username
+from services import (availability_model, context_cache, gen_controller, history_pool, llm_client, metrics,
+                      structured_output, taken_filter, tracing)
+from services.name_combinator import local_candidates
+from services.name_mutations import expand_taken
+from services.name_dedup import CandidateIndex
 
 
 import config
 
 
-# Загрузка переменных окружения и настройка логирования
-load_dotenv()
 
-# Получение ключей API из окружения
-API_KEY = os.getenv("API_KEY")
-BASE_URL = os.getenv("BASE_URL")
 
-# Создание клиента OpenAI для генерации username
-client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+# Глобальный лимит одновременных вызовов AI для генерации username (на всех пользователей)
+_generation_slots = asyncio.Semaphore(config.GEN_FANOUT_GLOBAL_LIMIT)
 
+# Подсказки, разводящие параллельные попытки одной волны по разным направлениям
+FANOUT_HINTS = [
+    "",
+    "Сделай акцент на коротких и звучных словах.",
+    "Используй неожиданные сочетания слов и метафоры.",
+    "Попробуй игру слов и слияния двух слов в одно.",
+]
 
+# Статусы, при которых занятое имя AI стоит превратить в близкие варианты
+MUTABLE_STATUSES = ("Занято", "Продано")
 
 REJECTION_PATTERNS = [
     r"не могу",
@@ -48,12 +54,16 @@ def is_rejection_response(usernames: List[str]) -> bool:
     return False
 
 
-async def generate_username_list(context: str, style: str | None, n: int = config.GENERATED_USERNAME_COUNT) -> tuple[list[str], str]:
+@tracing.traced("names.generate", "n", "max_tokens", "temperature")
+async def generate_username_list(context: str, style: str | None, n: int = config.GENERATED_USERNAME_COUNT,
+                                 max_tokens: int = config.MAX_TOKENS, temperature: float = config.TEMPERATURE_NAME,
+                                 hint: str = "") -> tuple[list[str], str, str]:
     """
     Генерирует `n` username на основе контекста и стиля (если стиль указан).
-    Возвращает список username (или текст отказа) и категорию.
+    `hint` — дополнительная подсказка для разнообразия параллельных вызовов.
+    Возвращает список username (или текст отказа), категорию и эндпоинт LLM, который дал ответ.
     """
-    logging.info(f"🔄 Генерация username: context='{context}', style='{style}', n={n}")
+    logging.info(f"🔄 Генерация username: context='{context}', style='{style}', n={n}, max_tokens={max_tokens}, t={temperature}")
 
     if style:
         prompt = config.PROMPT_WITH_STYLE.format(n=n, context=context, style=style)
@@ -62,77 +72,283 @@ async def generate_username_list(context: str, style: str | None, n: int = confi
         prompt = config.PROMPT_NO_STYLE.format(n=n, context=context)
         prompt_type = "NO STYLE"
 
-    response = client.chat.completions.create(
-        model=config.MODEL_NAME,
+    if hint:
+        prompt += f"\n{hint}"
+
+    structured = structured_output.is_enabled("names")
+    if structured:
+        prompt = structured_output.with_instructions(prompt, "names")
+
+    def validate(response) -> bool:
+        # Быстрая модель справилась, если хотя бы половина имён прошла is_valid_username
+        if not (response.choices and response.choices[0].message.content):
+            return False
+        usernames, category = parse_generation(response.choices[0].message.content.strip(),
+                                               response.choices[0].finish_reason == "length", structured)
+        return category != "Этический отказ" and len(usernames) >= max(1, n // 2)
+
+    response = await llm_client.cascade(
+        "names",
         messages=[{"role": "user", "content": prompt}],
-        max_tokens=config.MAX_TOKENS,
-        temperature=config.TEMPERATURE_NAME,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        validate=validate,
+        response_format=structured_output.response_format() if structured else None,
     )
 
     logging.debug(f"API Response: {response}")
+    llm = getattr(response, "endpoint", None) or config.MODEL_NAME
 
     if response.choices and response.choices[0].message and response.choices[0].message.content:
         response_text = response.choices[0].message.content.strip()
-        logging.info(f"📝 Полный ответ AI: {response_text}")
+        truncated = response.choices[0].finish_reason == "length"
+        logging.info(f"📝 Полный ответ AI{' (обрезан по max_tokens)' if truncated else ''}: {response_text}")
 
-        lines = [line.strip() for line in response_text.split("\n") if line.strip()]
+        valid_usernames, category = parse_generation(response_text, truncated, structured, record=True)
 
-        if len(lines) < 2:
-            logging.warning("⚠️ API не вернул категорию, берем 'Неизвестно'")
-            category = "Неизвестно"
-            usernames_raw = lines[0] if lines else ""
-        else:
-            category = lines[0].replace("Категория:", "").strip()
-            usernames_raw = lines[1]
+        if category == "Этический отказ":
+            return valid_usernames, category, llm
 
-        raw_usernames = [u.strip() for u in usernames_raw.split(",")]
+        completion_tokens = response.usage.completion_tokens if response.usage else None
+        gen_controller.record_generation(category, style, requested=n, valid=len(valid_usernames),
+                                         completion_tokens=completion_tokens, returned=len(valid_usernames))
 
-        # Проверка на текстовый отказ по этическим соображениям
-        if is_rejection_response(raw_usernames):
-            logging.warning("❌ AI вернул текст отказа по этическим соображениям.")
-            return raw_usernames, "Этический отказ"
+        return valid_usernames, category, llm
 
-        # Фильтрация только валидных username
-        valid_usernames = [username for username in raw_usernames if is_valid_username(username)]
-        logging.info(f"✅ категория: {category}, сгенерировано username: {len(valid_usernames)}")
+    else:
+        logging.warning("⚠️ API не вернул корректные данные.")
+        return [], "Неизвестно", llm
 
-        return valid_usernames, category
 
+def parse_generation(response_text: str, truncated: bool, structured: bool,
+                     record: bool = False) -> tuple[list[str], str]:
+    """
+    Разбирает ответ AI с username. В режиме JSON — по схеме, при оборванном/битом JSON
+    достаёт имена из кавычек, а если не вышло — отдаёт текст старому парсеру.
+    Отдельного запроса на исправление не делаем: следующая попытка генерации дешевле.
+    """
+    if not structured:
+        return parse_username_response(response_text, truncated)
+
+    data, errors = structured_output.parse(response_text, "names")
+    if data is not None:
+        usernames = [u.strip().lstrip("@") for u in data["usernames"] if isinstance(u, str)]
+        outcome, category = "ok", data["category"].strip() or "Неизвестно"
+        if is_rejection_response(usernames):
+            return usernames, "Этический отказ"
     else:
-        logging.warning("⚠️ API не вернул корректные данные.")
-        return [], "Неизвестно"
+        usernames = structured_output.salvage_usernames(response_text)
+        if not usernames:
+            if record:
+                structured_output.record("names", "failed")
+            logging.warning(f"⚠️ Ответ AI не прошёл проверку схемы: {errors}")
+            return parse_username_response(response_text, truncated)
+        match = re.search(r'"category"\s*:\s*"([^"]*)"', response_text)
+        outcome, category = "fallback", match.group(1) if match else "Неизвестно"
+
+    if record:
+        structured_output.record("names", outcome)
+    valid_usernames = [username for username in usernames if is_valid_username(username)]
+    logging.info(f"✅ категория: {category}, сгенерировано username: {len(valid_usernames)}")
+    return valid_usernames, category
+
+
+def parse_username_response(response_text: str, truncated: bool = False) -> tuple[list[str], str]:
+    """
+    Разбирает ответ AI: первая строка — категория, дальше username через запятую.
+    Спасает что можно из нестандартных ответов: имена на нескольких строках, нумерация, «@»,
+    а при обрыве по max_tokens отбрасывает последний (недописанный) элемент.
+    """
+    lines = [line.strip() for line in response_text.split("\n") if line.strip()]
+
+    if len(lines) < 2:
+        logging.warning("⚠️ API не вернул категорию, берем 'Неизвестно'")
+        category = "Неизвестно"
+        usernames_raw = lines[0] if lines else ""
+    else:
+        category = lines[0].replace("Категория:", "").strip()
+        usernames_raw = "\n".join(lines[1:])
+
+    raw_usernames = [re.sub(r"^(\d+[.)]|[-•*])\s*", "", u.strip()).lstrip("@").strip()
+                     for u in re.split(r"[,\n]", usernames_raw)]
+    raw_usernames = [u for u in raw_usernames if u]
+
+    # Проверка на текстовый отказ по этическим соображениям
+    if is_rejection_response(raw_usernames):
+        logging.warning("❌ AI вернул текст отказа по этическим соображениям.")
+        return raw_usernames, "Этический отказ"
+
+    if truncated and raw_usernames and not usernames_raw.rstrip().endswith(","):
+        dropped = raw_usernames.pop()
+        logging.info(f"✂️ Ответ обрезан, отбрасываем недописанный username: '{dropped}'")
+
+    # Фильтрация только валидных username
+    valid_usernames = [username for username in raw_usernames if is_valid_username(username)]
+    logging.info(f"✅ категория: {category}, сгенерировано username: {len(valid_usernames)}")
+
+    return valid_usernames, category
 
 
 
-async def gen_process_and_check(bot: Bot, context: str, style: str | None, n: int = config.AVAILABLE_USERNAME_COUNT) -> list[str]:
+async def gen_process_and_check(bot: Bot, context: str, style: str | None, n: int = config.AVAILABLE_USERNAME_COUNT,
+                                surplus: int = 0, exclude: set[str] | None = None) -> list[str]:
+    """
+    Ищет `n` свободных username. Свободные имена сверх `n`, найденные в той же проверке,
+    не выбрасываются, а возвращаются в хвосте списка (до `surplus` штук) — для буфера сессии.
+    Имена из `exclude` (уже показанные пользователю) повторно не проверяются.
+    """
+    usernames, _ = await find_available_usernames(context, style, n, surplus=surplus, exclude=exclude)
+    return usernames
+
+
+@tracing.traced("names.search", "n", "style")
+async def find_available_usernames(context: str, style: str | None, n: int = config.AVAILABLE_USERNAME_COUNT,
+                                   surplus: int = 0, exclude: set[str] | None = None) -> tuple[list[str], str]:
+    """
+    То же, что gen_process_and_check, но дополнительно возвращает категорию темы от AI.
+    """
     logging.info(f"🔎 Поиск {n} доступных username для контекста: '{context}' со стилем: '{style}'")
 
-    available_usernames = set()
-    checked_usernames = set()
+    available_usernames = []
+    checked_usernames = set(exclude or ())
+    candidate_index = CandidateIndex()  # Нормализованные формы всех кандидатов этой генерации
+    for username in checked_usernames:
+        candidate_index.add(username, force=True)
+    llm_suggestions = []  # Все валидные имена от AI — сырьё для локального генератора
+    category = "Неизвестно"
     attempts = 0
     empty_responses = 0
+    history_categories = set()  # Категории, для которых история уже перепроверена
 
     # 📦 Новые метрики
     total_generated = 0  # Всего сгенерировано username
+    total_cached = 0      # Перепроверено имён из похожих тем
+    total_history = 0     # Перепроверено имён из истории той же категории
+    total_local = 0       # Проверено локальных кандидатов
+    total_mutations = 0   # Проверено мутаций занятых имён
+    total_duplicates = 0  # Схлопнуто почти одинаковых кандидатов
     total_free = 0        # Свободные username
     total_saved = 0       # Добавленные в БД username
 
     start_time = datetime.now()  # Засекаем время начала генерации
 
-    while len(available_usernames) < n and attempts < config.GEN_ATTEMPTS:
-        attempts += 1
-        logging.info(f"🔄 Попытка {attempts}/{config.GEN_ATTEMPTS}")
+    async def check_round(candidates: list[str], llm: str, dedupe: bool = True, learn: bool = False,
+                          recheck: bool = False) -> list[str]:
+        """
+        Проверяет кандидатов на Fragment, собирает свободные и сохраняет результаты в БД.
+        Почти одинаковые имена (регистр, подчёркивания, суффикс bot, опечатка) схлопываются —
+        и внутри пакета, и с кандидатами прошлых попыток. Мутации (dedupe=False) близки
+        к оригиналу намеренно, поэтому только запоминаются в индексе.
+        learn=True — раунд имён от AI: его доля свободных идёт в статистику gen_controller.
+        recheck=True — перепроверка имён, свободных в прошлом (похожие темы, история): мимо кеша проверок.
+        Возвращает занятые/проданные имена (включая отсеянные фильтром) — для мутаций.
+        """
+        nonlocal total_free, total_saved, total_duplicates
+
+        fresh = []
+        duplicates = []
+        for u in candidates:
+            if u in checked_usernames or not is_valid_username(u):
+                continue
+            if not candidate_index.add(u, force=not dedupe):
+                duplicates.append(u)
+                continue
+            fresh.append(u)
+
+        if duplicates:
+            total_duplicates += len(duplicates)
+            logging.info(f"🧹 Схлопнуто почти одинаковых username: {len(duplicates)} ({', '.join(duplicates)})")
+
+        checked_usernames.update(fresh)
+
+        # 🧮 Не тратим запросы к Fragment на имена, которые уже встречались занятыми
+        known_taken = [u for u in fresh if taken_filter.is_known_taken(u)]
+        if known_taken:
+            logging.info(f"🧮 Пропущено заведомо занятых username: {len(known_taken)} ({', '.join(known_taken)})")
+            metrics.inc("cache_hits_total", len(known_taken), cache="taken_filter")
+            fresh = [u for u in fresh if u not in known_taken]
+
+        checked_count = len(known_taken)
+        free_count = 0
+        found_free = []
+
+        # 🤖 Сначала проверяем кандидатов, которые по модели скорее свободны
+        fresh = availability_model.rank(fresh)
+        chunk_size = config.CHECK_CHUNK_SIZE if config.CHECK_CHUNK_SIZE > 0 and availability_model.is_loaded() else len(fresh)
+        taken = list(known_taken)
+
+        for i in range(0, len(fresh), max(chunk_size, 1)):
+            if len(available_usernames) >= n + surplus:
+                skipped = fresh[i:]
+                checked_usernames.difference_update(skipped)  # Не проверены — могут вернуться позже
+                for u in skipped:
+                    candidate_index.discard(u)
+                logging.info(f"🤖 Ранний выход: найдено достаточно, не проверяем {len(skipped)} кандидатов")
+                break
 
-        try:
-            usernames, category = await generate_username_list(context, style or "", n=config.GENERATED_USERNAME_COUNT)
-        except Exception as e:
-            logging.error(f"❌ Ошибка генерации username через OpenAI: {e}")
-            return []
+            try:
+                check_results = await check_multiple_usernames(fresh[i:i + chunk_size], fresh=recheck)
+            except Exception as e:
+                logging.error(f"❌ Ошибка при проверке username: {e}")
+                continue
+
+            tasks = []
+            for username, result in check_results.items():
+                if result == "Свободно" and len(available_usernames) < n + surplus:
+                    available_usernames.append(username)
+                    total_free += 1  # ✅ Учитываем количество свободных username
+                    metrics.inc("usernames_free_total")
+
+                tasks.append(
+                    save_username_to_db(username=username, status=result, category=category, context=context, style=style, llm=llm)
+                )
+
+            if tasks:
+                try:
+                    await asyncio.gather(*tasks)
+                    total_saved += len(tasks)  # 🗄️ Учитываем количество добавленных в БД
+                    metrics.inc("usernames_saved_total", len(tasks))
+                except Exception as e:
+                    logging.error(f"❌ Ошибка при записи в БД: {e}")
+
+            taken += [u for u, result in check_results.items() if result in MUTABLE_STATUSES]
+            found_free += [u for u, result in check_results.items() if result == "Свободно"]
+            checked_count += len(check_results)
+            free_count += sum(result == "Свободно" for result in check_results.values())
+
+        history_pool.add(category, style, found_free)
+
+        if learn:
+            gen_controller.record_checks(category, style, checked=checked_count, free=free_count)
+
+        return taken
+
+    async def check_history():
+        """Перепроверяет свободные ранее имена той же категории и стиля (один раз на категорию)."""
+        nonlocal total_history
+        if config.HISTORY_CANDIDATES <= 0 or not history_pool.is_known_category(category) or category in history_categories:
+            return
+        history_categories.add(category)
+        names = history_pool.candidates(category, style, config.HISTORY_CANDIDATES, skip=checked_usernames)
+        if names:
+            logging.info(f"🗂️ Имена из истории категории '{category}' ({len(names)}): {', '.join(names)}")
+            total_history += len(names)
+            metrics.inc("cache_hits_total", len(names), cache="history")
+            history_pool.forget(await check_round(names, "history", recheck=True))
+
+    async def process_batch(usernames: list[str], batch_category: str, llm: str) -> str | None:
+        """
+        Обрабатывает ответ одной попытки AI: проверка, мутации занятых, локальные кандидаты.
+        `llm` — эндпоинт, который дал ответ (пишется в историю вместе с результатами проверки).
+        Возвращает "rejected" при этическом отказе, "stop" — если AI упорно не даёт имён.
+        """
+        nonlocal category, empty_responses, total_generated, total_mutations, total_local
+        category = batch_category
 
         # Проверка на этический отказ
         if is_rejection_response(usernames):
             logging.warning("❌ AI вернул текст отказа по этическим соображениям.")
-            return []
+            return "rejected"
 
         # Если AI не вернул username
         if not usernames:
@@ -141,54 +357,145 @@ async def gen_process_and_check(bot: Bot, context: str, style: str | None, n: in
 
             if empty_responses >= config.MAX_EMPTY_RESPONSES:
                 logging.error("❌ AI отказывается генерировать username. Останавливаем процесс.")
-                break
+                return "stop"
 
-            continue
+            return None
 
         total_generated += len(usernames)  # 📦 Учитываем общее количество сгенерированных username
+        metrics.inc("usernames_generated_total", len(usernames))
+        llm_suggestions.extend(u for u in usernames if u not in llm_suggestions)
 
-        valid_usernames = [u for u in usernames if u not in checked_usernames and is_valid_username(u)]
-        checked_usernames.update(valid_usernames)
+        taken = await check_round(usernames, llm, learn=True)
 
-        if not valid_usernames:
-            continue
+        if len(available_usernames) >= n:
+            return None
 
-        try:
-            check_results = await check_multiple_usernames(valid_usernames)
-        except Exception as e:
-            logging.error(f"❌ Ошибка при проверке username: {e}")
-            continue
-
-        tasks = []
-        for username, result in check_results.items():
-            if result == "Свободно" and len(available_usernames) < n:
-                available_usernames.add(username)
-                total_free += 1  # ✅ Учитываем количество свободных username
-
-            tasks.append(
-                save_username_to_db(username=username, status=result, category=category, context=context, style=style, llm=config.MODEL_NAME)
+        # 🗂️ AI назвал категорию — до следующего вызова пробуем свободные ранее имена этой категории
+        await check_history()
+
+        if len(available_usernames) >= n:
+            return None
+
+        # 🧬 Хорошие, но занятые имена AI превращаем в близкие варианты и проверяем в той же попытке
+        if taken and config.MUTATIONS_PER_ATTEMPT > 0:
+            mutations = expand_taken(taken, config.MUTATIONS_PER_ATTEMPT, skip=checked_usernames)
+            if mutations:
+                logging.info(f"🧬 Мутации занятых имён ({len(mutations)}): {', '.join(mutations)}")
+                total_mutations += len(mutations)
+                await check_round(mutations, "mutation", dedupe=False)
+
+        if len(available_usernames) >= n:
+            return None
+
+        # 🧩 Не хватило — добираем дешёвыми локальными кандидатами до следующего вызова AI
+        if config.LOCAL_CANDIDATES_PER_ROUND > 0:
+            # Запас x3: часть кандидатов схлопнется с уже проверенными почти-дубликатами
+            local = [c for c in local_candidates(context, category, llm_suggestions, config.LOCAL_CANDIDATES_PER_ROUND * 3,
+                                                 skip=checked_usernames)
+                     if candidate_index.find_duplicate(c) is None][:config.LOCAL_CANDIDATES_PER_ROUND]
+            if local:
+                logging.info(f"🧩 Локальные кандидаты ({len(local)}): {', '.join(local)}")
+                total_local += len(local)
+                await check_round(local, "local_combinator")
+
+        return None
+
+    async def generate_attempt(attempt: int, variant: int) -> tuple[list[str], str, str]:
+        """Одна попытка AI. Параллельные попытки волны различаются температурой и подсказкой."""
+        async with _generation_slots:
+            logging.info(f"🔄 Попытка {attempt}/{config.GEN_ATTEMPTS}")
+            metrics.inc("generation_attempts_total")
+
+            # 🎛️ Размер пакета и лимит токенов — по статистике свободных имён для этой категории/стиля
+            batch_size, max_tokens = gen_controller.plan(
+                category if category != "Неизвестно" else None, style, needed=n - len(available_usernames)
             )
+            temperature = min(config.TEMPERATURE_NAME + variant * config.FANOUT_TEMPERATURE_STEP, config.FANOUT_MAX_TEMPERATURE)
+            hint = FANOUT_HINTS[variant % len(FANOUT_HINTS)]
 
-        if tasks:
+            metrics.add_gauge("generations_in_progress", 1)
             try:
-                await asyncio.gather(*tasks)
-                total_saved += len(tasks)  # 🗄️ Учитываем количество добавленных в БД
-            except Exception as e:
-                logging.error(f"❌ Ошибка при записи в БД: {e}")
+                return await generate_username_list(context, style or "", n=batch_size, max_tokens=max_tokens,
+                                                    temperature=temperature, hint=hint)
+            finally:
+                metrics.add_gauge("generations_in_progress", -1)
+
+    # ♻️ Похожую идею уже генерировали — сначала перепроверяем найденные тогда свободные имена
+    if config.CONTEXT_CACHE_CANDIDATES > 0:
+        cached, cached_category = context_cache.candidates(context, style, config.CONTEXT_CACHE_CANDIDATES,
+                                                           skip=checked_usernames)
+        if cached:
+            logging.info(f"♻️ Имена из похожих тем ({len(cached)}): {', '.join(cached)}")
+            category = cached_category or category
+            total_cached += len(cached)
+            metrics.inc("cache_hits_total", len(cached), cache="context")
+            context_cache.forget(await check_round(cached, "context_cache", recheck=True))
+
+    # 🗂️ Категория известна по похожим темам — сразу добираем из истории этой категории
+    if len(available_usernames) < n:
+        await check_history()
 
-        if len(available_usernames) >= n:
+    while len(available_usernames) < n and attempts < config.GEN_ATTEMPTS:
+        # 🚀 Волна из GEN_FANOUT параллельных попыток: ответы обрабатываем по мере прихода,
+        # остальные отменяем, как только свободных имён достаточно
+        wave_size = min(max(config.GEN_FANOUT, 1), config.GEN_ATTEMPTS - attempts)
+        wave = [asyncio.create_task(generate_attempt(attempts + i + 1, i)) for i in range(wave_size)]
+        attempts += wave_size
+
+        failures = 0
+        outcome = None
+        try:
+            for next_done in asyncio.as_completed(wave):
+                try:
+                    usernames, batch_category, batch_llm = await next_done
+                except Exception as e:
+                    logging.error(f"❌ Ошибка генерации username через OpenAI: {e}")
+                    metrics.inc("errors_total", component="generation")
+                    failures += 1
+                    continue
+
+                outcome = await process_batch(usernames, batch_category, batch_llm)
+                if outcome or len(available_usernames) >= n:
+                    break
+        finally:
+            pending = [task for task in wave if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                logging.info(f"🚀 Отменено лишних параллельных попыток: {len(pending)}")
+
+        if outcome == "rejected":
+            return [], category
+
+        if failures == wave_size:
+            if not available_usernames:
+                return [], category
+            break  # AI недоступен, но уже найденные имена (кеш, история) отдаём как обычно
+
+        if outcome == "stop":
             break
 
+    context_cache.remember(context, style, category, available_usernames)
+
     duration = (datetime.now() - start_time).total_seconds()  # ⏱️ Общее время генерации
+    metrics.observe("generation_seconds", duration)
+    tracing.set_attribute("attempts", attempts)
+    tracing.set_attribute("found", len(available_usernames))
 
     # 📊 Итоговый лог
     logging.info(
         f"📊 Итог генерации: {attempts} попыток, "
         f"{total_generated} сгенерировано, "
+        f"{total_cached} из похожих тем, "
+        f"{total_history} из истории, "
+        f"{total_local} локальных, "
+        f"{total_mutations} мутаций, "
+        f"{total_duplicates} дубликатов, "
         f"{total_free} свободных, "
         f"{total_saved} добавлено в БД, "
-        f"{len(available_usernames)} отправлено пользователю. "
+        f"{min(len(available_usernames), n)} отправлено пользователю, "
+        f"{max(len(available_usernames) - n, 0)} в запас. "
         f"⏱️ {duration:.2f} сек."
     )
 
-    return list(available_usernames)
+    return available_usernames, category
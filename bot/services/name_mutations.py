@@ -0,0 +1,80 @@
+import re
+from typing import Iterable
+
+from services.name_check import is_valid_username
+from services.name_combinator import round_robin, split_morphemes
+
+
+# Мутации занятого username в близкие варианты. Порядок списков = ранг:
+# сначала то, что сильнее всего сохраняет исходное имя.
+
+SUFFIXES = ["hq", "app", "_lab", "lab", "_hq", "io", "_app", "club", "team"]
+VOWELS = "aeiouy"
+
+
+def _pluralize(name: str) -> list[str]:
+    if name.endswith("s"):
+        return [name[:-1]]
+    if name.endswith("y") and len(name) > 1 and name[-2] not in VOWELS:
+        return [f"{name[:-1]}ies"]
+    return [f"{name}s"]
+
+
+def _drop_vowels(name: str) -> list[str]:
+    variants = []
+    # «flicker» -> «flickr»: выкидываем последнюю гласную перед финальной согласной
+    match = re.search(rf"[{VOWELS}](?=[^{VOWELS}_\d]$)", name)
+    if match:
+        variants.append(name[:match.start()] + name[match.end():])
+    # Все гласные, кроме первой буквы
+    stripped = name[0] + re.sub(rf"[{VOWELS}]", "", name[1:])
+    if stripped != name:
+        variants.append(stripped)
+    return variants
+
+
+def _change_separators(name: str) -> list[str]:
+    if "_" in name:
+        return [name.replace("_", "")]
+    parts = split_morphemes(name)
+    if len(parts) > 1 and "".join(parts) == name.lower():
+        return ["_".join(parts)]
+    return []
+
+
+def mutate(username: str) -> list[str]:
+    """Возвращает варианты занятого username, отсортированные по близости к оригиналу."""
+    base = username.lower()
+    candidates = []
+    candidates += _change_separators(username)
+    candidates += [f"{base}{suffix}" for suffix in SUFFIXES[:2]]
+    candidates += _pluralize(base)
+    candidates += [f"{base}{suffix}" for suffix in SUFFIXES[2:]]
+    candidates += _drop_vowels(base)
+
+    result = []
+    seen = {base}
+    for candidate in candidates:
+        key = candidate.lower()
+        if key not in seen and is_valid_username(candidate):
+            seen.add(key)
+            result.append(candidate)
+    return result
+
+
+def expand_taken(usernames: Iterable[str], limit: int, skip: set[str] | None = None) -> list[str]:
+    """
+    Превращает список занятых username в `limit` лучших мутаций.
+    Берёт варианты по очереди от каждого имени, чтобы не зациклиться на одном.
+    """
+    skip = {u.lower() for u in (skip or ())}
+    result = []
+    for candidate in round_robin(*(mutate(u) for u in usernames)):
+        key = candidate.lower()
+        if key in skip:
+            continue
+        skip.add(key)
+        result.append(candidate)
+        if len(result) >= limit:
+            break
+    return result
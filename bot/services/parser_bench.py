@@ -0,0 +1,90 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import timeit
+
+from services.brand_ask_ai import parse_ai_response, parse_ai_response_legacy
+
+
+# Сверка и микробенчмарк парсера ответов AI: новый однопроходный parse_ai_response
+# против прежнего parse_ai_response_legacy.
+#
+#   python -m services.parser_bench                 # встроенный корпус
+#   python -m services.parser_bench --log bot.log   # + записанные ответы из лога бота
+
+CORPUS_FILE = os.path.join(os.path.dirname(__file__), "parser_corpus.json")
+
+# Начало записи лога (LOG_FORMAT: "%(asctime)s - %(levelname)s - %(message)s")
+LOG_RECORD = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3} - \w+ - ")
+RAW_RESPONSE_MARKER = "Сырой ответ от AI: "
+
+
+def load_corpus() -> list[str]:
+    with open(CORPUS_FILE, encoding="utf-8") as f:
+        return json.load(f)["responses"]
+
+
+def load_log_responses(path: str) -> list[str]:
+    """Достаёт из лога многострочные записи «Сырой ответ от AI: ...»."""
+    responses, current = [], None
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if LOG_RECORD.match(line):
+                if current is not None:
+                    responses.append("".join(current).rstrip("\n"))
+                current = None
+                _, _, message = line.partition(" - ")[2].partition(" - ")
+                if message.startswith(RAW_RESPONSE_MARKER):
+                    current = [message[len(RAW_RESPONSE_MARKER):]]
+            elif current is not None:
+                current.append(line)
+    if current is not None:
+        responses.append("".join(current).rstrip("\n"))
+    return [r for r in responses if r.strip()]
+
+
+def compare(responses: list[str]) -> list[int]:
+    """Индексы ответов, на которых новый парсер расходится с прежним."""
+    return [i for i, r in enumerate(responses) if parse_ai_response(r) != parse_ai_response_legacy(r)]
+
+
+def benchmark(parser, responses: list[str], repeat: int) -> float:
+    """Пропускная способность: ответов в секунду (лучший из 5 прогонов)."""
+    best = min(timeit.repeat(lambda: [parser(r) for r in responses], number=repeat, repeat=5))
+    return len(responses) * repeat / best
+
+
+def main(args) -> int:
+    responses = load_corpus()
+    print(f"Корпус: {len(responses)} ответов ({CORPUS_FILE})")
+    if args.log:
+        recorded = load_log_responses(args.log)
+        print(f"Из лога {args.log}: {len(recorded)} ответов")
+        responses += recorded
+
+    logging.disable(logging.CRITICAL)  # Парсеры логируют ошибки — в замер это не входит
+
+    mismatches = compare(responses)
+    if mismatches:
+        print(f"❌ Расхождения с прежним парсером: {len(mismatches)}")
+        for i in mismatches[:5]:
+            print(f"--- #{i}\n{responses[i]!r}\nновый:   {parse_ai_response(responses[i])}\n"
+                  f"прежний: {parse_ai_response_legacy(responses[i])}")
+    else:
+        print("✅ Результаты идентичны на всём корпусе")
+
+    legacy = benchmark(parse_ai_response_legacy, responses, args.repeat)
+    current = benchmark(parse_ai_response, responses, args.repeat)
+    print(f"Прежний парсер: {legacy:,.0f} ответов/с")
+    print(f"Новый парсер:   {current:,.0f} ответов/с (x{current / legacy:.2f})")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сверка и бенчмарк парсера ответов AI")
+    parser.add_argument("--log", help="лог бота с записями «Сырой ответ от AI»")
+    parser.add_argument("--repeat", type=int, default=200, help="прогонов корпуса на замер")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,74 @@
+import logging
+import secrets
+from collections import OrderedDict
+
+from database.database import fetch_project_profile, fetch_user_profiles, save_project_profile
+from services import metrics
+
+import config
+
+
+# Готовые профили проектов: Postgres (project_profiles) + LRU-кеш в памяти.
+# Профиль собирается через LLM один раз; ссылки /start p_<id>, пересылка в группу
+# и «Мои проекты» отдают сохранённый текст без повторной генерации.
+
+DEEP_LINK_PREFIX = "p_"
+
+_cache: OrderedDict[str, dict] = OrderedDict()
+
+
+def _remember(profile: dict):
+    _cache[profile["id"]] = profile
+    _cache.move_to_end(profile["id"])
+    while len(_cache) > config.PROFILE_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def new_profile_id() -> str:
+    """Короткий ID для ссылки: 8 символов [A-Za-z0-9_-]."""
+    return secrets.token_urlsafe(6)
+
+
+async def save_profile(user_id: int, username: str, context: str | None, profile_text: str, parts: dict) -> str:
+    """
+    Сохраняет профиль и возвращает его ID. Профиль сразу доступен из кеша,
+    даже если запись в БД не удалась (тогда он живёт до перезапуска бота).
+    """
+    profile = {
+        "id": new_profile_id(),
+        "user_id": user_id,
+        "username": username,
+        "context": context,
+        "profile_text": profile_text,
+        "profile": parts,
+    }
+    _remember(profile)
+    if not await save_project_profile(profile["id"], user_id, username, context, profile_text, parts):
+        logging.warning(f"⚠️ Профиль {profile['id']} сохранён только в памяти")
+    return profile["id"]
+
+
+async def get_profile(profile_id: str) -> dict | None:
+    profile = _cache.get(profile_id)
+    if profile is not None:
+        _cache.move_to_end(profile_id)
+        metrics.inc("cache_hits_total", cache="profile")
+        return profile
+
+    profile = await fetch_project_profile(profile_id)
+    if profile is not None:
+        _remember(profile)
+    return profile
+
+
+async def list_user_profiles(user_id: int) -> list[dict]:
+    return await fetch_user_profiles(user_id, config.MY_PROJECTS_LIMIT)
+
+
+def deep_link(bot_username: str, profile_id: str) -> str:
+    return f"https://t.me/{bot_username}?start={DEEP_LINK_PREFIX}{profile_id}"
+
+
+def parse_deep_link(args: str) -> str | None:
+    """ID профиля из аргумента /start (p_<id>) или None, если это не ссылка на проект."""
+    return args[len(DEEP_LINK_PREFIX):] if args.startswith(DEEP_LINK_PREFIX) else None
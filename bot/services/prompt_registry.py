@@ -0,0 +1,55 @@
+import logging
+import os
+import re
+
+
+# Реестр шаблонов промптов: bot/prompts/<имя>.txt, подстановки — str.format.
+# Шаблоны читаются один раз (при старте бота), при загрузке из них убираются отступы
+# и лишние пустые строки — они тоже уходят в токены.
+# system.txt — общий стабильный префикс (системное сообщение) для всех запросов по проекту:
+# одинаковое начало запроса провайдер может кешировать.
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "prompts")
+SYSTEM_PROMPT = "system"
+
+_templates: dict[str, str] = {}
+
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def compact(text: str) -> str:
+    """Убирает отступы и пробелы в концах строк, схлопывает подряд идущие пустые строки."""
+    text = "\n".join(line.strip() for line in text.strip().splitlines())
+    return _BLANK_LINES.sub("\n\n", text)
+
+
+def load_templates():
+    """Загружает все *.txt из bot/prompts."""
+    _templates.clear()
+    raw_size = 0
+    for filename in sorted(os.listdir(PROMPTS_DIR)):
+        name, ext = os.path.splitext(filename)
+        if ext != ".txt":
+            continue
+        with open(os.path.join(PROMPTS_DIR, filename), encoding="utf-8") as f:
+            raw = f.read()
+        raw_size += len(raw)
+        _templates[name] = compact(raw)
+
+    size = sum(len(t) for t in _templates.values())
+    logging.info(f"📚 Загружено шаблонов промптов: {len(_templates)} ({size} символов, до сжатия {raw_size})")
+
+
+def render(name: str, **params) -> str:
+    """Подставляет параметры в шаблон. Многострочные параметры тоже сжимаются."""
+    if not _templates:
+        load_templates()
+    params = {key: compact(value) if isinstance(value, str) and "\n" in value else value
+              for key, value in params.items()}
+    return _templates[name].format(**params)
+
+
+def system_prompt() -> str:
+    if not _templates:
+        load_templates()
+    return _templates[SYSTEM_PROMPT]
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram.fsm.context import FSMContext
+
+from services import lifecycle, metrics
+
+
+# Буфер излишков генерации хранится прямо в FSM-данных пользователя:
+#   <buffer_key>        — список готовых элементов (username или варианты этапа)
+#   <buffer_key>_scope  — для каких входных данных буфер собран (контекст, стиль, выборы)
+# Если входные данные изменились, буфер считается устаревшим и не используется.
+
+# Активные фоновые задачи дозаполнения: (ключ сессии, имя буфера) -> Task
+_refill_tasks: dict[tuple, asyncio.Task] = {}
+
+metrics.register_collector(lambda: [("buffer_refills_running", {}, len(_refill_tasks))])
+
+
+def _scope_key(buffer_key: str) -> str:
+    return f"{buffer_key}_scope"
+
+
+async def set_buffer(state: FSMContext, buffer_key: str, items: list, scope: str):
+    """Записывает в сессию новый буфер для указанного scope."""
+    await state.update_data({buffer_key: list(items), _scope_key(buffer_key): scope})
+    logging.info(f"📦 Буфер '{buffer_key}': {len(items)} элементов в запасе")
+
+
+async def take_from_buffer(state: FSMContext, buffer_key: str, count: int, scope: str) -> list | None:
+    """
+    Забирает `count` элементов из буфера сессии.
+    Если элементов не хватает, но буфер прямо сейчас дозаполняется — дожидается дозаполнения.
+    Возвращает None, если буфер устарел или пуст (нужна полная генерация).
+    """
+    data = await state.get_data()
+    if data.get(_scope_key(buffer_key)) != scope:
+        return None
+
+    buffer = data.get(buffer_key) or []
+    task = _refill_tasks.get((state.key, buffer_key))
+
+    if len(buffer) < count and task and not task.done():
+        logging.info(f"⏳ Буфер '{buffer_key}' пуст, ждём фоновое дозаполнение...")
+        try:
+            await asyncio.shield(task)
+        except Exception as e:
+            logging.error(f"❌ Ошибка фонового дозаполнения буфера '{buffer_key}': {e}")
+        data = await state.get_data()
+        if data.get(_scope_key(buffer_key)) != scope:
+            return None
+        buffer = data.get(buffer_key) or []
+
+    if len(buffer) < count:
+        return None
+
+    await state.update_data({buffer_key: buffer[count:]})
+    metrics.inc("cache_hits_total", cache="session_buffer")
+    logging.info(f"⚡ Выдано {count} элементов из буфера '{buffer_key}', осталось {len(buffer) - count}")
+    return buffer[:count]
+
+
+async def refill_if_low(
+    state: FSMContext,
+    buffer_key: str,
+    scope: str,
+    producer: Callable[[dict], Awaitable[list]],
+    threshold: int,
+    timeout: float | None = None,
+    dedup_key: Callable[[Any], Any] = lambda item: item,
+):
+    """
+    Запускает фоновое дозаполнение буфера, если в нём осталось меньше `threshold` элементов.
+    `producer` получает текущие FSM-данные и возвращает новые элементы.
+    """
+    data = await state.get_data()
+    if data.get(_scope_key(buffer_key)) != scope:
+        return
+    if len(data.get(buffer_key) or []) >= threshold:
+        return
+
+    task_key = (state.key, buffer_key)
+    running = _refill_tasks.get(task_key)
+    if running and not running.done():
+        return
+
+    task = lifecycle.track(asyncio.create_task(_refill(state, buffer_key, scope, producer, data, timeout, dedup_key)))
+    _refill_tasks[task_key] = task
+    task.add_done_callback(lambda _: _refill_tasks.pop(task_key, None))
+
+
+async def _refill(state: FSMContext, buffer_key: str, scope: str, producer, data: dict, timeout, dedup_key):
+    logging.info(f"🔄 Фоновое дозаполнение буфера '{buffer_key}'...")
+    try:
+        items = await asyncio.wait_for(producer(data), timeout=timeout)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logging.error(f"❌ Не удалось дозаполнить буфер '{buffer_key}': {e}")
+        return
+
+    # Пока шла генерация, пользователь мог сменить тему или этап
+    data = await state.get_data()
+    if data.get(_scope_key(buffer_key)) != scope:
+        logging.info(f"⚠️ Буфер '{buffer_key}' устарел за время генерации, результат отброшен.")
+        return
+
+    buffer = data.get(buffer_key) or []
+    seen = {dedup_key(item) for item in buffer}
+    added = []
+    for item in items:
+        key = dedup_key(item)
+        if key not in seen:
+            seen.add(key)
+            added.append(item)
+
+    await state.update_data({buffer_key: buffer + added})
+    logging.info(f"✅ Буфер '{buffer_key}' дозаполнен: +{len(added)}, всего {len(buffer) + len(added)}")
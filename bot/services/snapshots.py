@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Callable
+
+from services.data_dir import load_json, save_json
+
+import config
+
+
+# Снимок состояния в памяти (кеши, пулы, сессии) в одном файле в DATA_DIR.
+# Каждый модуль регистрирует свою секцию: dump() -> JSON-совместимые данные, restore(data).
+# Файл читается один раз при старте; секция восстанавливается, как только зарегистрирована
+# (модули, импортированные позже, получают своё состояние при регистрации).
+# Снимок пишется периодически (SNAPSHOT_INTERVAL) и при остановке бота.
+
+SNAPSHOT_FILE = "snapshot.json"
+VERSION = 1
+
+_sections: dict[str, tuple[Callable[[], Any], Callable[[Any], None]]] = {}
+_pending: dict[str, Any] = {}  # Прочитанные, но ещё не восстановленные секции
+_restored: set[str] = set()
+_legacy: dict[str, str] = {}   # Секция -> старый отдельный файл (до общего снимка)
+_loaded = False
+_saver_task: asyncio.Task | None = None
+
+
+def register(name: str, dump: Callable[[], Any], restore: Callable[[Any], None], legacy_file: str | None = None):
+    """Регистрирует секцию снимка. Если снимок уже прочитан — сразу восстанавливает её."""
+    _sections[name] = (dump, restore)
+    if legacy_file:
+        _legacy[name] = legacy_file
+    if _loaded:
+        _restore(name)
+
+
+def is_restored(name: str) -> bool:
+    return name in _restored
+
+
+def _restore(name: str):
+    if name in _pending:
+        data = _pending.pop(name)
+    elif name in _legacy:
+        data = load_json(_legacy[name])
+    else:
+        return
+    if data is None:
+        return
+
+    try:
+        _sections[name][1](data)
+        _restored.add(name)
+    except Exception as e:
+        logging.error(f"❌ Не удалось восстановить секцию снимка '{name}': {e}")
+
+
+async def load():
+    """Читает снимок с диска (в отдельном потоке) и восстанавливает зарегистрированные секции."""
+    global _loaded
+    if _loaded:
+        return
+    start = time.perf_counter()
+    snapshot = await asyncio.to_thread(load_json, SNAPSHOT_FILE)
+    if snapshot and snapshot.get("version") == VERSION:
+        _pending.update(snapshot.get("sections", {}))
+    _loaded = True
+
+    for name in list(_sections):
+        _restore(name)
+
+    age = f", возраст {time.time() - snapshot['saved_at']:.0f} сек." if snapshot and "saved_at" in snapshot else ""
+    logging.info(f"💾 Снимок состояния загружен за {time.perf_counter() - start:.2f} сек.: "
+                 f"{', '.join(sorted(_restored)) or 'пусто'}{age}")
+
+
+def collect() -> dict:
+    """Собирает снимок всех секций. Не восстановленные секции переносятся из старого снимка как есть."""
+    sections = dict(_pending)
+    for name, (dump, _) in _sections.items():
+        try:
+            sections[name] = dump()
+        except Exception as e:
+            logging.error(f"❌ Не удалось сохранить секцию снимка '{name}': {e}")
+    return {"version": VERSION, "saved_at": time.time(), "sections": sections}
+
+
+def save():
+    """Синхронно записывает снимок (используется при остановке)."""
+    if _loaded:
+        save_json(SNAPSHOT_FILE, collect())
+
+
+async def _saver_loop():
+    while True:
+        await asyncio.sleep(config.SNAPSHOT_INTERVAL)
+        snapshot = collect()  # Собираем в цикле событий, чтобы данные были согласованы
+        await asyncio.to_thread(save_json, SNAPSHOT_FILE, snapshot)
+        logging.info(f"💾 Снимок состояния сохранён: {len(snapshot['sections'])} секций")
+
+
+def start():
+    """Запускает периодическое сохранение снимка."""
+    global _saver_task
+    if config.SNAPSHOT_INTERVAL > 0 and not (_saver_task and not _saver_task.done()):
+        _saver_task = asyncio.create_task(_saver_loop())
+
+
+async def stop():
+    """Останавливает периодическое сохранение и пишет финальный снимок."""
+    global _saver_task
+    if _saver_task:
+        _saver_task.cancel()
+        try:
+            await _saver_task
+        except asyncio.CancelledError:
+            pass
+        _saver_task = None
+    save()
+    logging.info("💾 Финальный снимок состояния сохранён.")
+
+
+def register_fsm(storage):
+    """Секция для FSM-сессий MemoryStorage: пользователь продолжает диалог после перезапуска."""
+    from aiogram.fsm.storage.base import StorageKey
+
+    def dump():
+        records = []
+        for key, record in storage.storage.items():
+            if record.state is None and not record.data:
+                continue
+            entry = {"key": vars(key), "state": record.state, "data": record.data}
+            try:
+                json.dumps(entry, ensure_ascii=False)
+            except (TypeError, ValueError):
+                continue  # Несериализуемые данные сессии не сохраняем
+            records.append(entry)
+        return records
+
+    def restore(records):
+        for entry in records:
+            record = storage.storage[StorageKey(**entry["key"])]
+            record.state, record.data = entry["state"], entry["data"]
+
+    register("fsm", dump, restore)
@@ -0,0 +1,129 @@
+import json
+import logging
+import re
+from collections import defaultdict
+
+from services import metrics
+
+import config
+
+
+# Структурированный (JSON) формат ответов AI вместо разбора свободного текста регулярками.
+# Схема — словарь «поле -> тип»; список из одного элемента означает «массив таких элементов».
+SCHEMAS = {
+    "stages": {"comment": str, "options": [{"title": str, "description": str}]},
+    "profile_summary": {"tagline": str, "description": str},
+    "profile_references": {"references": [{"title": str, "description": str}]},
+    "names": {"category": str, "usernames": [str]},
+}
+
+INSTRUCTIONS = {
+    "stages": (
+        'Вместо текстового формата выше верни ТОЛЬКО JSON без пояснений и markdown:\n'
+        '{"comment": "комментарий и вопрос-подводка", '
+        '"options": [{"title": "эмодзи и краткое название", "description": "описание"}]}'
+    ),
+    "profile_summary": (
+        'Вместо текстового формата выше верни ТОЛЬКО JSON без пояснений и markdown:\n'
+        '{"tagline": "тэглайн", "description": "описание проекта"}'
+    ),
+    "profile_references": (
+        'Вместо текстового формата выше верни ТОЛЬКО JSON без пояснений и markdown:\n'
+        '{"references": [{"title": "название проекта", "description": "суть и цель проекта"}]}'
+    ),
+    "names": (
+        'Вместо текстового формата выше верни ТОЛЬКО JSON без пояснений и markdown:\n'
+        '{"category": "категория темы", "usernames": ["username1", "username2"]}'
+    ),
+}
+
+# Для provider-side JSON mode (если эндпоинт поддерживает response_format)
+RESPONSE_FORMAT = {"type": "json_object"}
+
+# схема -> счётчики: ok (с первого раза), repaired (после повторного запроса),
+# fallback (разобрал старый парсер), failed (не разобрано совсем)
+parse_stats: dict[str, dict[str, int]] = defaultdict(lambda: {"ok": 0, "repaired": 0, "fallback": 0, "failed": 0})
+
+
+metrics.register_collector(lambda: (
+    ("structured_parse_total", {"schema": schema, "outcome": outcome}, value)
+    for schema, stats in parse_stats.items() for outcome, value in stats.items()
+))
+
+
+def is_enabled(schema: str) -> bool:
+    """Схемы профиля (profile_summary, profile_references) включаются задачей profile."""
+    return schema.split("_")[0] in config.STRUCTURED_OUTPUT_TASKS
+
+
+def response_format() -> dict | None:
+    return RESPONSE_FORMAT if config.JSON_RESPONSE_FORMAT else None
+
+
+def with_instructions(prompt: str, schema: str) -> str:
+    return f"{prompt.rstrip()}\n\n{INSTRUCTIONS[schema]}"
+
+
+def extract_json(text: str) -> str:
+    """Вырезает JSON-объект из ответа: без ```json-обёртки и текста вокруг."""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    start, end = text.find("{"), text.rfind("}")
+    return text[start:end + 1] if start != -1 and end > start else text
+
+
+def validate(value, schema, path: str = "$") -> list[str]:
+    """Проверяет значение по схеме, возвращает список ошибок (пустой — всё в порядке)."""
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            return [f"{path}: ожидался объект"]
+        errors = []
+        for key, subschema in schema.items():
+            if key not in value:
+                errors.append(f"{path}.{key}: поле отсутствует")
+            else:
+                errors += validate(value[key], subschema, f"{path}.{key}")
+        return errors
+    if isinstance(schema, list):
+        if not isinstance(value, list):
+            return [f"{path}: ожидался массив"]
+        if not value:
+            return [f"{path}: пустой массив"]
+        return [error for i, item in enumerate(value) for error in validate(item, schema[0], f"{path}[{i}]")]
+    if not isinstance(value, schema):
+        return [f"{path}: ожидался {schema.__name__}"]
+    return []
+
+
+def parse(text: str, schema: str) -> tuple[dict | None, list[str]]:
+    """Разбирает ответ по схеме. Возвращает (данные, []) или (None, ошибки)."""
+    try:
+        data = json.loads(extract_json(text or ""))
+    except json.JSONDecodeError as e:
+        return None, [f"некорректный JSON: {e.msg} (позиция {e.pos})"]
+    errors = validate(data, SCHEMAS[schema])
+    return (data, []) if not errors else (None, errors)
+
+
+def repair_prompt(text: str, schema: str, errors: list[str]) -> str:
+    """Запрос на исправление ответа, не прошедшего проверку схемы."""
+    return (
+        "Твой предыдущий ответ не соответствует требуемому JSON-формату.\n"
+        f"Ошибки: {'; '.join(errors[:5])}\n"
+        f"Предыдущий ответ:\n{text}\n\n"
+        f"Исправь его, сохранив содержание. {INSTRUCTIONS[schema]}"
+    )
+
+
+def salvage_usernames(text: str) -> list[str]:
+    """Достаёт username из недописанного JSON (ответ оборван по max_tokens)."""
+    tail = text.split('"usernames"', 1)[-1]
+    return re.findall(r'"([A-Za-z][A-Za-z0-9_]{3,31})"\s*(?=[,\]])', tail)
+
+
+def record(schema: str, outcome: str):
+    stats = parse_stats[schema]
+    stats[outcome] += 1
+    total = sum(stats.values())
+    failures = stats["fallback"] + stats["failed"]
+    log = logging.info if outcome in ("ok", "repaired") else logging.warning
+    log(f"🧾 JSON [{schema}]: {outcome}; доля неразобранных {failures}/{total} ({failures / total:.0%})")
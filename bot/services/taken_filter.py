@@ -0,0 +1,152 @@
+import base64
+import hashlib
+import logging
+import math
+import time
+import zlib
+
+from database.database import fetch_usernames_by_status
+from services import snapshots
+
+import config
+
+
+# Статусы Fragment, при которых username нельзя занять прямо сейчас
+TAKEN_STATUSES = ["Занято", "Продано", "Доступно для покупки"]
+
+
+class BloomFilter:
+    """
+    Компактный Bloom-фильтр: «точно нет» или «скорее всего да» (с вероятностью ошибки error_rate).
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str) -> bool:
+        """Добавляет элемент. Возвращает True, если его (скорее всего) ещё не было."""
+        added = False
+        for pos in self._positions(item):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos // 8] & (1 << (pos % 8)) for pos in self._positions(item))
+
+    def to_dict(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "count": self.count,
+            "bits": base64.b64encode(zlib.compress(bytes(self.bits))).decode(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BloomFilter":
+        bloom = cls(data["capacity"], data["error_rate"])
+        bits = zlib.decompress(base64.b64decode(data["bits"]))
+        if len(bits) != len(bloom.bits):
+            raise ValueError("размер снимка не совпадает с параметрами фильтра")
+        bloom.bits = bytearray(bits)
+        bloom.count = data["count"]
+        return bloom
+
+
+# Из Bloom-фильтра нельзя удалить имя, а занятое имя могут освободить или продать на Fragment.
+# Поэтому фильтр из двух поколений: новые имена пишутся в текущее, проверяются оба. Каждые
+# TAKEN_FILTER_DAYS / 2 дней предыдущее поколение выбрасывается, а текущее становится предыдущим.
+# Имя, которое больше не встречалось занятым, забывается за TAKEN_FILTER_DAYS / 2..TAKEN_FILTER_DAYS дней
+# и снова проверяется на Fragment. При старте фильтр досыпается из БД за последние TAKEN_FILTER_DAYS дней.
+
+def _new_filter() -> BloomFilter:
+    return BloomFilter(config.TAKEN_FILTER_CAPACITY, config.TAKEN_FILTER_ERROR_RATE)
+
+
+_current = _new_filter()
+_previous = _new_filter()
+_rotated_at = time.time()
+
+
+def _key(username: str) -> str:
+    # Telegram не различает регистр в username
+    return username.lower()
+
+
+def _rotate_if_due():
+    """Сменяет поколения фильтра, если прошло TAKEN_FILTER_DAYS / 2 дней."""
+    global _current, _previous, _rotated_at
+    period = config.TAKEN_FILTER_DAYS * 86400 / 2
+    elapsed = time.time() - _rotated_at
+    if elapsed < period:
+        return
+    # Если бот не работал дольше двух периодов, устарели оба поколения
+    _previous = _current if elapsed < 2 * period else _new_filter()
+    _current = _new_filter()
+    _rotated_at = time.time()
+    logging.info(f"🧮 Фильтр занятых username: новое поколение, в предыдущем {_previous.count} имён")
+
+
+def _dump() -> dict:
+    return {"rotated_at": _rotated_at, "current": _current.to_dict(), "previous": _previous.to_dict()}
+
+
+def _restore(snapshot: dict):
+    """Восстанавливает поколения фильтра из снимка, если параметры фильтра не менялись."""
+    global _current, _previous, _rotated_at
+    if "current" not in snapshot:
+        # Старый снимок без поколений помнит все имена без срока — фильтр соберётся из БД заново
+        logging.info("🧮 Снимок фильтра занятых username в старом формате — пропускаем")
+        return
+    if snapshot["current"].get("capacity") == config.TAKEN_FILTER_CAPACITY \
+            and snapshot["current"].get("error_rate") == config.TAKEN_FILTER_ERROR_RATE:
+        _current = BloomFilter.from_dict(snapshot["current"])
+        _previous = BloomFilter.from_dict(snapshot["previous"])
+        _rotated_at = snapshot["rotated_at"]
+        _rotate_if_due()
+        logging.info(f"🧮 Снимок фильтра занятых username загружен: {_current.count} + {_previous.count} имён")
+
+
+snapshots.register("taken_filter", _dump, _restore, legacy_file="taken_filter.json")
+
+
+async def init_taken_filter():
+    """
+    Досыпает в фильтр (восстановленный из снимка) занятые имена из истории в БД за TAKEN_FILTER_DAYS дней.
+    """
+    taken = await fetch_usernames_by_status(TAKEN_STATUSES, config.TAKEN_FILTER_DAYS)
+    added = sum(_current.add(_key(username)) for username in taken)
+    logging.info(f"🧮 Фильтр занятых username: {_current.count} + {_previous.count} имён (+{added} из БД)")
+
+    if _current.count > _current.capacity:
+        logging.warning("⚠️ Фильтр занятых username переполнен — точность падает. Увеличьте TAKEN_FILTER_CAPACITY.")
+
+
+def is_known_taken(username: str) -> bool:
+    """True, если username встречался занятым за последние дни (возможна ложноположительная ошибка)."""
+    _rotate_if_due()
+    key = _key(username)
+    return key in _current or key in _previous
+
+
+def add_check_results(results: dict[str, str]):
+    """Добавляет в фильтр занятые username из результатов проверки Fragment."""
+    _rotate_if_due()
+    for username, status in results.items():
+        if status in TAKEN_STATUSES:
+            _current.add(_key(username))
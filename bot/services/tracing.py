@@ -0,0 +1,211 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from services import http_client, lifecycle, metrics
+from services.data_dir import data_path
+
+import config
+
+
+# Лёгкая трассировка запросов: handle_update открывает трассу, вложенные вызовы (LLM, Fragment, БД)
+# добавляют в неё спаны. Текущий спан передаётся через contextvars — в том числе в задачи,
+# созданные через asyncio.create_task/gather, поэтому явно передавать его не нужно.
+#
+# Спаны трассы копятся в памяти до её завершения, и уже тогда решается, сохранять ли её:
+# всегда — если трасса медленная (TRACE_SLOW_SECONDS) или с ошибкой, иначе — с вероятностью
+# TRACE_SAMPLE_RATE. Сохранённая трасса в формате OTLP/JSON дописывается строкой в DATA_DIR
+# (TRACE_FILE) или отправляется POST-запросом на TRACE_COLLECTOR_URL (например, .../v1/traces).
+
+SERVICE_NAME = "prozektor-bot"
+
+_current: ContextVar[dict | None] = ContextVar("trace_span", default=None)
+
+# trace_id -> {"spans": [...], "sampled": bool, "dropped": int}
+_traces: dict[str, dict] = {}
+
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+@contextmanager
+def span(name: str, root: bool = False, **attributes):
+    """
+    Спан вокруг блока кода. Вне трассы ничего не делает (кроме root=True — тогда начинает новую).
+    Возвращает словарь спана (или None), в attributes которого можно дописать результат.
+    """
+    parent = _current.get()
+    if not config.TRACING_ENABLED or (parent is None and not root):
+        yield None
+        return
+
+    if parent is None:
+        trace_id = _new_id(16)
+        _traces[trace_id] = {"spans": [], "sampled": random.random() < config.TRACE_SAMPLE_RATE, "dropped": 0}
+    else:
+        trace_id = parent["trace_id"]
+
+    trace = _traces.get(trace_id)
+    if trace is None:
+        # Трасса уже завершена, а фоновая задача запроса ещё работает
+        yield None
+        return
+
+    current = {
+        "trace_id": trace_id,
+        "span_id": _new_id(8),
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "start": time.time_ns(),
+        "attributes": attributes,
+        "error": None,
+    }
+    token = _current.set(current)
+    try:
+        yield current
+    except asyncio.CancelledError:
+        current["attributes"]["cancelled"] = True
+        raise
+    except Exception as e:
+        current["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current["end"] = time.time_ns()
+        _current.reset(token)
+        if len(trace["spans"]) < config.TRACE_MAX_SPANS:
+            trace["spans"].append(current)
+        else:
+            trace["dropped"] += 1
+        if parent is None:
+            _finish(trace_id, current)
+
+
+def trace(name: str, **attributes):
+    """Начинает новую трассу (корневой спан)."""
+    return span(name, root=True, **attributes)
+
+
+def set_attribute(key: str, value):
+    """Дописывает атрибут в текущий спан (если трасса идёт)."""
+    current = _current.get()
+    if current is not None:
+        current["attributes"][key] = value
+
+
+def traced(name: str, *arg_names: str, result_attribute: str | None = None):
+    """
+    Декоратор асинхронной функции: спан `name` с атрибутами из аргументов `arg_names`
+    и (если задан result_attribute) с результатом вызова.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _current.get() is None:  # Вне трассы — без накладных расходов
+                return await func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            attributes = {arg: bound.arguments[arg] for arg in arg_names if arg in bound.arguments}
+            with span(name, **attributes) as current:
+                result = await func(*args, **kwargs)
+                if result_attribute and current is not None:
+                    current["attributes"][result_attribute] = result
+                return result
+
+        return wrapper
+    return decorator
+
+
+def _finish(trace_id: str, root: dict):
+    trace = _traces.pop(trace_id)
+    duration = (root["end"] - root["start"]) / 1e9
+
+    if duration >= config.TRACE_SLOW_SECONDS:
+        reason = "slow"
+    elif any(s["error"] for s in trace["spans"]):
+        reason = "error"
+    elif trace["sampled"]:
+        reason = "sampled"
+    else:
+        return
+
+    # Где ушло время: суммарная длительность спанов по имени (параллельные спаны складываются)
+    totals = defaultdict(float)
+    for s in trace["spans"]:
+        if s is not root:
+            totals[s["name"]] += (s["end"] - s["start"]) / 1e9
+    breakdown = ", ".join(f"{name} {total:.2f}" for name, total in sorted(totals.items(), key=lambda x: -x[1])[:5])
+    logging.info(f"🧵 Трасса {trace_id} ({reason}): {root['name']} {duration:.2f} сек., "
+                 f"{len(trace['spans'])} спанов{f' ({breakdown})' if breakdown else ''}")
+
+    metrics.inc("traces_exported_total", reason=reason)
+    payload = _to_otlp(trace["spans"], trace["dropped"])
+    lifecycle.track(asyncio.get_running_loop().create_task(_export(payload)))
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp(spans: list[dict], dropped: int) -> dict:
+    """Трасса в формате OTLP/JSON (как для POST /v1/traces коллектора OpenTelemetry)."""
+    otlp_spans = []
+    for s in spans:
+        otlp_span = {
+            "traceId": s["trace_id"],
+            "spanId": s["span_id"],
+            "name": s["name"],
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(s["start"]),
+            "endTimeUnixNano": str(s["end"]),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in s["attributes"].items()],
+            "status": {"code": 2, "message": s["error"]} if s["error"] else {"code": 1},
+        }
+        if s["parent_id"]:
+            otlp_span["parentSpanId"] = s["parent_id"]
+        otlp_spans.append(otlp_span)
+
+    resource = [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]
+    if dropped:
+        resource.append({"key": "trace.dropped_spans", "value": {"intValue": str(dropped)}})
+    return {"resourceSpans": [{"resource": {"attributes": resource},
+                               "scopeSpans": [{"scope": {"name": "bot.tracing"}, "spans": otlp_spans}]}]}
+
+
+def _append_to_file(line: str):
+    path = data_path(config.TRACE_FILE)
+    if os.path.exists(path) and os.path.getsize(path) > config.TRACE_FILE_MAX_MB * 1024 * 1024:
+        os.replace(path, f"{path}.1")  # Простая ротация: храним текущий и один предыдущий файл
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(line + "\n")
+
+
+async def _export(payload: dict):
+    try:
+        if config.TRACE_COLLECTOR_URL:
+            session = await http_client.get_session()
+            async with session.post(config.TRACE_COLLECTOR_URL, json=payload) as response:
+                if response.status >= 400:
+                    logging.warning(f"⚠️ Коллектор трасс ответил {response.status}")
+        else:
+            line = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+            await asyncio.to_thread(_append_to_file, line)
+    except Exception as e:
+        logging.error(f"❌ Не удалось выгрузить трассу: {e}")